@@ -1,6 +1,8 @@
 import streamlit as st
-from PIL import Image
 from shared import config as cfg
+from shared import compute_cache as cc
+from shared import session_data as sd
+from shared import lazy
 
 st.set_page_config(
         page_title="prometry",
@@ -24,13 +26,13 @@ if 'geos' not in st.session_state:
 if 'code_df' not in st.session_state:
     st.session_state['code_df'] = ""
     st.session_state['code_df2'] = ""
-if 'data' not in st.session_state:
-    st.session_state['data'] = None
+if not sd.has('data'):
+    sd.put('data',None)
 
 
 cols = st.columns([1,3])
 with cols[0]:
-    image = Image.open('app/static/brca2.png')
+    image = lazy.image('app/static/brca2.png')
     st.image(image, caption='AlphaFold 3d structure plotted against plDDT')
 with cols[1]:
     st.caption("Prometry [library documentation](https://rae-gh.github.io/lib-prometry/) generated by pydoctor.")
@@ -70,5 +72,11 @@ st.write("""
                  
         """)
 
+with st.expander("Shared compute cache"):
+    st.caption("Parsed structures and calculated dataframes shared by every session of this server.")
+    st.dataframe(cc.all_stats(),hide_index=True)
+    st.caption("Dataframes of this session, those idle or over the session budget are kept on disk until used.")
+    st.dataframe(sd.manager().stats(),hide_index=True)
+
 #st.caption(" This site is distributed by continuous deployment from the main branch of the [github repo](https://github.com/RachelAlcraft/prometry)")
 st.caption("This application has been developed by [Rachel Alcraft](mailto:rachelalcraft@gmail.com) as an offshoot of a PhD at Birkbeck, University of London &copy; Rachel Alcraft (2023). Supervisor Dr. Mark A. Williams.")
@@ -1,6 +1,7 @@
 import streamlit as st
 import requests
 import pandas as pd
+from shared import metadata_index as mi
 
 DATADIR = "app/data/"
 
@@ -144,6 +145,10 @@ print(pdbs)
                     pdb_dict["chains"].append(chains)
                     pdb_dict["residues"].append(residues)
                     count += 1
+                    try:
+                        mi.record_summary(pdb.lower(),method,reso,n_chains=len(chains.split("/")))
+                    except mi.ERRORS as e:
+                        print("Error indexing metadata", pdb, str(e))
                                     
         if len(accession) > 0:            
             count = -1
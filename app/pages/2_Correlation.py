@@ -3,6 +3,7 @@ import shared.simple_plotsheet as shared_plot
 import shared.structure_explorer as se
 import shared.dataframe_maker as dm
 import shared.geo_plotter as gp
+import shared.tracing as tr
 
 DATADIR = "app/data/"
 
@@ -30,9 +31,14 @@ if True:
         df = dm.maker_geos(ls_structures, ls_geos)                        
         st.write("---")
         gp.geo_plot(df)
+        st.write("---")
+        st.write("#### NMR ensembles and multi-model files")
+        st.caption("Simple geos (atoms with optional +/- offsets) calculated for every model, with a model column and per-residue mean and SD.")
+        df_ens = dm.maker_ensemble(ls_structures, ls_geos)
         
 #with tabCode:
 #        st.write("not implemented")
 
+tr.debug_expander()
 st.divider()
 st.caption("Jumper, J., Evans, R., Pritzel, A., Green, T., Figurnov, M., Ronneberger, O., Tunyasuvunakool, K., Bates, R., Žídek, A., Potapenko, A., Bridgland, A., Meyer, C., Kohl, S. A. A., Ballard, A. J., Cowie, A., Romera-Paredes, B., Nikolov, S., Jain, R., Adler, J.,Hassabis, D. (2021). Highly accurate protein structure prediction with AlphaFold. Nature, 596(7873), 583–589. https://doi.org/10.1038/s41586-021-03819-2")
@@ -3,6 +3,7 @@ import shared.simple_plotsheet as shared_plot
 import shared.structure_explorer as se
 import shared.dataframe_maker as dm
 import shared.geo_plotter as gp
+import shared.tracing as tr
 
 DATADIR = "app/data/"
 
@@ -41,6 +42,7 @@ if True:
 #with tabCode:
 #        st.write("not implemented")
 
+tr.debug_expander()
 st.divider()
 st.caption("""
 Bittrich, S., Schroeder, M. & Labudde, D. StructureDistiller: 
@@ -3,6 +3,7 @@ import shared.simple_plotsheet as shared_plot
 import shared.structure_explorer as se
 import shared.dataframe_maker as dm
 import shared.geo_plotter as gp
+import shared.tracing as tr
 
 DATADIR = "app/data/"
 
@@ -42,5 +43,6 @@ if True:
 #with tabCode:
 #        st.write("not implemented")
 
+tr.debug_expander()
 st.divider()
 st.caption("Crick, F. H. C., & Kendrew, J. C. (1957). X-Ray Analysis and Protein Structure. In Advances in Protein Chemistry (Vol. 12, pp. 133–214). Elsevier. https://doi.org/10.1016/S0065-3233(08)60116-3")
\ No newline at end of file
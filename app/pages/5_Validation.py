@@ -3,6 +3,7 @@ import shared.simple_plotsheet as shared_plot
 import shared.structure_explorer as se
 import shared.dataframe_maker as dm
 import shared.geo_plotter as gp
+import shared.tracing as tr
 
 DATADIR = "app/data/"
 
@@ -44,6 +45,7 @@ if True:
 #with tabCode:
 #        st.write("not implemented")
 
+tr.debug_expander()
 st.divider()
 st.write("Plots underlayed with Ramachandran images from Lovell, 2003.")
 st.caption("Engh, R. A., & Huber, R. (2006). 18.3. Structure quality and target parameters. International Tables for Crystallography, F, 382–392. http://dx.doi.org/10.1107/97809553602060000695")
@@ -3,6 +3,7 @@ import shared.simple_plotsheet as shared_plot
 import shared.structure_explorer as se
 import shared.dataframe_maker as dm
 import shared.geo_plotter as gp
+import shared.tracing as tr
 
 DATADIR = "app/data/"
 
@@ -28,5 +29,6 @@ if True:
         st.write("---")
         gp.geo_plot(df)
                 
+tr.debug_expander()
 st.divider()
 st.caption("""---""")
@@ -28,7 +28,7 @@ st.code("""
         Backbone angle tau: N:CA:C  
         Phi and psi : C-1:N:CA:C and N:CA:C:N+1                  
         The carbonyl oxygen and the nearest N to it that is not in the same residue: O:(N&1) 
-        The disulfide bonds (or nearest cysteine sulphurs): SG:(SG&1)  
+        The disulfide bonds (or nearest cysteine sulphurs): SG:{SG&1}  
         Any O or N within 2.5-3 of the N but not the same residue: N:{(O),(N)@1}[dis|2.5<>3.0]
         The second nearest O or N: N:(N,O@1)
         The nearest O or N not the same residue: N:{N,O&1}
@@ -52,7 +52,14 @@ st.code("""
         Instead of the angle or dihedral, the minimum or maxim pairwise distance between an atom group is found by
         MINDIS|CA-1:CA:CA+1
         MAXDIS|CA:{CA@i}[rid|>1]:{CA@i}[rid|>1]
-        
+
+        COUNT and RDF
+        Instead of a row per pair, a search can be counted with a row per start atom (including those with none)
+        COUNT|FE:(N,O@i)[dis|<2.8] - the N and O atoms within 2.8 of each iron, its coordination number
+        RDF|CA:{CA@i}[dis|0.1><12] - the same count, and in the info column the counts in 0.5 shells out to 12
+        An RDF with no upper dis limit counts out to 12. The start atom is its own candidate at 0, so leave
+        it out with a lower dis limit or rid|>0.
+
         """)
 
         
@@ -1,9 +1,11 @@
 import streamlit as st
-from prometry import pdbloader as pl
-from prometry import pdbgeometry as pg
+from maptial.geo import pdbloader as pl
+from maptial.geo import pdbgeometry as pg
 import pandas as pd
 import plotly.express as px
 import shared.simple_plotsheet_2_strucs as plot2
+import shared.dataframe_maker as dm
+import shared.geo_plotter as gp
 
 
 DATADIR = "app/data/"
@@ -29,6 +31,17 @@ id2s = ("rid","CA:{CA&1}","aa")
 
 plot2.plot_sheet(af_structure,structures, geos, id1s,id2s)
 
+st.write("---")
+st.write("##### Superposition")
+st.write("The PDB entries are superposed onto the AlphaFold model on their matched CA atoms, giving the per-residue deviation alongside plDDT.")
+cols = st.columns(2)
+with cols[0]:
+    sup_ref = st.text_input("AlphaFold model", value=af_structure)
+with cols[1]:
+    sup_structures = st.text_input("PDB entries", value=structures,help="space delim pdb codes")
+df_sup = dm.maker_superposition(sup_ref, sup_structures.split(" "))
+gp.deviation_plot(df_sup)
+
 st.divider()
 st.caption("Terwilliger, T. C., Liebschner, D., Croll, T. I., Williams, C. J., McCoy, A. J., Poon, B. K., Afonine, P. V., Oeffner, R. D., Richardson, J. S., Read, R. J., & Adams, P. D. (2022). AlphaFold predictions are valuable hypotheses, and accelerate but do not replace experimental structure determination [Preprint]. Biochemistry. https://doi.org/10.1101/2022.11.21.517405")
 
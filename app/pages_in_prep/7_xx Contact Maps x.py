@@ -3,6 +3,7 @@ from prometry import pdbloader as pl
 from prometry import pdbgeometry as pg
 import pandas as pd
 import plotly.express as px
+from shared import session_data as sd
 
 DATADIR = "app/data/"
 
@@ -62,15 +63,15 @@ with tabDemo:
     ls_geos = geos.split(" ")
 
     df_geos = pd.DataFrame({'A' : []})    
-    if 'data' not in st.session_state:
-        st.session_state['data'] = df_geos        
+    if not sd.has('data'):
+        sd.put('data',df_geos)        
     else:
         if st.session_state['pdbs'] != structures or st.session_state['geos'] != geos:
-            st.session_state['data'] = df_geos            
+            sd.put('data',df_geos)            
             st.session_state['pdbs'] = structures
             st.session_state['geos'] = geos
         else:
-            df_geos = st.session_state['data']
+            df_geos = sd.get('data')
                 
     st.write("---")
     st.write("##### Calculate dataframe")
@@ -108,7 +109,7 @@ with tabDemo:
         code_string += "\ngm = pg.GeometryMaker(pobjs)\n"
         code_string += "df_geos = gm.calculateGeometry(ls_geos)\n"
                     
-        st.session_state['data'] = df_geos        
+        sd.put('data',df_geos)        
         st.session_state['code_df'] = code_string
                 
     if len(df_geos.index) > 0:
@@ -1,5 +1,6 @@
 import streamlit as st
 import shared.simple_plotsheet as shared_plot
+import shared.dataframe_maker as dm
 
 
 DATADIR = "app/data/"
@@ -23,6 +24,13 @@ geos = geo
 
 shared_plot.plot_sheet(structures, geos,("rid",geo,f"info_{geo}"),(geo,f"bf_{geo}","aa"))
 
+st.write("---")
+st.write("##### Hydrogen bonds")
+st.write("""The distance search above is a distance-only approximation. The dedicated search types donors and acceptors 
+in the backbone, side chains and water, and applies the angle at donor and acceptor using the bonded heavy atoms.""")
+hb_structures = st.text_input("Structures for hydrogen bonds", value=structures,help="pdb or alphafold code")
+dm.maker_hbonds(hb_structures.split(" "))
+
 
 
 
@@ -3,6 +3,7 @@ from prometry import pdbloader as pl
 from prometry import pdbgeometry as pg
 import pandas as pd
 import plotly.express as px
+from shared import session_data as sd
 
 DATADIR = "app/data/"
 
@@ -55,14 +56,14 @@ with tabDemo:
     ls_structures = structures.split(" ")
         
     df_atoms = pd.DataFrame({'A' : []})
-    if 'atoms' not in st.session_state:        
-        st.session_state['atoms'] = df_atoms
+    if not sd.has('atoms'):        
+        sd.put('atoms',df_atoms)
     else:
         if st.session_state['pdbs'] != structures:            
-            st.session_state['atoms'] = df_atoms
+            sd.put('atoms',df_atoms)
             st.session_state['pdbs'] = structures            
         else:            
-            df_atoms = st.session_state['atoms']
+            df_atoms = sd.get('atoms')
     
     st.write("---")
     st.write("##### Calculate dataframe")
@@ -97,7 +98,7 @@ with tabDemo:
         code_string += "\ngm = pg.GeometryMaker(pobjs)\n"        
         code_string += "df_atoms = gm.calculateData()\n"
                     
-        st.session_state['atoms'] = df_atoms
+        sd.put('atoms',df_atoms)
         st.session_state['code_df'] = code_string
 
     if len(df_atoms.index) > 0:
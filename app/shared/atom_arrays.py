@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+# Column arrays of the atoms of one loaded structure.
+# The maptial objects hold atoms as python objects nested in chains and residues; the
+# vectorised searches (spatial indexes, superposition, profiles) work on these flat
+# numpy arrays instead, built in one pass over the structure.
+
+AMINO_ACIDS = ["ALA","ARG","ASN","ASP","CYS","GLN","GLU","GLY","HIS","ILE","LEU","LYS","MET","PHE","PRO","SER","THR","TRP","TYR","VAL"]
+
+class AtomArrays:
+    def __init__(self, pdb_code, resolution, chain, rid, ridx, aa, atom, element, bfactor, occupancy, disordered, coords, number=None):
+        self.pdb_code = pdb_code
+        self.resolution = resolution
+        self.chain = chain
+        self.rid = rid
+        self.ridx = ridx
+        self.aa = aa
+        self.atom = atom
+        self.element = element
+        self.bfactor = bfactor
+        self.occupancy = occupancy
+        self.disordered = disordered
+        self.coords = coords
+        self.number = number    # maptial's atom numbers, where known
+
+    def __len__(self):
+        return len(self.rid)
+
+    def select(self, mask):
+        """A new AtomArrays of the atoms where mask (boolean or index array) selects."""
+        return AtomArrays(self.pdb_code,self.resolution,self.chain[mask],self.rid[mask],self.ridx[mask],
+                          self.aa[mask],self.atom[mask],self.element[mask],self.bfactor[mask],
+                          self.occupancy[mask],self.disordered[mask],self.coords[mask],
+                          None if self.number is None else self.number[mask])
+
+    def is_standard(self):
+        return np.isin(self.aa,AMINO_ACIDS)
+
+    def dataFrame(self):
+        return pd.DataFrame({"pdb_code":self.pdb_code,"resolution":self.resolution,"chain":self.chain,
+                             "aa":self.aa,"rid":self.rid,"ridx":self.ridx,"atom":self.atom,"element":self.element,
+                             "bfactor":self.bfactor,"occupancy":self.occupancy,
+                             "x":self.coords[:,0],"y":self.coords[:,1],"z":self.coords[:,2]})
+
+#--------------------------------------------------------------------
+def from_pobj(pobj, dtype=np.float32):
+    """Flattens a maptial PdbObject into AtomArrays, in chain/residue/atom order.
+
+    Coordinates, b-factors and occupancies are of dtype; np.float64 keeps maptial's values exactly.
+    """
+    chain,rid,ridx,aa,atom,element,bfactor,occupancy,disordered,coords,number = [],[],[],[],[],[],[],[],[],[],[]
+    for ch,resdic in pobj.chains.items():
+        for res in resdic.values():
+            for atm in res.atoms.values():
+                chain.append(ch)
+                rid.append(res.rid)
+                ridx.append(res.ridx)
+                aa.append(res.amino_acid)
+                atom.append(atm.atom_name)
+                element.append(atm.atom_type)
+                bfactor.append(atm.bfactor)
+                occupancy.append(atm.occupancy if atm.occupancy is not None else 0)
+                disordered.append(atm.disordered == "Y")
+                coords.append((atm.x,atm.y,atm.z))
+                number.append(atm.atom_no)
+    return AtomArrays(pobj.pdb_code,pobj.resolution,
+                      np.array(chain,dtype=object),np.array(rid,dtype=np.int64),np.array(ridx,dtype=np.int64),
+                      np.array(aa,dtype=object),np.array(atom,dtype=object),np.array(element,dtype=object),
+                      np.array(bfactor,dtype=dtype),np.array(occupancy,dtype=dtype),
+                      np.array(disordered,dtype=bool),np.array(coords,dtype=dtype).reshape(-1,3),
+                      np.array(number,dtype=np.int64))
+#--------------------------------------------------------------------
+def residue_keys(arrs):
+    """An integer per atom identifying its (chain, rid) residue."""
+    keys = pd.MultiIndex.from_arrays([arrs.chain,arrs.rid])
+    codes,_ = pd.factorize(keys)
+    return codes
+#--------------------------------------------------------------------
+def angles(a, b, c):
+    """Vectorised angle in degrees at b for rows of points a, b, c."""
+    ba = a - b
+    bc = c - b
+    cos = np.einsum("ij,ij->i",ba,bc) / (np.linalg.norm(ba,axis=1)*np.linalg.norm(bc,axis=1))
+    return np.degrees(np.arccos(np.clip(cos,-1,1)))
+#--------------------------------------------------------------------
+def dihedrals(a, b, c, d):
+    """Vectorised dihedral in degrees for points a, b, c, d with any leading dimensions."""
+    b0 = a - b
+    b1 = c - b
+    b2 = d - c
+    b1 = b1 / np.linalg.norm(b1,axis=-1,keepdims=True)
+    v = b0 - np.sum(b0*b1,axis=-1,keepdims=True)*b1
+    w = b2 - np.sum(b2*b1,axis=-1,keepdims=True)*b1
+    x = np.sum(v*w,axis=-1)
+    y = np.sum(np.cross(b1,v)*w,axis=-1)
+    return np.degrees(np.arctan2(y,x))
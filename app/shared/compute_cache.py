@@ -0,0 +1,216 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from shared import config as cfg
+
+# Process-wide cache shared by every session of the app.
+# Entries are held in memory up to a byte limit and evicted least recently used first; a cache
+# given a directory also writes each entry there so that other server processes, and this one
+# after a restart, can read it instead of computing it again. Concurrent requests for the same
+# key wait for the one computation in progress. Values are shared between sessions so are handed
+# out read-only: arrays are not writeable and dataframes are shallow copies, which copy-on-write
+# (the default from pandas 3, switched on here for older versions) keeps from ever changing the
+# cached frame, so a hit costs no copy of the data. Other objects,
+# such as the parsed maptial PdbObjects in STRUCTURES, cannot be made read-only and are handed out
+# as they are: callers must treat them as read-only and never change them.
+
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write",True)
+BYTES_PER_ATOM = 2100   # measured for maptial PdbObjects including the biopython structure
+
+class ComputeCache:
+    def __init__(self, name, max_bytes, disk_dir=None, max_disk_bytes=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()    # key -> (value, nbytes)
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute, nbytes=None, keep=None):
+        """The cached value of key, computing it with compute() (once across threads) if absent.
+
+        A computed value is not cached when it is None or keep(value) is false, e.g. after a failed download.
+        """
+        value = self.lookup(key)
+        if value is not None:
+            return read_only(value)
+        key_lock = self.key_lock(key)
+        with key_lock:
+            try:
+                # another thread may have finished the computation while this one waited
+                value = self.lookup(key)
+                if value is None:
+                    value = self.read_disk(key)
+                    if value is not None:
+                        with self.lock:
+                            self.disk_hits += 1
+                    else:
+                        with self.lock:
+                            self.misses += 1
+                        value = compute()
+                        if value is None or (keep is not None and not keep(value)):
+                            return value
+                        self.write_disk(key,value)
+                    self.put(key,value,nbytes)
+            finally:
+                # also when compute raises, so failed keys are not kept, and only this lock, not one
+                # made since by a thread that came after it was dropped
+                with self.lock:
+                    if self.key_locks.get(key) is key_lock:
+                        del self.key_locks[key]
+        return read_only(value)
+
+    def lookup(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+        return None
+
+    def key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key,threading.Lock())
+
+    def put(self, key, value, nbytes=None):
+        value = freeze(value)
+        size = nbytes(value) if callable(nbytes) else nbytes
+        if size is None:
+            size = size_of(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.n_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value,size)
+            self.n_bytes += size
+            while self.n_bytes > self.max_bytes and len(self.entries) > 1:
+                _,(_,old_size) = self.entries.popitem(last=False)
+                self.n_bytes -= old_size
+                self.evictions += 1
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir,self.name,f"{digest}.pkl")
+
+    def read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self.disk_path(key)
+        try:
+            with open(path,"rb") as fr:
+                stored_key,value = pickle.load(fr)
+            os.utime(path)
+        except (OSError,EOFError,pickle.UnpicklingError):
+            return None
+        return value if stored_key == key else None
+
+    def write_disk(self, key, value):
+        if self.disk_dir is None:
+            return
+        path = self.disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path),exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp,"wb") as fw:
+                pickle.dump((key,value),fw,protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp,path)
+            self.prune_disk()
+        except OSError as e:
+            print("Error writing cache", self.name, str(e))
+
+    def prune_disk(self):
+        # least recently read files go first
+        if self.max_disk_bytes is None:
+            return
+        folder = os.path.join(self.disk_dir,self.name)
+        files = []
+        for f in os.listdir(folder):
+            if f.endswith(".pkl"):
+                st = os.stat(os.path.join(folder,f))
+                files.append((st.st_mtime,st.st_size,f))
+        total = sum(f[1] for f in files)
+        for mtime,size,f in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(folder,f))
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.n_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.disk_hits + self.misses
+            return {"cache":self.name,"entries":len(self.entries),"mb":round(self.n_bytes/1e6,1),
+                    "max_mb":round(self.max_bytes/1e6,1),"hits":self.hits,"disk_hits":self.disk_hits,
+                    "misses":self.misses,"evictions":self.evictions,
+                    "hit_rate":round((self.hits + self.disk_hits)/requests,3) if requests > 0 else None}
+
+#--------------------------------------------------------------------
+def size_of(value):
+    if isinstance(value,pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value,np.ndarray):
+        return value.nbytes
+    if isinstance(value,(list,tuple)):
+        return sum(size_of(v) for v in value)
+    if hasattr(value,"chains"):
+        return BYTES_PER_ATOM * sum(len(res.atoms) for resdic in value.chains.values() for res in resdic.values())
+    return len(pickle.dumps(value,protocol=pickle.HIGHEST_PROTOCOL))
+#--------------------------------------------------------------------
+def fingerprint(df):
+    """A digest of a dataframe's contents, to key what is computed from a frame that is not itself cached."""
+    digest = hashlib.sha1(repr((df.shape,list(df.columns))).encode())
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            digest.update(np.ascontiguousarray(values.to_numpy()).tobytes())
+        else:
+            codes,uniques = pd.factorize(values)
+            digest.update(codes.tobytes())
+            digest.update(repr(list(uniques)).encode())
+    return digest.hexdigest()
+#--------------------------------------------------------------------
+def freeze(value):
+    if isinstance(value,np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value,(list,tuple)):
+        for v in value:
+            freeze(v)
+    elif isinstance(value,dict):
+        for v in value.values():
+            freeze(v)
+    return value
+#--------------------------------------------------------------------
+def read_only(value):
+    """What a session is given: dataframes as views that copy on write, everything else as stored."""
+    if isinstance(value,pd.DataFrame):
+        return value.copy(deep=False)
+    if isinstance(value,list):
+        return [read_only(v) for v in value]
+    if isinstance(value,tuple):
+        return tuple(read_only(v) for v in value)
+    return value
+#--------------------------------------------------------------------
+STRUCTURES = ComputeCache("structures",cfg.CACHE_MB_STRUCTURES*1e6)
+RESULTS = ComputeCache("results",cfg.CACHE_MB_RESULTS*1e6,disk_dir=cfg.CACHEDIR,max_disk_bytes=cfg.CACHE_MB_DISK*1e6)
+#--------------------------------------------------------------------
+def all_stats():
+    return pd.DataFrame([STRUCTURES.stats(),RESULTS.stats()])
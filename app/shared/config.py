@@ -1,16 +1,41 @@
 
+import os
 import streamlit as st
 
 DATADIR = "app/data/"
+DBPATH = "app/data/prometry.db"
+CACHEDIR = "app/data/cache/"
+CACHE_MB_STRUCTURES = 512
+CACHE_MB_RESULTS = 256
+CACHE_MB_DISK = 2048
+GEO_STORE_MAX_ROWS = 20_000_000     # computed geometry kept in DBPATH, least recently used evicted beyond this
+GEO_STORE_RUN_ROWS = 500_000        # a geo with more rows than this on one structure is not kept
+SESSIONDIR = "app/data/sessions/"
+SESSION_MB = 256
+SESSION_IDLE_SECONDS = 900
+TRACE_LOG = os.environ.get("PROMETRY_TRACE_LOG","")    # json lines of stage timings, none when empty
+TRACE_UI = False    # always show the timings expander, not only with ?debug=1
+METRICS_PORT = int(os.environ.get("PROMETRY_METRICS_PORT","0"))   # prometheus endpoint on localhost, none when 0
+METRICS_FILE = os.environ.get("PROMETRY_METRICS_FILE","")
+METRICS_INTERVAL = 15
+JOB_WORKERS = 2
+JOB_KEEP_SECONDS = 600
+QUERY_TIMEOUT_SECONDS = 1800   # a background calculation is stopped after this
+QUERY_MAX_MB = 4000             # memory cap of a geo calculated in a child process
+SANDBOX_SECONDS = 5             # geos estimated to take longer than this run in a child process
+SANDBOX_MB = 500                # or to need more memory than this
+EXPORT_DIR = os.environ.get("PROMETRY_EXPORT_DIR","app/data/exports/")
+EXPORT_BATCH_ROWS = 100_000
+EXPORT_DOWNLOAD_MB = 500        # larger exports are only written to EXPORT_DIR
+EXPORT_KEEP_SECONDS = 86400
+PLAN_CONFIRM_SECONDS = 60   # estimated cost above which a run has to be confirmed
+PLAN_CONFIRM_MB = 1000
+PLAN_REFUSE_SECONDS = 1800  # and above which it is refused
+PLAN_REFUSE_MB = 8000
 
 def init():
     # All key initilisation
-    if 'df_geos' not in st.session_state:
-        st.session_state['df_geos'] = None
-    if 'df_geos_xtra' not in st.session_state:
-        st.session_state['df_geos_xtra'] = None    
-    if 'df_atoms' not in st.session_state:
-        st.session_state['df_atoms'] = None
+    # dataframes are kept through shared.session_data
     if "ls_structures" not in st.session_state:
         st.session_state["ls_structures"] = ["AF-P04637-F1-model_v6","1YCS"]
     if "ls_geos" not in st.session_state:
@@ -1,13 +1,35 @@
+import os
 import streamlit as st
-from maptial.geo import pdbloader as pl
-from maptial.geo import pdbgeometry as pg
+import pandas as pd
 from shared import config as cfg
+from shared import metadata_index as mi
+from shared import geo_store as gs
+from shared import ensemble as en
+from shared import compute_cache as cc
+from shared import session_data as sd
+from shared import tracing as tr
+from shared import jobs
+from shared import query_plan as qp
+from shared import sandbox as sb
+from shared import result_view as rv
+from shared import export as ex
+from shared import pair_search as ps
+from shared import lazy
+pl = lazy.load("maptial.geo.pdbloader")
+pg = lazy.load("maptial.geo.pdbgeometry")
+hb = lazy.load("shared.hbonds")
+sp = lazy.load("shared.superpose")
 
 DATADIR = "app/data/"
+FRAMESDIR = "app/data/frames/"
 PERFECT_PDB = "4rek"
+# what a missing, unreadable or malformed structure file raises while loading
+LOAD_ERRORS = (OSError,ValueError,KeyError,IndexError)
 
 #--------------------------------------------------------------------
-def load_pdbs(ls_structures):
+@tr.traced("load_pdbs")
+def load_pdbs(ls_structures, on_error=None):
+    """The loaded structures; all but uploads are shared with every session through cc.STRUCTURES, so must not be changed."""
     pobjs = []                            
     cif = False
     for pdb in ls_structures:        
@@ -22,58 +44,432 @@ def load_pdbs(ls_structures):
                 if ext == "cif":
                     cif = True
             pla = pl.PdbLoader(pdb,DATADIR,cif=cif,source=source)        
-            po = pla.load_pdb()
+            if gs.is_storable(pdb):
+                # parsed structures are shared read-only between sessions
+                po = cc.STRUCTURES.get_or_compute(("pdb",pdb,cif,source),lambda pla=pla: load_indexed(pla))
+            else:
+                po = load_indexed(pla)
             pobjs.append(po)
-        except Exception as e:
-            st.error(str(e))
+        except LOAD_ERRORS as e:
+            (on_error or st.error)(str(e))
+            continue
     return pobjs
 #--------------------------------------------------------------------
+def load_indexed(pla):
+    with tr.span("download",pdb=pla.pdb_code) as span:
+        span.set(local=os.path.exists(pla.cif_filepath if pla.cif else pla.pdb_filepath))
+        pla.download_pdb(cif=pla.cif)
+    with tr.span("parse",pdb=pla.pdb_code):
+        po = pla.load_pdb()
+    try:
+        mi.index_loaded(pla)
+    except mi.ERRORS as e:
+        print("Error indexing metadata", pla.pdb_code, str(e))
+    return po
+#--------------------------------------------------------------------
+def structure_key(pdb):
+    # the pdb_code that load_pdbs gives the loaded structure
+    if "AF-" not in pdb:
+        pdb = pdb.lower()
+    return pdb.split(".")[0]
+#--------------------------------------------------------------------
+@tr.traced("calculate_geos")
+def calculate_geos(ls_structures, ls_geos, progress=None, on_error=None, check=None):
+    """Geometry for the structures, shared between sessions when none is a user upload.
+
+    progress() is called after each structure and on_error(message) in place of st.error. check(),
+    when given, is called between calculations and raises sandbox.Stopped to end the run, and
+    expensive geos are then calculated in a child process (see calculate_geometry).
+    """
+    if all(gs.is_storable(structure_key(pdb)) for pdb in ls_structures):
+        key = ("geos",tuple(ls_structures),tuple(ls_geos),gs.LIB_VERSION)
+        # only kept when every structure loaded, so a failed download is retried next time; a
+        # structure with no rows for the geos is a result like any other
+        failed,on_error = load_errors(on_error)
+        return cc.RESULTS.get_or_compute(key,lambda: calculate_geos_stored(ls_structures,ls_geos,progress,on_error,check),
+                                         keep=lambda df: len(failed) == 0)
+    return calculate_geos_stored(ls_structures,ls_geos,progress,on_error,check)
+#--------------------------------------------------------------------
+def load_errors(on_error):
+    """A list the load errors are added to, and an on_error that adds to it before reporting as on_error does."""
+    failed = []
+    def error(message):
+        failed.append(message)
+        (on_error or st.error)(message)
+    return failed,error
+#--------------------------------------------------------------------
+def calculate_geos_stored(ls_structures, ls_geos, progress=None, on_error=None, check=None):
+    """Geometry for the structures, reading (structure, geo) results from the geo store and computing only the rest.
+
+    When check stops the run, the sandbox.Stopped it raises carries the structures finished so far.
+    """
+    frames = []
+    try:
+        for pdb in ls_structures:
+            calculate_structure(pdb,ls_geos,frames,progress,on_error,check)
+    except sb.Stopped as e:
+        e.partial = pd.concat(frames,ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+        raise
+    if len(frames) == 0:
+        return pd.DataFrame()
+    with tr.span("concat") as span:
+        return span.rows(pd.concat(frames,ignore_index=True))
+#--------------------------------------------------------------------
+def calculate_structure(pdb, ls_geos, frames, progress=None, on_error=None, check=None):
+    # one structure of calculate_geos_stored, appended to frames
+    key = structure_key(pdb)
+    storable = gs.is_storable(key)
+    per_geo = {}
+    if storable:
+        for geo in gs.stored_geos(key,ls_geos):
+            per_geo[geo] = gs.load(key,geo)
+    missing = [geo for geo in dict.fromkeys(ls_geos) if geo not in per_geo]
+    comp = composition(pdb) if len(missing) > 0 and storable else None
+    if not all(qp.can_match(comp,geo) for geo in missing):
+        # a geo the structure's composition rules out has no rows, so neither has the joined frame
+        # and the coordinates are not needed
+        for geo in missing:
+            per_geo[geo] = gs.empty(geo)
+        missing = []
+    if len(missing) > 0:
+        pobjs = load_pdbs([pdb],on_error)
+        if len(pobjs) == 0:
+            if progress is not None:
+                progress(pdb)
+            return
+        with tr.span("GeometryMaker",pdb=key):
+            gm = pg.GeometryMaker(pobjs)
+        for geo in missing:
+            if check is not None:
+                check()
+            with tr.span("calculateGeometry",pdb=key,geo=geo) as span:
+                df_geo = span.rows(calculate_geometry(gm,pdb,geo,check))
+            per_geo[geo] = df_geo
+            if storable:
+                try:
+                    gs.save(key,geo,df_geo,resolution=pobjs[0].resolution)
+                except gs.ERRORS as e:
+                    print("Error storing geometry", key, geo, str(e))
+    with tr.span("widen",pdb=key,stored=len(ls_geos) - len(missing)) as span:
+        frames.append(span.rows(gs.widen(per_geo,ls_geos)))
+    if progress is not None:
+        progress(pdb)
+#--------------------------------------------------------------------
+def calculate_geometry(gm, pdb, geo, check=None):
+    """gm.calculateGeometry([geo]), or in a child process when it can be stopped and is estimated to be expensive.
+
+    All-pairs searches are calculated on arrays by pair_search instead. calculateGeometry cannot be
+    interrupted, so only the child process honours check and the memory cap while a geo is
+    calculating; cheap geos stay in the server for the cost of spawning a process.
+    """
+    if ps.supports(geo):
+        return ps.calculate(gm.pobjs,geo,check)
+    if check is None:
+        return gm.calculateGeometry([geo])
+    key,cif,source = loader_args(pdb)
+    path = structure_file(pdb)
+    est = qp.explain(qp.structure_stats(path),geo) if path is not None else None
+    if est is None or (est["seconds"] < cfg.SANDBOX_SECONDS and est["mb"] < cfg.SANDBOX_MB):
+        return gm.calculateGeometry([geo])
+    return sb.calculate(key,DATADIR,cif,source,geo,check=check,max_mb=cfg.QUERY_MAX_MB)
+#--------------------------------------------------------------------
+def submit_geos(ls_structures, ls_geos):
+    """Starts calculate_geos as a background job, or joins the same run already submitted, and returns the job id."""
+    key = ("geos",tuple(ls_structures),tuple(ls_geos),gs.LIB_VERSION)
+    if not all(gs.is_storable(structure_key(pdb)) for pdb in ls_structures):
+        key = key + (sd.session_id(),)  # uploads of the same name are not the same structure
+    return jobs.submit(key,lambda job: calculate_geos(ls_structures,ls_geos,progress=job.advance,on_error=job.warn,check=job.check),
+                       total=len(ls_structures),timeout=cfg.QUERY_TIMEOUT_SECONDS,waiter=sd.session_id())
+#--------------------------------------------------------------------
+@st.fragment(run_every=1.0)
+def settled(job):
+    # finished, or no longer waited on by this session, which has cancelled it
+    return job is None or job.is_finished() or not job.is_waiting(sd.session_id())
+#--------------------------------------------------------------------
+@st.fragment(run_every=1.0)
+def job_progress(job_ids):
+    # polls the jobs without rerunning the page, then reruns it once they have finished
+    running = [jobs.get(job_id) for job_id in job_ids]
+    if all(settled(job) for job in running):
+        st.rerun()
+    for job in running:
+        if job is not None:
+            cols = st.columns([6,1])
+            with cols[0]:
+                st.progress(job.fraction(),text=f"{job.status} {job.done}/{job.total} structures {job.message}")
+            with cols[1]:
+                if st.button("Cancel",key=f"cancel_{job.id}",disabled=settled(job)):
+                    # other sessions may be waiting on the same job, which then runs on for them
+                    jobs.cancel(job.id,sd.session_id())
+                    st.rerun()
+#--------------------------------------------------------------------
+def collect_jobs(name):
+    """The finished results of the session's jobs under name, or None while any is running."""
+    job_ids = st.session_state.get(name,{})
+    running = {frame:jobs.get(job_id) for frame,job_id in job_ids.items()}
+    if not all(settled(job) for job in running.values()):
+        job_progress(list(job_ids.values()))
+        return None
+    results = {}
+    for frame,job in running.items():
+        if job is None:
+            st.error("The calculation was lost, please calculate again")
+        elif not job.is_finished():
+            st.warning("Cancelled")
+        elif job.status == jobs.STOPPED:
+            n = 0 if job.result is None or len(job.result.index) == 0 else job.result["pdb_code"].nunique()
+            st.warning(f"{job.error}, showing the {n} structures finished before it stopped")
+            results[frame] = job.result
+        elif job.error is not None:
+            st.error(job.error)
+        else:
+            for error in job.errors:
+                st.error(error)
+            results[frame] = job.result
+    del st.session_state[name]
+    return results
+#--------------------------------------------------------------------
+def loader_args(pdb):
+    # the code, cif and source PdbLoader is given for a structure
+    source = "alphafold" if "AF-" in pdb else "ebi"
+    return structure_key(pdb),pdb.lower().endswith(".cif"),source
+#--------------------------------------------------------------------
+def structure_file(pdb):
+    """The local coordinate file of a structure, downloaded if need be, or None."""
+    key,cif,source = loader_args(pdb)
+    pla = pl.PdbLoader(key,DATADIR,cif=cif,source=source)
+    if not pla.download_pdb(cif=cif):
+        return None
+    return pla.cif_filepath if cif else pla.pdb_filepath
+#--------------------------------------------------------------------
+def composition(pdb):
+    """The metadata index composition of a structure, indexing its local file if it has not been; None if unknown."""
+    key,cif,source = loader_args(pdb)
+    comp = mi.compositions([key]).get(key)
+    if comp is None:
+        pla = pl.PdbLoader(key,DATADIR,cif=cif,source=source)
+        path = pla.cif_filepath if cif else pla.pdb_filepath
+        if os.path.exists(path):
+            try:
+                mi.index_file(key,path,source=source)
+                comp = mi.compositions([key]).get(key)
+            except mi.ERRORS as e:
+                print("Error indexing metadata", key, str(e))
+    return comp
+#--------------------------------------------------------------------
+@tr.traced("explain_geos")
+def explain_geos(ls_structures, ls_geos):
+    """The query_plan estimate of calculate_geos, from the composition index and counts in the structure files.
+
+    A structure whose composition rules out any of the geos is not downloaded or read.
+    """
+    geos = list(dict.fromkeys(ls_geos))
+    stats,comps = {},{}
+    for pdb in ls_structures:
+        key = structure_key(pdb)
+        comp = composition(pdb) if gs.is_storable(key) else None
+        if comp is not None:
+            comps[key] = comp
+            if not all(qp.can_match(comp,geo) for geo in geos):
+                continue
+        path = structure_file(pdb)
+        if path is not None:
+            stats[key] = qp.structure_stats(path)
+            if comp is None and gs.is_storable(key):
+                # indexed now it is downloaded, so the next plan can skip it without the file
+                comp = composition(pdb)
+                if comp is not None:
+                    comps[key] = comp
+    return qp.plan(stats,geos,comps)
+#--------------------------------------------------------------------
+def show_plan(df_plan, totals):
+    st.write(f"Estimated {totals['rows']:,} rows, {totals['mb']:,} MB at peak and {totals['seconds']:,} s")
+    skipped = df_plan.loc[df_plan["skip"],"pdb_code"].nunique() if "skip" in df_plan.columns else 0
+    if skipped > 0:
+        st.write(f"{skipped:,} structures are skipped as they do not have the atoms or residues of every geo")
+    with st.expander("Expand estimate per structure and geo"):
+        st.dataframe(df_plan,hide_index=True)
+#--------------------------------------------------------------------
 def maker_geos(ls_structures, ls_geos, extra_underlying=False):
     cfg.init()
-    df_geos = st.session_state['df_geos']
-    df_geos_xtra = st.session_state['df_geos_xtra']
+    df_geos = sd.get('df_geos')
+    df_geos_xtra = sd.get('df_geos_xtra')
     if len(ls_structures) == 0 or len(ls_geos) == 0 or len(ls_structures[0]) == 0:
         st.write("No structures entered")
     else:        
         st.write("### (2/3) Calculation")        
-        if st.button("Calculate dataframe"):                    
-            pobjs = load_pdbs(ls_structures)                        
-            gm = pg.GeometryMaker(pobjs)
-            df_geos = gm.calculateGeometry(ls_geos)
+        cols = st.columns([1,1,4])
+        with cols[0]:
+            calculate = st.button("Calculate dataframe")
+        with cols[1]:
+            explain = st.button("Explain")
+        run = False
+        request = (tuple(ls_structures),tuple(ls_geos))
+        if calculate or explain:
+            df_plan,totals = explain_geos(ls_structures,ls_geos)
+            verdict = qp.verdict(totals)
+            if explain:
+                show_plan(df_plan,totals)
+            elif verdict == "refuse":
+                show_plan(df_plan,totals)
+                st.error("This calculation is too large to run here, please reduce the structures or restrict the geos with criteria")
+            elif verdict == "confirm":
+                st.session_state['geo_confirm'] = (request,df_plan,totals)
+            else:
+                run = True
+        if 'geo_confirm' in st.session_state and not explain:
+            confirm_request,df_plan,totals = st.session_state['geo_confirm']
+            if confirm_request != request:
+                del st.session_state['geo_confirm']
+            else:
+                show_plan(df_plan,totals)
+                st.warning("This is a large calculation")
+                if st.button("Run anyway"):
+                    del st.session_state['geo_confirm']
+                    run = True
+        if run:
+            # calculated in the background so that reruns meanwhile do not lose the work
+            job_ids = {'df_geos':submit_geos(ls_structures,ls_geos)}
             if extra_underlying:
-                pobjs_xtra = load_pdbs([PERFECT_PDB])
-                gm_xtra = pg.GeometryMaker(pobjs_xtra)
-                df_geos_xtra = gm_xtra.calculateGeometry(ls_geos)                                                                                 
-                st.session_state['df_geos_xtra'] = df_geos_xtra
+                job_ids['df_geos_xtra'] = submit_geos([PERFECT_PDB],ls_geos)
+            st.session_state['geo_jobs'] = job_ids
+        if 'geo_jobs' in st.session_state:
+            results = collect_jobs('geo_jobs')
+            if results is not None:
+                df_geos = results.get('df_geos',df_geos)
+                if 'df_geos_xtra' in results:
+                    df_geos_xtra = results['df_geos_xtra']
+                    sd.put('df_geos_xtra',df_geos_xtra)
         if df_geos is not None and len(df_geos.index) > 0:                            
             with st.expander("Expand geometric dataframe"):
-                st.dataframe(df_geos)
-    st.session_state['df_geos'] = df_geos    
+                rv.show(df_geos,"geos")
+            with st.expander("Expand export"):
+                ex.export_controls(df_geos,"geos")
+    sd.put('df_geos',df_geos)    
     if extra_underlying:
         return df_geos,df_geos_xtra
     else:
         return df_geos
 #--------------------------------------------------------------------
+@tr.traced("calculate_ensemble_geos")
+def calculate_ensemble_geos(ls_structures, ls_geos):
+    """Simple geos over every model of each structure, with a model column."""
+    frames = []
+    for pdb in ls_structures:
+        source = "alphafold" if "AF-" in pdb else "ebi"
+        key = structure_key(pdb)
+        pla = pl.PdbLoader(key,DATADIR,cif=False,source=source)
+        if not pla.download_pdb(cif=False):
+            st.error(f"Could not download {key}")
+            continue
+        ens = en.load_ensemble(pla.pdb_filepath,pdb_code=key,cache_dir=FRAMESDIR)
+        frames.append(en.calculate(ens,ls_geos))
+    if len(frames) == 0:
+        return pd.DataFrame()
+    return pd.concat(frames,ignore_index=True)
+#--------------------------------------------------------------------
+def maker_ensemble(ls_structures, ls_geos):
+    cfg.init()
+    df_ens = sd.get('df_ensemble')
+    if len(ls_structures) == 0 or len(ls_geos) == 0 or len(ls_structures[0]) == 0:
+        st.write("No structures entered")
+    else:
+        if st.button("Calculate over all models"):
+            try:
+                df_ens = calculate_ensemble_geos(ls_structures,ls_geos)
+            except ValueError as e:
+                st.error(str(e))
+        if df_ens is not None and len(df_ens.index) > 0:
+            geos = [geo for geo in ls_geos if geo in df_ens.columns]
+            st.write(f"{df_ens['model'].max()} models at most per structure")
+            with st.expander("Expand per-residue mean and SD across models"):
+                st.dataframe(en.aggregate(df_ens,geos))
+            with st.expander("Expand per-model dataframe"):
+                st.dataframe(df_ens)
+    sd.put('df_ensemble',df_ens)
+    return df_ens
+#--------------------------------------------------------------------
 def maker_atoms(ls_structures):
     cfg.init()
-    df_atoms = st.session_state['df_atoms']
+    df_atoms = sd.get('df_atoms')
     if len(ls_structures) == 0 or len(ls_structures[0]) == 0:
         st.write("No structures entered")
     else:        
         st.write("### (2/3) Calculation")        
-        if st.button("Calculate dataframe"):                    
-            pobjs = load_pdbs(ls_structures)                        
-            gm = pg.GeometryMaker(pobjs)
-            df_atoms = gm.calculateData()
+        if st.button("Calculate dataframe"):
+            # renamed once here, so the same frame is kept in the session between reruns
+            df_atoms = calculate_atoms(ls_structures).rename(columns={"pdbCode":"pdb_code"})
                                                                                              
         if df_atoms is not None and len(df_atoms.index) > 0:                            
             with st.expander("Expand (x,y,z) dataframe"):
-                st.dataframe(df_atoms)
-            df_atoms = df_atoms.rename(columns={"pdbCode":"pdb_code"})
-    st.session_state['df_atoms'] = df_atoms
+                rv.show(df_atoms,"atoms")
+            with st.expander("Expand export"):
+                ex.export_controls(df_atoms,"atoms")
+    sd.put('df_atoms',df_atoms)
     return df_atoms
 
 #--------------------------------------------------------------------
+@tr.traced("calculate_atoms")
+def calculate_atoms(ls_structures):
+    failed,on_error = load_errors(None)
+    def compute():
+        pobjs = load_pdbs(ls_structures,on_error)
+        with tr.span("GeometryMaker"):
+            gm = pg.GeometryMaker(pobjs)
+        with tr.span("calculateData") as span:
+            return span.rows(gm.calculateData())
+    if all(gs.is_storable(structure_key(pdb)) for pdb in ls_structures):
+        return cc.RESULTS.get_or_compute(("atoms",tuple(ls_structures),gs.LIB_VERSION),compute,
+                                         keep=lambda df: len(failed) == 0)
+    return compute()
+#--------------------------------------------------------------------
+def maker_hbonds(ls_structures):
+    cfg.init()
+    df_hbonds = sd.get('df_hbonds')
+    if len(ls_structures) == 0 or len(ls_structures[0]) == 0:
+        st.write("No structures entered")
+    else:
+        cols = st.columns(3)
+        with cols[0]:
+            min_dis,max_dis = st.slider("Donor-acceptor distance",2.0,4.0,(hb.MIN_DIS,hb.MAX_DIS),step=0.1)
+        with cols[1]:
+            min_angle = st.slider("Minimum donor and acceptor angle",0,180,hb.MIN_ANGLE)
+        with cols[2]:
+            min_rid_sep = st.number_input("Minimum residue separation",min_value=1,value=1)
+        if st.button("Find hydrogen bonds"):
+            pobjs = load_pdbs(ls_structures)
+            with tr.span("hbonds") as span:
+                df_hbonds = span.rows(hb.hbonds_structures(pobjs,min_dis=min_dis,max_dis=max_dis,min_angle=min_angle,min_rid_sep=min_rid_sep))
+        if df_hbonds is not None and len(df_hbonds.index) > 0:
+            st.write(df_hbonds.groupby(["pdb_code","kind"],observed=True).size().unstack(fill_value=0))
+            with st.expander("Expand hydrogen bond dataframe"):
+                st.dataframe(df_hbonds)
+    sd.put('df_hbonds',df_hbonds)
+    return df_hbonds
+#--------------------------------------------------------------------
+def maker_superposition(ref_structure, ls_structures):
+    cfg.init()
+    df_sup = sd.get('df_superposed')
+    df_summary = sd.get('df_superposed_summary')
+    if len(ref_structure) == 0 or len(ls_structures) == 0 or len(ls_structures[0]) == 0:
+        st.write("No structures entered")
+    else:
+        mapping = st.radio("Match residues by",["residue number","sequence alignment"],horizontal=True)
+        if st.button("Superpose structures"):
+            pobjs_ref = load_pdbs([ref_structure])
+            pobjs = load_pdbs(ls_structures)
+            if len(pobjs_ref) > 0 and len(pobjs) > 0:
+                with tr.span("superpose") as span:
+                    df_sup,df_summary = sp.compare_structures(pobjs_ref[0],pobjs,mapping="align" if mapping == "sequence alignment" else "rid")
+                    span.rows(df_sup)
+        if df_summary is not None and len(df_summary.index) > 0:
+            st.dataframe(df_summary,hide_index=True)
+            with st.expander("Expand per-residue deviation dataframe"):
+                st.dataframe(df_sup)
+    sd.put('df_superposed',df_sup)
+    sd.put('df_superposed_summary',df_summary)
+    return df_sup
+#--------------------------------------------------------------------
 
 
 
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from shared import query_plan as qp
+from shared import lazy
+px = lazy.load("plotly.express")
+go = lazy.load("plotly.graph_objs")
+ndimage = lazy.load("scipy.ndimage")
+
+# Server-side 2d density estimation for the probability density plots.
+# Points are binned onto a grid and the counts smoothed with a Gaussian, i.e. a binned KDE, so
+# the cost is one histogram over the data and one filter over the grid however many points
+# there are. Dihedral axes wrap at +/-180 so density near the edge carries over to the other side.
+# Only the grid goes to the browser, and grids are kept per (data, axes, bandwidth).
+
+BINS = 128
+MAX_CACHED = 32
+_GRIDS = OrderedDict()
+
+#--------------------------------------------------------------------
+def is_angular(col):
+    # dihedral geos (4 atoms) are in degrees on [-180, 180); their bf_, occ_ etc columns are not,
+    # nor are aggregates over 4 atoms such as MAXDIS|, which are distances
+    col = str(col)
+    if "_" in col.split(":")[0]:
+        return False
+    aggregate,terms = qp.parse_geo(col)
+    return aggregate is None and len(terms) == 4
+#--------------------------------------------------------------------
+def scott_bandwidth(vals, periodic):
+    n = max(len(vals),2)
+    if periodic:
+        rad = np.radians(vals)
+        r = np.clip(np.hypot(np.sin(rad).mean(),np.cos(rad).mean()),1e-12,1)
+        sd = np.degrees(np.sqrt(-2*np.log(r)))
+    else:
+        sd = np.std(vals)
+    return max(float(sd),1e-6) * n**(-1/6)
+#--------------------------------------------------------------------
+def binned_kde(xs, ys, periodic=(False,False), bandwidth=None, bw_scale=1.0, bins=BINS):
+    """Density grid (rows y, columns x) and the bin centres of each axis.
+
+    bandwidth is per axis in data units, by default Scott's rule times bw_scale.
+    """
+    vals = [np.asarray(xs,dtype=np.float64),np.asarray(ys,dtype=np.float64)]
+    ok = np.isfinite(vals[0]) & np.isfinite(vals[1])
+    vals = [v[ok] for v in vals]
+    if bandwidth is None:
+        bandwidth = [scott_bandwidth(v,p)*bw_scale for v,p in zip(vals,periodic)]
+    ranges = []
+    for v,p,bw in zip(vals,periodic,bandwidth):
+        if p:
+            ranges.append((-180.0,180.0))
+        elif len(v) > 0:
+            ranges.append((v.min() - 3*bw,v.max() + 3*bw))
+        else:
+            ranges.append((0.0,1.0))
+    counts,xe,ye = np.histogram2d(vals[0],vals[1],bins=bins,range=ranges)
+    widths = [(r[1] - r[0])/bins for r in ranges]
+    sigma = [bw/w for bw,w in zip(bandwidth,widths)]
+    modes = ["wrap" if p else "constant" for p in periodic]
+    grid = ndimage.gaussian_filter(counts,sigma=sigma,mode=modes,truncate=4.0)
+    total = grid.sum() * widths[0] * widths[1]
+    if total > 0:
+        grid = grid / total
+    return grid.T, (xe[:-1] + xe[1:])/2, (ye[:-1] + ye[1:])/2
+#--------------------------------------------------------------------
+def fingerprint(df, x, y):
+    # order-independent content hash of the two columns, as the density does not depend on row order
+    hashed = pd.util.hash_pandas_object(df[[x,y]],index=False).to_numpy()
+    return len(df.index), int(hashed.sum(dtype=np.uint64))
+#--------------------------------------------------------------------
+def density_grid(df, x, y, bw_scale=1.0, bins=BINS):
+    """binned_kde of two dataframe columns, cached per (data, axes, bandwidth, bins)."""
+    key = (fingerprint(df,x,y),x,y,bw_scale,bins)
+    if key in _GRIDS:
+        _GRIDS.move_to_end(key)
+        return _GRIDS[key]
+    result = binned_kde(df[x],df[y],periodic=(is_angular(x),is_angular(y)),bw_scale=bw_scale,bins=bins)
+    _GRIDS[key] = result
+    if len(_GRIDS) > MAX_CACHED:
+        _GRIDS.popitem(last=False)
+    return result
+#--------------------------------------------------------------------
+def density_contour(df, x, y, bw_scale=1.0, bins=BINS, width=500, height=500, title=""):
+    """A filled contour figure of the density of x against y, in place of px.density_contour."""
+    if not (pd.api.types.is_numeric_dtype(df[x]) and pd.api.types.is_numeric_dtype(df[y])):
+        # categorical axes are counted by plotly as before
+        fig = px.density_contour(df,x=x,y=y,title=title,width=width,height=height)
+        fig.update_traces(contours_coloring="fill",contours_showlabels=True)
+        return fig
+    grid,xc,yc = density_grid(df,x,y,bw_scale=bw_scale,bins=bins)
+    fig = go.Figure(go.Contour(x=xc,y=yc,z=grid,colorscale="Viridis",ncontours=12,
+                               contours=dict(coloring="fill",showlabels=True),
+                               colorbar=dict(title="density",exponentformat="e")))
+    fig.update_layout(title=title,width=width,height=height,xaxis_title=x,yaxis_title=y)
+    if is_angular(x):
+        fig.update_xaxes(range=[-180,180])
+    if is_angular(y):
+        fig.update_yaxes(range=[-180,180])
+    return fig
@@ -0,0 +1,205 @@
+import json
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from shared import atom_arrays as ar
+
+# Multi-model structures (NMR ensembles) and multi-frame coordinate files (MD runs).
+# The topology is taken from the first model and the coordinates of every model are kept as a
+# (frames x atoms x 3) float32 array, written to a memory-mapped .npy file when a cache directory
+# is given. Simple geos are then evaluated across all frames at once.
+# A cached .npy is reused while the source file has the same modification time and size (kept in
+# a small .json stamp beside it). A new one is written to a temporary file and moved into place,
+# so a session that has the old file mapped keeps reading it rather than a truncated file.
+
+class Ensemble:
+    def __init__(self, topology, frames):
+        self.topology = topology    # AtomArrays of the first model
+        self.frames = frames        # (frames, atoms, 3)
+
+    @property
+    def pdb_code(self):
+        return self.topology.pdb_code
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+#--------------------------------------------------------------------
+def read_topology(lines, pdb_code):
+    chain,rid,aa,atom,element,bfactor,occupancy,disordered,coords = [],[],[],[],[],[],[],[],[]
+    for line in lines:
+        altloc = line[16]
+        chain.append(line[21])
+        rid.append(int(line[22:26]))
+        aa.append(line[17:20].strip())
+        name = line[12:16].strip()
+        atom.append(name)
+        element.append(name[0])
+        occ = float(line[54:60]) if len(line.strip()) > 54 and line[54:60].strip() else 1.0
+        occupancy.append(occ)
+        bfactor.append(float(line[60:66]) if line[60:66].strip() else 0.0)
+        disordered.append(altloc != " " or occ < 1)
+        coords.append((float(line[30:38]),float(line[38:46]),float(line[46:54])))
+    ridx = pd.factorize(pd.MultiIndex.from_arrays([chain,rid]))[0] + 1 if len(rid) > 0 else []
+    return ar.AtomArrays(pdb_code,-1,np.array(chain,dtype=object),np.array(rid,dtype=np.int64),
+                         np.array(ridx,dtype=np.int64),np.array(aa,dtype=object),np.array(atom,dtype=object),
+                         np.array(element,dtype=object),np.array(bfactor,dtype=np.float32),
+                         np.array(occupancy,dtype=np.float32),np.array(disordered,dtype=bool),
+                         np.array(coords,dtype=np.float32).reshape(-1,3))
+#--------------------------------------------------------------------
+def load_ensemble(filepath, pdb_code=None, cache_dir=None, coords_path=None):
+    """Loads every MODEL of a pdb format file, or a (frames, atoms, 3) .npy trajectory with coords_path.
+
+    Later models are matched to the first by (chain, rid, atom name) so differing atom order or missing atoms are
+    tolerated (missing atoms are NaN). With cache_dir the frames are written to and returned as a memory-mapped .npy.
+    """
+    if pdb_code is None:
+        pdb_code = os.path.basename(filepath).split(".")[0]
+    with open(filepath) as fr:
+        lines = fr.readlines()
+    starts = [i for i,line in enumerate(lines) if line[:6] == "MODEL "]
+    if len(starts) == 0:
+        starts = [0]
+    bounds = starts[1:] + [len(lines)]
+    first = model_records(lines[starts[0]:bounds[0]])
+    topology = read_topology(first,pdb_code)
+    if coords_path is not None:
+        frames = np.load(coords_path,mmap_mode="r")
+        if frames.shape[1] != len(topology):
+            raise ValueError(f"Trajectory has {frames.shape[1]} atoms but the topology has {len(topology)}")
+        return Ensemble(topology,frames)
+    shape = (len(starts),len(topology),3)
+    if cache_dir is not None:
+        os.makedirs(cache_dir,exist_ok=True)
+        npy_path = os.path.join(cache_dir,f"{pdb_code}_frames.npy")
+        stamp = source_stamp(filepath)
+        frames = cached_frames(npy_path,stamp,shape)
+        if frames is not None:
+            return Ensemble(topology,frames)
+        tmp_path = f"{npy_path}.{uuid.uuid4().hex[:8]}.tmp"
+        frames = np.lib.format.open_memmap(tmp_path,mode="w+",dtype=np.float32,shape=shape)
+    else:
+        frames = np.empty(shape,dtype=np.float32)
+    first_keys = [atom_key(l) for l in first]
+    keys = pd.MultiIndex.from_arrays([topology.chain,topology.rid,topology.atom])
+    for f,(s,e) in enumerate(zip(starts,bounds)):
+        recs = model_records(lines[s:e])
+        xyz = np.array([(float(l[30:38]),float(l[38:46]),float(l[46:54])) for l in recs],dtype=np.float32).reshape(-1,3)
+        if [atom_key(l) for l in recs] == first_keys:
+            frames[f] = xyz
+        else:
+            model_keys = pd.MultiIndex.from_arrays([[l[21] for l in recs],[int(l[22:26]) for l in recs],[l[12:16].strip() for l in recs]])
+            idx = model_keys.get_indexer(keys)
+            frames[f] = np.nan
+            frames[f,idx >= 0] = xyz[idx[idx >= 0]]
+    if cache_dir is not None:
+        frames.flush()
+        del frames
+        os.replace(tmp_path,npy_path)
+        write_stamp(npy_path,stamp)
+        frames = np.load(npy_path,mmap_mode="r")
+    return Ensemble(topology,frames)
+#--------------------------------------------------------------------
+def source_stamp(filepath):
+    st = os.stat(filepath)
+    return {"mtime_ns":st.st_mtime_ns,"size":st.st_size}
+#--------------------------------------------------------------------
+def write_stamp(npy_path, stamp):
+    tmp_path = f"{npy_path}.{uuid.uuid4().hex[:8]}.json.tmp"
+    with open(tmp_path,"w") as fw:
+        json.dump(stamp,fw)
+    os.replace(tmp_path,npy_path + ".json")
+#--------------------------------------------------------------------
+def cached_frames(npy_path, stamp, shape):
+    """The cached frames memory-mapped, if they were written from the source as it is now, else None."""
+    try:
+        with open(npy_path + ".json") as fr:
+            if json.load(fr) != stamp:
+                return None
+        frames = np.load(npy_path,mmap_mode="r")
+    except (OSError,ValueError):
+        return None
+    return frames if frames.shape == shape else None
+#--------------------------------------------------------------------
+def model_records(lines):
+    # atom records of one model, taking the first alternate location
+    return [l for l in lines if (l[:6] == "ATOM  " or l[:6] == "HETATM") and l[16] in [" ","A"]]
+#--------------------------------------------------------------------
+def atom_key(line):
+    return line[12:16] + line[17:27]
+#--------------------------------------------------------------------
+def parse_simple_geo(geo):
+    """[(atom name, residue offset)] of a geo made only of atom names with optional +/- offsets."""
+    atoms = []
+    for g in geo.split(":"):
+        if any(c in g for c in "{}()[]@&|"):
+            raise ValueError(f"Only simple atom geos can be calculated over ensembles: {geo}")
+        if "+" in g:
+            name,off = g.split("+")
+            atoms.append((name,int(off)))
+        elif "-" in g:
+            name,off = g.split("-")
+            atoms.append((name,-int(off)))
+        else:
+            atoms.append((g,0))
+    if len(atoms) < 2 or len(atoms) > 4:
+        raise ValueError(f"A geo needs 2, 3 or 4 atoms: {geo}")
+    return atoms
+#--------------------------------------------------------------------
+def geo_values(xyz):
+    """Distance, angle or dihedral over the last axis for a list of 2, 3 or 4 (..., 3) arrays."""
+    if len(xyz) == 2:
+        return np.linalg.norm(xyz[0] - xyz[1],axis=-1)
+    if len(xyz) == 3:
+        ba = xyz[0] - xyz[1]
+        bc = xyz[2] - xyz[1]
+        cos = (ba*bc).sum(axis=-1) / (np.linalg.norm(ba,axis=-1)*np.linalg.norm(bc,axis=-1))
+        return np.degrees(np.arccos(np.clip(cos,-1,1)))
+    return ar.dihedrals(*xyz)
+#--------------------------------------------------------------------
+def calculate(ens, geos):
+    """One row per (model, residue) with a column per geo, all frames evaluated in one pass per geo."""
+    top = ens.topology
+    res_keys = pd.MultiIndex.from_arrays([top.chain,top.rid])
+    _,first_atom = np.unique(pd.factorize(res_keys)[0],return_index=True)
+    r_chain = top.chain[first_atom]
+    r_rid = top.rid[first_atom]
+    atom_keys = pd.MultiIndex.from_arrays([top.chain,top.rid,top.atom])
+    n_frames = len(ens)
+    vals = {}
+    for geo in geos:
+        idx = []
+        for name,off in parse_simple_geo(geo):
+            idx.append(atom_keys.get_indexer(pd.MultiIndex.from_arrays([r_chain,r_rid + off,np.full(len(r_rid),name,dtype=object)])))
+        found = np.all(np.array(idx) >= 0,axis=0)
+        out = np.full((n_frames,len(r_rid)),np.nan,dtype=np.float32)
+        if found.any():
+            xyz = [np.asarray(ens.frames[:,i[found],:],dtype=np.float64) for i in idx]
+            out[:,found] = geo_values(xyz)
+        vals[geo] = out
+    df = pd.DataFrame({geo:vals[geo].ravel() for geo in geos})
+    df["pdb_code"] = ens.pdb_code
+    df["model"] = np.repeat(np.arange(1,n_frames+1),len(r_rid))
+    df["aa"] = np.tile(top.aa[first_atom],n_frames)
+    df["chain"] = np.tile(r_chain,n_frames)
+    df["rid"] = np.tile(r_rid,n_frames)
+    return df.dropna(subset=list(geos),how="all").reset_index(drop=True)
+#--------------------------------------------------------------------
+def aggregate(df_ens, geos):
+    """Per-residue mean and SD across models; dihedrals (4 atom geos) use the circular mean and SD."""
+    keys = ["pdb_code","chain","rid","aa"]
+    grouped = df_ens.groupby(keys,sort=False)
+    out = grouped.size().rename("models").reset_index()
+    for geo in geos:
+        if len(geo.split(":")) == 4:
+            rad = np.radians(df_ens[geo])
+            trig = pd.DataFrame({"s":np.sin(rad),"c":np.cos(rad)}).groupby([df_ens[k] for k in keys],sort=False).mean()
+            r = np.clip(np.hypot(trig["s"],trig["c"]),1e-12,1)
+            out[f"mean_{geo}"] = np.degrees(np.arctan2(trig["s"],trig["c"])).to_numpy()
+            sd = np.degrees(np.sqrt(np.abs(-2*np.log(r)))).to_numpy()
+            out[f"sd_{geo}"] = np.where(grouped[geo].count().to_numpy() > 1,sd,np.nan)
+        else:
+            out[f"mean_{geo}"] = grouped[geo].mean().to_numpy()
+            out[f"sd_{geo}"] = grouped[geo].std().to_numpy()
+    return out
@@ -0,0 +1,166 @@
+import gzip
+import io
+import os
+import shutil
+import time
+import uuid
+import zipfile
+import streamlit as st
+from shared import config as cfg
+from shared import lazy
+pa = lazy.load("pyarrow")
+pq = lazy.load("pyarrow.parquet")
+
+# Exports of result dataframes to files.
+# A dataframe is written in batches of cfg.EXPORT_BATCH_ROWS rows to Parquet (zstd), Arrow IPC
+# (zstd) or gzipped CSV, each batch converted and written before the next, so the file is never
+# built whole in memory as it is by a CSV download from the table. A result can be partitioned by
+# a column into one file per value (pdb_code=1t29/part-0.parquet, as pyarrow and pandas read a
+# partitioned dataset), zipped without recompression for download. Exports are written under
+# cfg.EXPORT_DIR, where they can be picked up directly when the app runs locally, and are removed
+# after cfg.EXPORT_KEEP_SECONDS.
+
+FORMATS = {"parquet":".parquet","arrow":".arrow","csv.gz":".csv.gz"}
+MIMES = {"parquet":"application/vnd.apache.parquet","arrow":"application/vnd.apache.arrow.file",
+         "csv.gz":"application/gzip","zip":"application/zip"}
+
+class Writer:
+    """Writes dataframes one after another in the format to an open binary file, which the caller closes."""
+    def __init__(self, fw, fmt, schema=None):
+        self.fw = fw
+        self.fmt = fmt
+        self.schema = schema
+        self.sink = None
+        self.rows = 0
+
+    def open(self):
+        if self.fmt == "csv.gz":
+            # closing these leaves fw open
+            self.sink = io.TextIOWrapper(gzip.GzipFile(fileobj=self.fw,mode="wb"),newline="")
+        elif self.fmt == "parquet":
+            self.sink = pq.ParquetWriter(self.fw,self.schema,compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+            self.sink = pa.ipc.new_file(self.fw,self.schema,options=options)
+
+    def write(self, df):
+        if self.fmt != "csv.gz" and self.schema is None:
+            self.schema = pa.Schema.from_pandas(df,preserve_index=False)
+        if self.sink is None:
+            self.open()
+        if self.fmt == "csv.gz":
+            df.to_csv(self.sink,header=self.rows == 0,index=False)
+        else:
+            self.sink.write_table(pa.Table.from_pandas(df,schema=self.schema,preserve_index=False))
+        self.rows += len(df.index)
+
+    def close(self):
+        if self.sink is None and (self.fmt == "csv.gz" or self.schema is not None):
+            # nothing was written, but the file should still be a valid empty one
+            self.open()
+        if self.sink is not None:
+            self.sink.close()
+
+#--------------------------------------------------------------------
+def batches(df, rows=None):
+    """Consecutive slices of df of at most rows rows, and one empty slice of an empty df so its columns are written."""
+    rows = rows or cfg.EXPORT_BATCH_ROWS
+    for start in range(0,max(len(df.index),1),rows):
+        yield df.iloc[start:start + rows]
+#--------------------------------------------------------------------
+def write(frames, path, fmt, schema=None):
+    """Writes an iterable of dataframes to one file and returns the rows written."""
+    with open(path,"wb") as fw:
+        writer = Writer(fw,fmt,schema)
+        try:
+            for df in frames:
+                writer.write(df)
+        finally:
+            writer.close()
+    return writer.rows
+#--------------------------------------------------------------------
+def write_partitioned(df, directory, fmt, column):
+    """One file per value of column, under directory/column=value/, and the paths written."""
+    paths = []
+    schema = None if fmt == "csv.gz" else pa.Schema.from_pandas(df.drop(columns=[column]),preserve_index=False)
+    for value,group in df.groupby(column,sort=False,observed=True,dropna=False):
+        part = os.path.join(directory,f"{column}={safe_name(value)}")
+        os.makedirs(part,exist_ok=True)
+        path = os.path.join(part,"part-0" + FORMATS[fmt])
+        # the column is in the directory name, as in a hive partitioned dataset
+        write(batches(group.drop(columns=[column])),path,fmt,schema)
+        paths.append(path)
+    return paths
+#--------------------------------------------------------------------
+def safe_name(value):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(value))
+#--------------------------------------------------------------------
+def zip_dir(directory):
+    # the files are compressed already, so they are only stored
+    path = directory.rstrip("/") + ".zip"
+    with zipfile.ZipFile(path,"w",compression=zipfile.ZIP_STORED,allowZip64=True) as zf:
+        for root,_,files in os.walk(directory):
+            for f in sorted(files):
+                full = os.path.join(root,f)
+                zf.write(full,os.path.relpath(full,os.path.dirname(directory.rstrip("/"))))
+    return path
+#--------------------------------------------------------------------
+def prune(now):
+    if not os.path.isdir(cfg.EXPORT_DIR):
+        return
+    for f in os.listdir(cfg.EXPORT_DIR):
+        path = os.path.join(cfg.EXPORT_DIR,f)
+        try:
+            if now - os.path.getmtime(path) <= cfg.EXPORT_KEEP_SECONDS:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass    # removed by another session meanwhile
+#--------------------------------------------------------------------
+def export(df, name, fmt, partition=None):
+    """Writes df under cfg.EXPORT_DIR, partitioned by a column if given, and returns the file to hand out."""
+    prune(time.time())
+    base = os.path.join(cfg.EXPORT_DIR,f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}")
+    os.makedirs(cfg.EXPORT_DIR,exist_ok=True)
+    if partition is None:
+        path = base + FORMATS[fmt]
+        write(batches(df),path,fmt,None if fmt == "csv.gz" else pa.Schema.from_pandas(df,preserve_index=False))
+        return path
+    write_partitioned(df,base,fmt,partition)
+    return zip_dir(base)
+#--------------------------------------------------------------------
+def read_file(path):
+    with open(path,"rb") as fr:
+        return fr.read()
+#--------------------------------------------------------------------
+def export_controls(df, name):
+    """Format and partition choices, and the exported file to download or pick up locally."""
+    state = f"{name}_export"
+    cols = st.columns([2,2,1])
+    with cols[0]:
+        fmt = st.selectbox("Export format",list(FORMATS),key=f"{name}_export_format")
+    with cols[1]:
+        options = ["none"] + [c for c in ["pdb_code","chain","aa"] if c in df.columns]
+        partition = st.selectbox("One file per",options,key=f"{name}_export_partition")
+    with cols[2]:
+        if st.button("Export",key=f"{name}_export_button"):
+            try:
+                st.session_state[state] = export(df,name,fmt,None if partition == "none" else partition)
+            except (OSError,ValueError,TypeError,pa.ArrowException) as e:
+                # e.g. a full disk, or object columns of mixed types that arrow cannot convert
+                st.error(f"Could not export: {e}")
+    path = st.session_state.get(state)
+    if path is None or not os.path.exists(path):
+        return
+    size = os.path.getsize(path)
+    st.write(f"Exported {os.path.basename(path)} ({size/1e6:,.1f} MB) to {os.path.abspath(path)}")
+    if size <= cfg.EXPORT_DOWNLOAD_MB * 1e6:
+        kind = next((k for k,ext in FORMATS.items() if path.endswith(ext)),"zip")
+        # read when the button is clicked, not on every rerun
+        st.download_button("Download",data=lambda: read_file(path),file_name=os.path.basename(path),
+                           mime=MIMES.get(kind),key=f"{name}_export_download")
+    else:
+        st.write(f"Too large to download here (over {cfg.EXPORT_DOWNLOAD_MB:,} MB), copy it from the path above")
@@ -1,15 +1,38 @@
 import streamlit as st
-from maptial.geo import pdbloader as pl
-from maptial.geo import pdbgeometry as pg
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objs as go
 from shared import config as cfg
+from shared import ramachandran as rama
+from shared import residue_profile as rp
+from shared import plot_lod as lod
+from shared import density as de
+from shared import tracing as tr
 import numpy as np
-import math
+from shared import lazy
+pl = lazy.load("maptial.geo.pdbloader")
+pg = lazy.load("maptial.geo.pdbgeometry")
+px = lazy.load("plotly.express")
+go = lazy.load("plotly.graph_objs")
+ps = lazy.load("shared.pair_search")
 
 
+def lod_ranges(df, x, y, key):
+    # axis ranges so that a region of a large result can be seen point for point
+    if len(df.index) <= lod.MAX_POINTS:
+        return None,None
+    ranges = []
+    with st.expander("Zoom to a region"):
+        for ax,name in [(x,"x"),(y,"y")]:
+            rng = None
+            if pd.api.types.is_numeric_dtype(df[ax]) and not lod.is_discrete(df[ax]):
+                lo,hi = float(np.nanmin(df[ax])),float(np.nanmax(df[ax]))
+                if lo < hi:
+                    sel = st.slider(f"{ax} range",lo,hi,(lo,hi),key=f"{key}_{name}")
+                    if sel != (lo,hi):
+                        rng = sel
+            ranges.append(rng)
+    return ranges[0],ranges[1]
 
+@tr.traced("geo_plot")
 def geo_plot(df_geos):
     cfg.init()
     if df_geos is not None:        
@@ -25,26 +48,33 @@ def geo_plot(df_geos):
                 y_ax1 = st.selectbox("y-axis",ax_cols,index=1)
             with cols[3]:
                 z_ax1 = st.selectbox("z-axis (hue)",ax_colsZ,index=3)
+            if z_ax1 == "Probability density plot":
+                bw_scale = st.select_slider("Density bandwidth (times Scott's rule)",[0.25,0.5,1.0,2.0,4.0],value=1.0)
+                x_range,y_range = None,None
+            else:
+                x_range,y_range = lod_ranges(df_geos,x_ax1,y_ax1,"geo_plot")
                     
             if st.button("Calculate geo plot"):                    
                 cols = st.columns([1,5,1])                
                 with cols[1]:                                                                    
                     if z_ax1 == "Probability density plot":
-                        fig = px.density_contour(df_geos, x=x_ax1, y=y_ax1, title="",width=500, height=500)
-                        fig.update_traces(contours_coloring="fill", contours_showlabels = True)
+                        fig = de.density_contour(df_geos, x=x_ax1, y=y_ax1, bw_scale=bw_scale, title="",width=500, height=500)
                     else:                        
-                        fig = px.scatter(df_geos, x=x_ax1, y=y_ax1, color=z_ax1,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
-                    st.plotly_chart(fig, use_container_width=False)     
+                        fig,note = lod.scatter(df_geos, x=x_ax1, y=y_ax1, color=z_ax1,x_range=x_range,y_range=y_range,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
+                        if note:
+                            st.caption(note)
+                    tr.plotly_chart(fig, use_container_width=False)     
                 
+@tr.traced("geo_plot_ramachandran")
 def geo_plot_ramachandran(df_geos):
-    from PIL import Image    
-    img1 = Image.open("app/static/rama_all.png")
-    img2 = Image.open("app/static/rama_pro.png")
-    img3 = Image.open("app/static/rama_gly.png")
+    img1 = lazy.image("app/static/rama_all.png")
+    img2 = lazy.image("app/static/rama_pro.png")
+    img3 = lazy.image("app/static/rama_gly.png")
     if df_geos is not None:        
         if len(df_geos.index) > 0:
             st.write("### Overlay Ramachandran")            
-            ax_colsZ = list(df_geos.columns)[2:7] + ["bf_C-1:N:CA:C","bf_N:CA:C:N+1"]
+            df_geos = rama.classify(df_geos)
+            ax_colsZ = list(df_geos.columns)[2:7] + ["bf_C-1:N:CA:C","bf_N:CA:C:N+1","rama_region","rama_score"]
             x_ax1 = "C-1:N:CA:C"
             y_ax1 = "N:CA:C:N+1"
             cols = st.columns([1,2,5])
@@ -76,8 +106,14 @@ def geo_plot_ramachandran(df_geos):
                             bargap = 0,  hovermode = 'closest',  showlegend = True
                         )  
                         fig.add_layout_image(dict(source=img, xref="x", yref="y", x=0,y=180, xanchor="center", sizex=360, sizey=360, sizing="stretch", opacity=0.35, layer="below"))                                                                                       
-                        st.plotly_chart(fig, use_container_width=False)     
+                        tr.plotly_chart(fig, use_container_width=False)     
+                st.write("Approximate Ramachandran regions per structure")
+                st.caption("The regions are a smoothed model of the Lovell 2003 contours rather than a reference dataset, so are a rough guide and not a validation.")
+                st.dataframe(rama.summary(df_geos),hide_index=True)
+                with st.expander("Expand residues in unusual regions"):
+                    st.dataframe(df_geos[df_geos.rama_region == rama.REGIONS[2]])
 
+@tr.traced("space_plot")
 def space_plot(df_atoms):
     cfg.init()
     if df_atoms is not None and len(df_atoms.index) > 0:
@@ -85,27 +121,31 @@ def space_plot(df_atoms):
         ax_cols = list(["x","y","z"])
         ax_colsZ = list(df_atoms.columns)
 
-        #dim = st.radio("dimensions",["1d","2d","3d"],index=1)
-        dim = "3d"
+        dim = st.radio("dimensions",["1d","3d"],index=1,horizontal=True)
 
-        cols = st.columns([2,2,1])
-        with cols[0]:
-            #pdb = st.selectbox("pdb", ["all"] + list(df_atoms["pdb_code"].unique()),index=0)
-            pdb = st.selectbox("pdb", list(df_atoms["pdb_code"].unique()),index=0)
-                                                                        
         if dim == "1d":
             st.write("Comparitive structures through 1d plots of distance, chain A")
-            cols = st.columns([5,1,5])            
-            min_rid = min(df_atoms.loc[df_atoms['atom'] == "CA"]["rid"])
-            max_rid = max(df_atoms.loc[df_atoms['atom'] == "CA"]["rid"])            
+            blocks = rp.cached_blocks(df_atoms,"A","CA")
+            if len(blocks) == 0:
+                st.write("No CA atoms in chain A")
+                return
+            min_rid = int(min(rid.min() for rid,xyz in blocks.values()))
+            max_rid = int(max(rid.max() for rid,xyz in blocks.values()))
+            cols = st.columns([5,1,5])
             with cols[0]:
                 start_rid,end_rid = st.slider('Select start/end residues', min_rid, max_rid, (min_rid, max_rid))
             with cols[2]:
-                rid_val = st.slider("Residue from which distance calculated",min_value = start_rid,max_value=end_rid,step=1)                                    
-            df_ca = df_atoms.loc[df_atoms['atom'] == "CA"]
-            df_ca = df_ca.loc[df_ca['chain'] == "A"]
-            matching_pdbs = set(df_ca.loc[df_ca["rid"] == rid_val]["pdb_code"].to_list())
-            st.write(matching_pdbs)
+                rid_val = st.slider("Residue from which distance calculated",min_value = start_rid,max_value=end_rid,step=1)
+            df_ca = rp.profile(blocks,rid_val,start_rid,end_rid)
+            st.write(set(df_ca["pdb_code"]))
+            cols = st.columns([1,5,1])
+            with cols[1]:
+                fig = px.scatter(df_ca, x="rid", y="pdb_code", color="magnitude",title=f"Magnitude from rid {rid_val}",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
+                fig.add_vline(x=rid_val, line_width=0.5, line_dash="dash", line_color="red")
+                fig.update_xaxes(tickangle=45)
+                fig.update_yaxes(tickangle=-15)
+                tr.plotly_chart(fig, use_container_width=False)
+            return
         else:            
             #with cols[1]:
             #    x_ax1 = st.selectbox("x-axis", ax_cols,index=0)
@@ -118,6 +158,10 @@ def space_plot(df_atoms):
             #        h_ax1 = st.selectbox("hue",ax_colsZ,index=0)        
             #else:
             x_ax1,y_ax1,z_ax1 = "x","y","z"
+            # the 1d profiles compare every structure, the 3d plot is of one
+            cols = st.columns([2,2,1])
+            with cols[0]:
+                pdb = st.selectbox("pdb", list(df_atoms["pdb_code"].unique()),index=0)
             with cols[1]:
                 h_ax1 = st.selectbox("hue",ax_colsZ,index=0)
                 
@@ -128,64 +172,32 @@ def space_plot(df_atoms):
         if st.button("Calculate geo plot"):                    
             cols = st.columns([1,5,1])
             with cols[1]:                
-                if dim == "1d":
-                    df_ca = df_use.loc[df_use['atom'] == "CA"]
-                    df_ca = df_ca.loc[df_ca['chain'] == "A"]
-                    df_ca = df_ca.loc[df_ca['rid'] >= start_rid]
-                    df_ca = df_ca.loc[df_ca['rid'] <= end_rid]
-                    df_ca = df_ca[df_ca["pdb_code"].isin(matching_pdbs)]
-                    df_ca["magnitude"] = -1
-                    for idx, row in df_ca.iterrows():
-                        this_pdb = row["pdb_code"]                        
-                        if rid_val in list(df_ca.loc[df_ca['pdb_code'] == this_pdb]["rid"]):
-                            try:
-                                df_one = df_ca.loc[df_ca['pdb_code'] == this_pdb]
-                                df_two = df_one.loc[df_one['rid'] == rid_val]
-                                if len(df_two["x"]) > 1:
-                                    print(df_two)             
-                                root_x = float(df_two["x"])
-                                root_y = float(df_two["y"])
-                                root_z = float(df_two["z"])
-                                this_x = float(row["x"])
-                                this_y = float(row["y"])
-                                this_z = float(row["z"])
-                                magnitude = float(math.sqrt((root_x - this_x)*(root_x - this_x)+(root_y - this_y)*(root_y - this_y)+(root_z - this_z)*(root_z - this_z)))
-                                pd.options.mode.chained_assignment = None                                
-                                df_ca.loc[idx, 'magnitude'] = float(magnitude)
-                            except Exception  as e:
-                                print(e)
-                    df_ca = df_ca.loc[df_ca["magnitude"] >= 0]
-                    fig = px.scatter(df_ca, x="rid", y="pdb_code", color="magnitude",title=f"Magnitude from rid {rid_val}",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)                        
-                    fig.add_vline(x=rid_val, line_width=0.5, line_dash="dash", line_color="red")
-                    fig.update_xaxes(tickangle=45)
-                    fig.update_yaxes(tickangle=-15)
-                    st.plotly_chart(fig, use_container_width=False)
-                elif dim == "2d":
-                    fig = px.scatter(df_use, x=x_ax1, y=y_ax1, color=h_ax1,title="",width=500, height=500, 
-                                     opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)                        
-                    st.plotly_chart(fig, use_container_width=False)
+                # Check if the hue column is categorical or numeric
+                if df_use[h_ax1].dtype == 'object' or df_use[h_ax1].dtype.name == 'category':
+                    # Use discrete colors for categorical data
+                    fig,note = lod.scatter_3d(df_use, x=x_ax1, y=y_ax1, z=z_ax1, color=h_ax1,title="",
+                        width=500, height=500, opacity=0.5,
+                        color_discrete_sequence=px.colors.qualitative.Plotly)
                 else:
-                    # Check if the hue column is categorical or numeric
-                    if df_use[h_ax1].dtype == 'object' or df_use[h_ax1].dtype.name == 'category':
-                        # Use discrete colors for categorical data
-                        fig = px.scatter_3d(df_use, x=x_ax1, y=y_ax1, z=z_ax1, color=h_ax1,title="",
-                            width=500, height=500, opacity=0.5,
-                            color_discrete_sequence=px.colors.qualitative.Plotly)
-                    else:
-                        # Use continuous color scale for numeric data
-                        fig = px.scatter_3d(df_use, x=x_ax1, y=y_ax1, z=z_ax1, color=h_ax1,title="",
-                            width=500, height=500, opacity=0.5,
-                            color_continuous_scale="Sunset_r")
-                    fig.update_traces(marker=dict(size=5,line=dict(width=0,color='silver')),selector=dict(mode='markers'))
-                    st.plotly_chart(fig, use_container_width=False)
+                    # Use continuous color scale for numeric data
+                    fig,note = lod.scatter_3d(df_use, x=x_ax1, y=y_ax1, z=z_ax1, color=h_ax1,title="",
+                        width=500, height=500, opacity=0.5,
+                        color_continuous_scale="Sunset_r")
+                fig.update_traces(marker=dict(size=5,line=dict(width=0,color='silver')),selector=lambda t: t.name != "density")
+                if note:
+                    st.caption(note)
+                tr.plotly_chart(fig, use_container_width=False)
 
+@tr.traced("contact_plot")
 def contact_plot(df_geo):
     print("DEBUG 1")
     cfg.init()
     if df_geo is not None and len(df_geo.index) > 0:
         st.write("### (3/3) Visualisation")
-        cols = df_geo.columns
         geo = df_geo.columns[0]
+        # both directions of each contact, when a symmetric search gave them once
+        df_geo = ps.mirror(df_geo,geo)
+        cols = df_geo.columns
         # we want to rename all columns so that the val_key is replaced with "contact"
         for col in cols:            
             df_geo = df_geo.rename(columns={col:col.replace(geo,"geo")})
@@ -196,7 +208,6 @@ def contact_plot(df_geo):
                 
         ax_colsZ = list(df_geo.columns)
 
-        dim = "2d"#st.radio("dimensions",["2d","3d"],index=0)
                                                                         
         cols = st.columns([1,6,6,1])
         with cols[1]:
@@ -208,13 +219,16 @@ def contact_plot(df_geo):
         if pdb != "all":
             df_geo = df_geo[df_geo['pdb_code'] == pdb]
         print("DEBUG 2")
+        x_range,y_range = lod_ranges(df_geo,rid1,rid2,"contact_plot")
         if st.button("Calculate geo plot"):        
             print("DEBUG 3")
             cols = st.columns([1,5,1])
             with cols[1]:                                
-                fig = px.scatter(df_geo, x=rid1, y=rid2, color=h_ax1,title="",
+                fig,note = lod.scatter(df_geo, x=rid1, y=rid2, color=h_ax1,x_range=x_range,y_range=y_range,title="",
                                  width=500, height=500, opacity=0.7,
                                  color_continuous_scale=px.colors.sequential.Agsunset)                                            
+                if note:
+                    st.caption(note)
                                 
                 fig.update_layout(title=f"Contact map",autosize = False,
                         xaxis = dict(zeroline = False, domain = [0,0.85],showgrid = False,range=[-180,180]),
@@ -226,7 +240,20 @@ def contact_plot(df_geo):
                 fig.update_yaxes(range=(min(df_geo["rid"]),max(df_geo["rid"])),
                                  scaleanchor="x",
                                  scaleratio=1)                       
-                st.plotly_chart(fig, use_container_width=False)
+                tr.plotly_chart(fig, use_container_width=False)
+
+@tr.traced("deviation_plot")
+def deviation_plot(df_sup):
+    if df_sup is not None and len(df_sup.index) > 0 and st.button("Calculate deviation plot"):
+        cols = st.columns([1,5,5,1])
+        with cols[1]:
+            fig = px.scatter(df_sup, x="rid", y="deviation", color="pdb_code",title="CA deviation after superposition",
+                             width=500, height=500, opacity=0.7)
+            tr.plotly_chart(fig, use_container_width=False)
+        with cols[2]:
+            fig = px.scatter(df_sup, x="plddt", y="deviation", color="pdb_code",title="CA deviation against plDDT",
+                             width=500, height=500, opacity=0.7)
+            tr.plotly_chart(fig, use_container_width=False)
 
 # taken from 18.3. STRUCTURE QUALITY AND TARGET PARAMETERS
 # Table 18.3.2.3. Bond lengths (  ̊ A) and angles (°) of peptide backbone fragments
@@ -246,6 +273,7 @@ EH_2006_median["C-1:N:CA"]= (121.7,122,122.3)
 
 
 
+@tr.traced("val_plot")
 def val_plot(df_geos,geo):
     cfg.init()
     if df_geos is not None:        
@@ -277,7 +305,7 @@ def val_plot(df_geos,geo):
                                 
                                 fig.update_annotations(font=dict(color="black"))
                                 fig.update_traces(marker=dict(line=dict(width=0.2,color='white')))                                                         
-                                st.plotly_chart(fig, use_container_width=True)
+                                tr.plotly_chart(fig, use_container_width=True)
 
                 
                 for pdb in pdbs:            
@@ -305,7 +333,7 @@ def val_plot(df_geos,geo):
                             #    fig.update_traces(xbins=dict(size=0.0025))
                             #else:
                             #    fig.update_traces(xbins=dict(size=0.5))
-                            st.plotly_chart(fig, use_container_width=True)
+                            tr.plotly_chart(fig, use_container_width=True)
 
                                 
                     
\ No newline at end of file
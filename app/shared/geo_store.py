@@ -0,0 +1,215 @@
+import datetime
+import sqlite3
+import threading
+from contextlib import closing
+from importlib.metadata import version, PackageNotFoundError
+import numpy as np
+import pandas as pd
+from shared import config as cfg
+from shared import metadata_index as mi
+
+# Computed geometry kept across sessions.
+# Each (structure, geo, library version) is calculated once and appended in long format to the
+# geo_values table of the local SQLite database, alongside the structures metadata catalogue,
+# so aggregates across every stored structure can be answered in SQL without reloading any.
+# Any geo a visitor types is kept, so the store is bounded: runs of more than
+# cfg.GEO_STORE_RUN_ROWS rows are not kept at all, the least recently used runs are evicted once
+# the store holds more than cfg.GEO_STORE_MAX_ROWS, and rows of other library versions, which can
+# never be read again, are deleted the first time the store is opened by a process.
+
+try:
+    LIB_VERSION = version("maptial")
+except PackageNotFoundError:
+    LIB_VERSION = "unknown"
+# all-pairs searches are calculated by shared.pair_search, with symmetric pairs once
+LIB_VERSION += "+pairs1"
+
+HUES = ["pdb_code","resolution","aa","chain","rid"]
+PREFIXES = ["info","motif","occ","bf","rid2","rid3","rid4"]
+VALUE_COLUMNS = ["chain","rid","aa","value","info","motif","occ","bf","rid2","rid3","rid4"]
+# what saving a run can raise, which callers report and carry on from
+ERRORS = (sqlite3.Error,OSError)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geo_runs (
+    pdb_code TEXT,
+    geo TEXT,
+    version TEXT,
+    resolution REAL,
+    n_rows INTEGER,
+    computed_at TEXT,
+    used_at TEXT,
+    PRIMARY KEY (pdb_code, geo, version)
+);
+CREATE TABLE IF NOT EXISTS geo_values (
+    pdb_code TEXT,
+    geo TEXT,
+    version TEXT,
+    chain TEXT,
+    rid INTEGER,
+    aa TEXT,
+    value REAL,
+    info TEXT,
+    motif TEXT,
+    occ REAL,
+    bf REAL,
+    rid2 INTEGER,
+    rid3 INTEGER,
+    rid4 INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_geo_values_key ON geo_values(pdb_code, geo, version);
+CREATE INDEX IF NOT EXISTS idx_geo_values_geo_aa ON geo_values(geo, aa);
+"""
+INSERT_BATCH_ROWS = 50_000
+
+_opened = set()
+_opened_lock = threading.Lock()
+
+class Median:
+    """SQLite aggregate so that median(value) can be used in ad-hoc queries."""
+    def __init__(self):
+        self.vals = []
+    def step(self, value):
+        if value is not None:
+            self.vals.append(value)
+    def finalize(self):
+        if len(self.vals) == 0:
+            return None
+        return float(np.median(self.vals))
+
+#--------------------------------------------------------------------
+def connect(dbpath=None):
+    con = mi.connect(dbpath)
+    con.executescript(SCHEMA)
+    con.create_aggregate("median",1,Median)
+    with _opened_lock:
+        if (dbpath or cfg.DBPATH) not in _opened:
+            open_store(con)
+            _opened.add(dbpath or cfg.DBPATH)
+    return con
+#--------------------------------------------------------------------
+def open_store(con):
+    """Brings a store from an earlier version up to date and deletes the rows no longer readable."""
+    cols = [r[1] for r in con.execute("PRAGMA table_info(geo_runs)")]
+    with con:
+        if "used_at" not in cols:
+            con.execute("ALTER TABLE geo_runs ADD COLUMN used_at TEXT")
+            con.execute("UPDATE geo_runs SET used_at = computed_at")
+        con.execute("DELETE FROM geo_values WHERE version != ?",(LIB_VERSION,))
+        con.execute("DELETE FROM geo_runs WHERE version != ?",(LIB_VERSION,))
+#--------------------------------------------------------------------
+def is_storable(pdb_code):
+    # user uploads can be replaced under the same name so are never kept
+    return not pdb_code.startswith("user_")
+#--------------------------------------------------------------------
+def stored_geos(pdb_code, geos, dbpath=None):
+    """The subset of geos already computed for this structure with the current library."""
+    with closing(connect(dbpath)) as con:
+        rows = con.execute(f"SELECT geo FROM geo_runs WHERE pdb_code = ? AND version = ? AND geo IN ({','.join('?'*len(geos))})",
+                           [pdb_code,LIB_VERSION] + list(geos)).fetchall()
+    return {r[0] for r in rows}
+#--------------------------------------------------------------------
+def save(pdb_code, geo, df_geo, resolution=None, dbpath=None):
+    """Appends the single-geo dataframe of one structure, replacing any earlier run.
+
+    False when the run has too many rows to be kept.
+    """
+    n = len(df_geo.index)
+    if n > cfg.GEO_STORE_RUN_ROWS:
+        return False
+    columns = [df_geo["chain"],df_geo["rid"],df_geo["aa"],df_geo[geo]] + [df_geo[f"{prefix}_{geo}"] for prefix in PREFIXES]
+    # as python values a column at a time, with NaN as NULL
+    columns = [col.astype(object).where(col.notna(),None).tolist() for col in columns]
+    key = [pdb_code,geo,LIB_VERSION]
+    statement = f"INSERT INTO geo_values (pdb_code,geo,version,{','.join(VALUE_COLUMNS)}) VALUES ({','.join('?'*(len(VALUE_COLUMNS)+3))})"
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    with closing(connect(dbpath)) as con:
+        with con:
+            con.execute("DELETE FROM geo_values WHERE pdb_code = ? AND geo = ? AND version = ?",key)
+            for start in range(0,n,INSERT_BATCH_ROWS):
+                batch = [col[start:start + INSERT_BATCH_ROWS] for col in columns]
+                con.executemany(statement,(key + list(row) for row in zip(*batch)))
+            con.execute("INSERT OR REPLACE INTO geo_runs VALUES (?,?,?,?,?,?,?)",(pdb_code,geo,LIB_VERSION,resolution,n,now,now))
+        evict(con,cfg.GEO_STORE_MAX_ROWS)
+    return True
+#--------------------------------------------------------------------
+def evict(con, max_rows):
+    """Deletes the least recently used runs until the store holds no more than max_rows; the rows deleted."""
+    total = con.execute("SELECT COALESCE(SUM(n_rows),0) FROM geo_runs").fetchone()[0]
+    if total <= max_rows:
+        return 0
+    deleted = 0
+    runs = con.execute("SELECT pdb_code,geo,version,n_rows FROM geo_runs ORDER BY used_at,computed_at").fetchall()
+    with con:
+        for pdb_code,geo,ver,n_rows in runs:
+            if total - deleted <= max_rows:
+                break
+            con.execute("DELETE FROM geo_values WHERE pdb_code = ? AND geo = ? AND version = ?",(pdb_code,geo,ver))
+            con.execute("DELETE FROM geo_runs WHERE pdb_code = ? AND geo = ? AND version = ?",(pdb_code,geo,ver))
+            deleted += n_rows or 0
+    return deleted
+#--------------------------------------------------------------------
+def load(pdb_code, geo, dbpath=None):
+    """The stored values of one geo for one structure, in the calculateGeometry column layout."""
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    with closing(connect(dbpath)) as con:
+        res = con.execute("SELECT resolution FROM geo_runs WHERE pdb_code = ? AND geo = ? AND version = ?",(pdb_code,geo,LIB_VERSION)).fetchone()
+        df = pd.read_sql_query(f"SELECT {','.join(VALUE_COLUMNS)} FROM geo_values WHERE pdb_code = ? AND geo = ? AND version = ? ORDER BY rowid",
+                               con,params=(pdb_code,geo,LIB_VERSION))
+        with con:
+            con.execute("UPDATE geo_runs SET used_at = ? WHERE pdb_code = ? AND geo = ? AND version = ?",(now,pdb_code,geo,LIB_VERSION))
+    df_geo = pd.DataFrame({geo:df["value"],"pdb_code":pdb_code,"resolution":res[0] if res else None,
+                           "aa":df["aa"],"chain":df["chain"],"rid":df["rid"]})
+    for prefix in PREFIXES:
+        df_geo[f"{prefix}_{geo}"] = df[prefix]
+    return df_geo
+#--------------------------------------------------------------------
+def empty(geo):
+    """A single-geo dataframe with no rows, in the calculateGeometry column layout."""
+    return pd.DataFrame(columns=[geo] + HUES + [f"{prefix}_{geo}" for prefix in PREFIXES])
+#--------------------------------------------------------------------
+def widen(per_geo, geos):
+    """Combines single-geo dataframes of one structure as calculateGeometry would for the list of geos.
+
+    Rows are the per-residue cross product of each geo's matches, and residues missing any geo are dropped.
+    """
+    geos = list(dict.fromkeys(geos))
+    df = per_geo[geos[0]]
+    for geo in geos[1:]:
+        df = df.merge(per_geo[geo].drop(columns=["resolution"]),on=["pdb_code","aa","chain","rid"],how="inner")
+    cols = geos + HUES
+    for prefix in PREFIXES:
+        cols += [f"{prefix}_{geo}" for geo in geos]
+    return df[cols]
+#--------------------------------------------------------------------
+def sql(statement, params=(), dbpath=None):
+    """Ad-hoc SQL over geo_values, geo_runs and the structures catalogue, e.g.
+
+    SELECT v.aa, median(v.value) FROM geo_values v JOIN structures s USING (pdb_code)
+    WHERE v.geo = 'N:CA:C' AND s.method LIKE 'x-ray%' AND s.resolution < 1.5 GROUP BY v.aa
+    """
+    with closing(connect(dbpath)) as con:
+        return pd.read_sql_query(statement,con,params=params)
+#--------------------------------------------------------------------
+def aggregate(geo, by="aa", func="median", method=None, max_resolution=None, min_resolution=None, dbpath=None):
+    """An aggregate of one stored geo grouped by a geo_values or structures column."""
+    if func not in ["median","avg","min","max","count","sum"]:
+        raise ValueError(f"Unknown aggregate {func}")
+    if by not in VALUE_COLUMNS + mi.COLUMNS:
+        raise ValueError(f"Unknown grouping column {by}")
+    where = ["v.geo = ?","v.version = ?"]
+    params = [geo,LIB_VERSION]
+    if method is not None:
+        where.append("s.method LIKE ?")
+        params.append(f"%{method.lower()}%")
+    if max_resolution is not None:
+        where.append("s.resolution < ?")
+        params.append(max_resolution)
+    if min_resolution is not None:
+        where.append("s.resolution >= ?")
+        params.append(min_resolution)
+    prefix = "v" if by in VALUE_COLUMNS else "s"
+    statement = f"""SELECT {prefix}.{by} AS {by}, {func}(v.value) AS {func}, count(v.value) AS n
+                    FROM geo_values v LEFT JOIN structures s ON s.pdb_code = v.pdb_code
+                    WHERE {' AND '.join(where)} GROUP BY {prefix}.{by} ORDER BY {prefix}.{by}"""
+    return sql(statement,params,dbpath)
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from shared import atom_arrays as ar
+
+# Hydrogen bond search on heavy atoms.
+# Donors and acceptors are typed across backbone, side chains and water, candidate pairs within
+# the distance cutoff come from a KD-tree, and the angle criteria use each atom's antecedent
+# heavy atom in place of the (usually absent) hydrogen, all evaluated on whole arrays at once.
+
+MIN_DIS = 2.5
+MAX_DIS = 3.5
+MIN_ANGLE = 90
+
+# (atom, role, antecedent) with role D donor, A acceptor or DA both
+BACKBONE = [("N","D","CA"),("O","A","C"),("OXT","A","C")]
+SIDECHAINS = {}
+SIDECHAINS["ARG"] = [("NE","D","CD"),("NH1","D","CZ"),("NH2","D","CZ")]
+SIDECHAINS["ASN"] = [("ND2","D","CG"),("OD1","A","CG")]
+SIDECHAINS["ASP"] = [("OD1","A","CG"),("OD2","A","CG")]
+SIDECHAINS["GLN"] = [("NE2","D","CD"),("OE1","A","CD")]
+SIDECHAINS["GLU"] = [("OE1","A","CD"),("OE2","A","CD")]
+SIDECHAINS["HIS"] = [("ND1","DA","CG"),("NE2","DA","CD2")]
+SIDECHAINS["LYS"] = [("NZ","D","CE")]
+SIDECHAINS["MET"] = [("SD","A","CG")]
+SIDECHAINS["SER"] = [("OG","DA","CB")]
+SIDECHAINS["THR"] = [("OG1","DA","CB")]
+SIDECHAINS["TRP"] = [("NE1","D","CD1")]
+SIDECHAINS["TYR"] = [("OH","DA","CZ")]
+SIDECHAINS["HOH"] = [("O","DA","")]
+
+#--------------------------------------------------------------------
+def typing_table():
+    rows = []
+    for aa in ar.AMINO_ACIDS:
+        for atom,role,ante in BACKBONE:
+            if aa == "PRO" and atom == "N":
+                continue
+            rows.append((aa,atom,role,ante,True))
+    for aa,atoms in SIDECHAINS.items():
+        for atom,role,ante in atoms:
+            rows.append((aa,atom,role,ante,False))
+    df = pd.DataFrame(rows,columns=["aa","atom","role","ante","backbone"])
+    return df.set_index(["aa","atom"])
+TYPES = typing_table()
+#--------------------------------------------------------------------
+def type_atoms(arrs):
+    """Role, antecedent atom index and backbone flag per atom (role '' if neither donor nor acceptor)."""
+    keys = pd.MultiIndex.from_arrays([arrs.aa,arrs.atom])
+    idx = TYPES.index.get_indexer(keys)
+    found = idx >= 0
+    role = np.full(len(arrs),"",dtype=object)
+    ante_name = np.full(len(arrs),"",dtype=object)
+    backbone = np.zeros(len(arrs),dtype=bool)
+    role[found] = TYPES["role"].to_numpy()[idx[found]]
+    ante_name[found] = TYPES["ante"].to_numpy()[idx[found]]
+    backbone[found] = TYPES["backbone"].to_numpy()[idx[found]]
+    # the antecedent is the named atom in the same residue
+    res = ar.residue_keys(arrs)
+    lookup = pd.MultiIndex.from_arrays([res,arrs.atom])
+    ante = lookup.get_indexer(pd.MultiIndex.from_arrays([res,ante_name]))
+    return role, ante, backbone
+#--------------------------------------------------------------------
+def find_hbonds(arrs, min_dis=MIN_DIS, max_dis=MAX_DIS, min_angle=MIN_ANGLE, min_rid_sep=1, exc_disordered=True):
+    """The donor/acceptor pairs of one structure that satisfy the distance and angle criteria."""
+    role, ante, backbone = type_atoms(arrs)
+    usable = np.ones(len(arrs),dtype=bool)
+    if exc_disordered:
+        usable = ~arrs.disordered
+    donors = np.nonzero(usable & np.isin(role,["D","DA"]))[0]
+    acceptors = np.nonzero(usable & np.isin(role,["A","DA"]))[0]
+    if len(donors) == 0 or len(acceptors) == 0:
+        return empty_frame()
+    tree_d = cKDTree(arrs.coords[donors])
+    tree_a = cKDTree(arrs.coords[acceptors])
+    pairs = tree_d.sparse_distance_matrix(tree_a,max_dis,output_type="ndarray")
+    d = donors[pairs["i"]]
+    a = acceptors[pairs["j"]]
+    dis = pairs["v"]
+    keep = (dis >= min_dis) & (d != a)
+    same_chain = arrs.chain[d] == arrs.chain[a]
+    keep &= ~same_chain | (np.abs(arrs.rid[d] - arrs.rid[a]) >= min_rid_sep)
+    d,a,dis = d[keep],a[keep],dis[keep]
+    # angles at the donor (antecedent-D...A) and acceptor (D...A-antecedent), skipped when there is no antecedent
+    xyz = arrs.coords.astype(np.float64)
+    d_angle = np.full(len(d),np.nan)
+    a_angle = np.full(len(d),np.nan)
+    has_d = ante[d] >= 0
+    has_a = ante[a] >= 0
+    d_angle[has_d] = ar.angles(xyz[ante[d[has_d]]],xyz[d[has_d]],xyz[a[has_d]])
+    a_angle[has_a] = ar.angles(xyz[d[has_a]],xyz[a[has_a]],xyz[ante[a[has_a]]])
+    keep = ~(d_angle < min_angle) & ~(a_angle < min_angle)
+    d,a,dis,d_angle,a_angle = d[keep],a[keep],dis[keep],d_angle[keep],a_angle[keep]
+    # atoms that are both donor and acceptor (e.g. water) can pair both ways round, keep one
+    n = len(arrs)
+    both = (role[d] == "DA") & (role[a] == "DA")
+    keep = ~(both & (d > a) & np.isin(d*n + a,a*n + d))
+    d,a,dis,d_angle,a_angle = d[keep],a[keep],dis[keep],d_angle[keep],a_angle[keep]
+    kind = np.where(backbone[d],"bb","sc").astype(object) + "-" + np.where(backbone[a],"bb","sc").astype(object)
+    kind[(arrs.aa[d] == "HOH") | (arrs.aa[a] == "HOH")] = "water"
+    df = pd.DataFrame({"pdb_code":arrs.pdb_code,
+                       "d_chain":arrs.chain[d],"d_rid":arrs.rid[d],"d_aa":arrs.aa[d],"d_atom":arrs.atom[d],
+                       "a_chain":arrs.chain[a],"a_rid":arrs.rid[a],"a_aa":arrs.aa[a],"a_atom":arrs.atom[a],
+                       "distance":dis.astype(np.float32),"d_angle":d_angle.astype(np.float32),
+                       "a_angle":a_angle.astype(np.float32),"kind":kind})
+    df = df.sort_values(["d_chain","d_rid","distance"],ignore_index=True)
+    return compact(df)
+#--------------------------------------------------------------------
+def empty_frame():
+    return pd.DataFrame(columns=["pdb_code","d_chain","d_rid","d_aa","d_atom","a_chain","a_rid","a_aa","a_atom",
+                                 "distance","d_angle","a_angle","kind"])
+#--------------------------------------------------------------------
+def compact(df):
+    for col in ["pdb_code","d_chain","d_aa","d_atom","a_chain","a_aa","a_atom","kind"]:
+        df[col] = df[col].astype("category")
+    return df
+#--------------------------------------------------------------------
+def hbonds_structures(pobjs, **kwargs):
+    frames = [find_hbonds(ar.from_pobj(po),**kwargs) for po in pobjs]
+    if len(frames) == 0:
+        return empty_frame()
+    return compact(pd.concat(frames,ignore_index=True))
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from shared import config as cfg
+from shared import sandbox as sb
+from shared import tracing as tr
+
+# Background jobs for long calculations.
+# A job runs on a process-wide pool of worker threads, so it carries on while the page reruns;
+# the session keeps only the job id and polls it. Jobs are keyed by what they compute, and a
+# submission whose key matches a queued, running or finished job gets that job instead of a new
+# one, so two users asking for the same run share it. A job can be cancelled or given a timeout;
+# its function calls job.check() between steps, which raises sandbox.Stopped, and the job keeps
+# the partial result the function stopped with. As a job can be shared, each session waiting on
+# it has its own timeout, and a session that cancels only stops waiting: the job itself is
+# stopped when the last session waiting on it cancels, or when every waiting session's time is up. Finished jobs are forgotten after
+# cfg.JOB_KEEP_SECONDS, by which time their results are in the shared compute cache. The spans a
+# job records are shown to the session that submitted it.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STOPPED = "stopped"
+
+_lock = threading.RLock()
+_jobs = {}      # id -> Job
+_by_key = {}    # key -> id
+_pool = []
+LOGGER = logging.getLogger("prometry.jobs")
+
+class Job:
+    def __init__(self, key, total, session=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.total = total
+        self.session = session  # the submitting session, which the job's spans are recorded for
+        self.done = 0
+        self.status = QUEUED
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.errors = []    # per-item errors that did not stop the job
+        self.submitted = time.time()
+        self.finished = None
+        self.waiters = {}   # session -> its deadline, or None
+        self.cancelled = threading.Event()
+
+    def advance(self, message=""):
+        self.done += 1
+        self.message = message
+
+    def warn(self, error):
+        self.errors.append(str(error))
+
+    def join(self, waiter, timeout=None):
+        with _lock:
+            self.waiters[waiter] = time.time() + timeout if timeout else None
+
+    def leave(self, waiter):
+        """Stops waiting for waiter, and cancels the job when no session is waiting on it any more."""
+        with _lock:
+            self.waiters.pop(waiter,None)
+            if len(self.waiters) == 0:
+                self.cancelled.set()
+
+    def is_waiting(self, waiter):
+        return waiter in self.waiters
+
+    def check(self):
+        """Raises sandbox.Stopped when the job has been cancelled or every waiting session is past its timeout."""
+        if self.cancelled.is_set():
+            raise sb.Stopped("Cancelled")
+        deadlines = list(self.waiters.values())
+        if len(deadlines) > 0 and all(d is not None and time.time() > d for d in deadlines):
+            raise sb.Stopped(f"Stopped after the time limit of {round(max(deadlines) - self.submitted)} s")
+
+    def fraction(self):
+        if self.status == DONE:
+            return 1.0
+        return min(self.done/self.total,1.0) if self.total > 0 else 0.0
+
+    def is_finished(self):
+        return self.status in (DONE,FAILED,STOPPED)
+
+#--------------------------------------------------------------------
+def pool():
+    with _lock:
+        if len(_pool) == 0:
+            _pool.append(ThreadPoolExecutor(max_workers=cfg.JOB_WORKERS,thread_name_prefix="job"))
+        return _pool[0]
+#--------------------------------------------------------------------
+def run(job, fn):
+    job.status = RUNNING
+    try:
+        with tr.for_session(job.session):
+            job.result = fn(job)
+        job.status = DONE
+    except sb.Stopped as e:
+        job.error = e.reason
+        job.result = e.partial
+        job.status = STOPPED
+    except Exception as e:
+        # the pool would keep the exception in a future nobody reads, so it is logged and the job failed
+        LOGGER.exception("Job %s failed",job.id)
+        job.error = str(e)
+        job.status = FAILED
+    job.finished = time.time()
+#--------------------------------------------------------------------
+def prune(now):
+    for job_id,job in list(_jobs.items()):
+        if job.is_finished() and now - job.finished > cfg.JOB_KEEP_SECONDS:
+            del _jobs[job_id]
+            if _by_key.get(job.key) == job_id:
+                del _by_key[job.key]
+#--------------------------------------------------------------------
+def submit(key, fn, total=0, timeout=None, waiter=""):
+    """The id of the job computing fn(job) for key, started unless one for key already exists.
+
+    waiter (e.g. the session id) is added to those waiting on the job, with its own timeout. fn can
+    call job.advance() after each of total steps, job.warn() for errors it carries on from and
+    job.check() where it can stop.
+    """
+    with _lock:
+        prune(time.time())
+        job_id = _by_key.get(key)
+        job = _jobs.get(job_id)
+        new = job is None or job.status in (FAILED,STOPPED) or job.cancelled.is_set()
+        if new:
+            # submit runs in the session's script thread, the job's worker thread has no session of its own
+            job = Job(key,total,session=tr.session_id())
+            _jobs[job.id] = job
+            _by_key[key] = job.id
+        job.join(waiter,timeout)
+    if new:
+        pool().submit(run,job,fn)
+    return job.id
+#--------------------------------------------------------------------
+def get(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+#--------------------------------------------------------------------
+def cancel(job_id, waiter=""):
+    """waiter stops waiting on the job, which is stopped if no other session is waiting on it."""
+    job = get(job_id)
+    if job is not None:
+        job.leave(waiter)
+#--------------------------------------------------------------------
+def stats():
+    with _lock:
+        jobs = list(_jobs.values())
+    return {status:sum(j.status == status for j in jobs) for status in (QUEUED,RUNNING,DONE,FAILED,STOPPED)}
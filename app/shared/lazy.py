@@ -0,0 +1,37 @@
+import importlib
+
+# Deferred imports and cached static assets.
+# Every page imports the shared modules, but most reruns never reach a calculation or a plot, so
+# the heavy libraries (maptial and biopython, plotly.express, scipy) are bound at module level as
+# proxies that import on first attribute access. Images under app/static are opened once per process.
+
+_IMAGES = {}
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # only reached for attributes of the real module; import_module is safe across threads
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module,attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name} ({state})>"
+
+#--------------------------------------------------------------------
+def load(name):
+    """A module proxy that imports name when it is first used."""
+    return LazyModule(name)
+#--------------------------------------------------------------------
+def image(path):
+    """A PIL image of a static file, decoded once and shared read-only."""
+    if path not in _IMAGES:
+        from PIL import Image
+        img = Image.open(path)
+        img.load()
+        _IMAGES[path] = img
+    return _IMAGES[path]
@@ -0,0 +1,246 @@
+import os
+import sqlite3
+import datetime
+from collections import Counter
+from contextlib import closing
+from shared import config as cfg
+
+# A local catalogue of structure metadata (resolution, method, R-free, dates, sizes).
+# Header fields are read once per structure file into SQLite so structures can be selected
+# by these fields without loading any coordinates.
+# The same pass counts the structure's composition: residues of each type, atoms of each name and
+# element, and HETATM ligands (residues other than water), all in the first model. The query
+# planner checks it to skip structures a geo cannot match, e.g. SG:{SG&1} on one with no SG atom.
+
+COLUMNS = ["pdb_code","source","filepath","method","resolution","r_free","deposition_date",
+           "release_date","n_models","n_chains","n_residues","n_atoms","n_hetatms","from_header","indexed_at"]
+COMPOSITION_KINDS = ["residue","atom","element","ligand"]
+WATERS = ["HOH","WAT","DOD"]
+# what indexing a file or recording a summary can raise, which callers report and carry on from
+ERRORS = (sqlite3.Error,OSError,ValueError)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS structures (
+    pdb_code TEXT PRIMARY KEY,
+    source TEXT,
+    filepath TEXT,
+    method TEXT,
+    resolution REAL,
+    r_free REAL,
+    deposition_date TEXT,
+    release_date TEXT,
+    n_models INTEGER,
+    n_chains INTEGER,
+    n_residues INTEGER,
+    n_atoms INTEGER,
+    n_hetatms INTEGER,
+    from_header INTEGER,
+    indexed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_structures_method ON structures(method);
+CREATE INDEX IF NOT EXISTS idx_structures_resolution ON structures(resolution);
+CREATE INDEX IF NOT EXISTS idx_structures_deposition ON structures(deposition_date);
+CREATE TABLE IF NOT EXISTS composition (
+    pdb_code TEXT,
+    kind TEXT,
+    name TEXT,
+    n INTEGER,
+    PRIMARY KEY (pdb_code, kind, name)
+);
+CREATE INDEX IF NOT EXISTS idx_composition_name ON composition(kind, name);
+"""
+
+#--------------------------------------------------------------------
+def connect(dbpath=None):
+    if dbpath is None:
+        dbpath = cfg.DBPATH
+    con = sqlite3.connect(dbpath,timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(SCHEMA)
+    return con
+#--------------------------------------------------------------------
+def to_float(val):
+    try:
+        val = float(val)
+        return val if val > 0 else None
+    except (TypeError,ValueError):
+        return None
+#--------------------------------------------------------------------
+def read_pdb_header(filepath):
+    """Header fields and atom/chain counts from a pdb format file in one text pass."""
+    from Bio.PDB import parse_pdb_header
+    header = parse_pdb_header(filepath)
+    r_free = None
+    models = 0
+    chains = set()
+    residues = set()
+    atoms,hetatms = 0,0
+    records = []
+    with open(filepath) as fr:
+        for line in fr:
+            rec = line[:6]
+            if rec == "ATOM  " or rec == "HETATM":
+                if models > 1:
+                    continue
+                chains.add(line[21])
+                residues.add((line[21],line[22:27]))
+                if rec == "ATOM  ":
+                    atoms += 1
+                else:
+                    hetatms += 1
+                records.append((rec.strip(),line[21],line[22:27],line[17:20].strip(),line[12:16].strip(),line[76:78].strip()))
+            elif rec == "MODEL ":
+                models += 1
+            elif rec == "REMARK" and r_free is None and line[10:].split(":")[0].strip() == "FREE R VALUE":
+                r_free = to_float(line.split(":")[1])
+    return {"method":header.get("structure_method",""),
+            "resolution":to_float(header.get("resolution")),
+            "r_free":r_free,
+            "deposition_date":header.get("deposition_date"),
+            "release_date":header.get("release_date"),
+            "n_models":max(models,1),"n_chains":len(chains),"n_residues":len(residues),
+            "n_atoms":atoms,"n_hetatms":hetatms,"composition":composition(records)}
+#--------------------------------------------------------------------
+def read_cif_header(filepath):
+    from Bio.PDB.MMCIF2Dict import MMCIF2Dict
+    dic = MMCIF2Dict(filepath)
+    def first(*keys):
+        for key in keys:
+            if key in dic and dic[key][0] not in ["?","."]:
+                return dic[key][0]
+        return None
+    models = dic.get("_atom_site.pdbx_PDB_model_num",["1"])
+    first_model = models[0]
+    in_model = [m == first_model for m in models]
+    groups = [g for g,m in zip(dic.get("_atom_site.group_PDB",[]),in_model) if m]
+    chains = [c for c,m in zip(dic.get("_atom_site.auth_asym_id",[]),in_model) if m]
+    rids = [r for r,m in zip(dic.get("_atom_site.auth_seq_id",[]),in_model) if m]
+    method = first("_exptl.method")
+    def column(*keys):
+        # the first model's values of the first of keys in the file
+        for key in keys:
+            if key in dic:
+                return [v for v,m in zip(dic[key],in_model) if m]
+        return [""] * len(groups)
+    records = zip(groups,chains,rids,column("_atom_site.label_comp_id","_atom_site.auth_comp_id"),
+                  column("_atom_site.label_atom_id","_atom_site.auth_atom_id"),column("_atom_site.type_symbol"))
+    return {"method":method.lower() if method else "",
+            "resolution":to_float(first("_refine.ls_d_res_high","_reflns.d_resolution_high","_em_3d_reconstruction.resolution")),
+            "r_free":to_float(first("_refine.ls_R_factor_R_free")),
+            "deposition_date":first("_pdbx_database_status.recvd_initial_deposition_date"),
+            "release_date":first("_pdbx_audit_revision_history.revision_date"),
+            "n_models":len(set(models)),"n_chains":len(set(chains)),"n_residues":len(set(zip(chains,rids))),
+            "n_atoms":groups.count("ATOM"),"n_hetatms":groups.count("HETATM"),"composition":composition(records)}
+#--------------------------------------------------------------------
+def composition(records):
+    """Counts per kind and name from (group, chain, rid, residue name, atom name, element) per atom."""
+    counts = {kind:Counter() for kind in COMPOSITION_KINDS}
+    residues = {}
+    for group,chain,rid,resname,atom,element in records:
+        counts["atom"][atom] += 1
+        counts["element"][element.upper() if element not in ("","?",".") else atom[:1]] += 1
+        residues.setdefault((chain,rid),(group,resname))
+    for group,resname in residues.values():
+        counts["residue"][resname] += 1
+        if group == "HETATM" and resname.upper() not in WATERS:
+            counts["ligand"][resname] += 1
+    return counts
+#--------------------------------------------------------------------
+def read_header(filepath):
+    if filepath.lower().endswith(".cif"):
+        return read_cif_header(filepath)
+    return read_pdb_header(filepath)
+#--------------------------------------------------------------------
+def upsert(con, row):
+    row = dict(row)
+    row["indexed_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+    vals = [row.get(col) for col in COLUMNS]
+    con.execute(f"INSERT OR REPLACE INTO structures ({','.join(COLUMNS)}) VALUES ({','.join('?'*len(COLUMNS))})",vals)
+    if row.get("composition") is not None:
+        con.execute("DELETE FROM composition WHERE pdb_code = ?",(row["pdb_code"],))
+        con.executemany("INSERT INTO composition VALUES (?,?,?,?)",
+                        [(row["pdb_code"],kind,name,n) for kind,counts in row["composition"].items() for name,n in counts.items()])
+#--------------------------------------------------------------------
+def is_indexed(pdb_code, dbpath=None):
+    # read from the header, with the composition, which structures indexed before it was counted lack
+    with closing(connect(dbpath)) as con, con:
+        cur = con.execute("SELECT from_header FROM structures WHERE pdb_code = ?",(pdb_code,))
+        row = cur.fetchone()
+        counted = con.execute("SELECT 1 FROM composition WHERE pdb_code = ? LIMIT 1",(pdb_code,)).fetchone()
+    return row is not None and row[0] == 1 and counted is not None
+#--------------------------------------------------------------------
+def index_file(pdb_code, filepath, source="ebi", dbpath=None, force=False):
+    """Reads the header of a structure file into the index, once per structure unless forced."""
+    if not force and is_indexed(pdb_code,dbpath):
+        return False
+    row = read_header(filepath)
+    row["pdb_code"] = pdb_code
+    row["source"] = source
+    row["filepath"] = filepath
+    row["from_header"] = 1
+    with closing(connect(dbpath)) as con, con:
+        upsert(con,row)
+    return True
+#--------------------------------------------------------------------
+def index_loaded(pla, dbpath=None):
+    """Indexes the file behind a maptial PdbLoader that has been loaded."""
+    filepath = pla.pdb_filepath
+    if pla.cif and os.path.exists(pla.cif_filepath):
+        filepath = pla.cif_filepath
+    source = "alphafold" if "alphafold" in pla.pdb_url else "ebi"
+    if os.path.exists(filepath):
+        index_file(pla.pdb_code,filepath,source=source,dbpath=dbpath)
+#--------------------------------------------------------------------
+def record_summary(pdb_code, method="", resolution=None, n_chains=None, source="uniprot", dbpath=None):
+    """Stores metadata known before download (e.g. from UniProt), never overwriting header values."""
+    if is_indexed(pdb_code,dbpath):
+        return
+    row = {"pdb_code":pdb_code,"source":source,"method":method.lower(),
+           "resolution":to_float(str(resolution).replace("A","").strip()),
+           "n_chains":n_chains,"from_header":0}
+    with closing(connect(dbpath)) as con, con:
+        upsert(con,row)
+#--------------------------------------------------------------------
+def compositions(pdb_codes, dbpath=None):
+    """The indexed compositions of the structures, {pdb_code: {kind: {name: count}}}; those not indexed are left out."""
+    out = {}
+    pdb_codes = list(pdb_codes)
+    with closing(connect(dbpath)) as con, con:
+        for start in range(0,len(pdb_codes),500):
+            codes = pdb_codes[start:start + 500]
+            rows = con.execute(f"SELECT pdb_code,kind,name,n FROM composition WHERE pdb_code IN ({','.join('?'*len(codes))})",codes)
+            for code,kind,name,n in rows:
+                out.setdefault(code,{k:{} for k in COMPOSITION_KINDS})[kind][name] = n
+    return out
+#--------------------------------------------------------------------
+def query(method=None, min_resolution=None, max_resolution=None, max_r_free=None,
+          deposited_after=None, deposited_before=None, min_chains=None, max_chains=None,
+          min_atoms=None, max_atoms=None, pdb_codes=None, dbpath=None):
+    """Selects indexed structures by their metadata, returning a dataframe."""
+    import pandas as pd
+    where, params = [], []
+    if method is not None:
+        where.append("method LIKE ?")
+        params.append(f"%{method.lower()}%")
+    for col,op,val in [("resolution",">=",min_resolution),("resolution","<=",max_resolution),
+                        ("r_free","<=",max_r_free),
+                        ("deposition_date",">=",deposited_after),("deposition_date","<=",deposited_before),
+                        ("n_chains",">=",min_chains),("n_chains","<=",max_chains),
+                        ("n_atoms",">=",min_atoms),("n_atoms","<=",max_atoms)]:
+        if val is not None:
+            where.append(f"{col} {op} ?")
+            params.append(val)
+    if pdb_codes is not None:
+        where.append(f"pdb_code IN ({','.join('?'*len(pdb_codes))})")
+        params.extend(pdb_codes)
+    sql = "SELECT * FROM structures"
+    if len(where) > 0:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY pdb_code"
+    with closing(connect(dbpath)) as con, con:
+        return pd.read_sql_query(sql,con,params=params)
+#--------------------------------------------------------------------
+def sql(statement, params=(), dbpath=None):
+    import pandas as pd
+    with closing(connect(dbpath)) as con, con:
+        return pd.read_sql_query(statement,con,params=params)
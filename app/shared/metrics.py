@@ -0,0 +1,217 @@
+import os
+import re
+import threading
+import time
+from shared import config as cfg
+
+# Process-wide counters and histograms in the Prometheus text format.
+# Timings come from the tracing spans (fetch, parse, geometry per kind of geo, every span by
+# name); cache and session figures are read when the metrics are collected. They are served on
+# 127.0.0.1:cfg.METRICS_PORT at /metrics and/or written every cfg.METRICS_INTERVAL seconds to
+# cfg.METRICS_FILE (for the node exporter textfile collector), each only when configured.
+
+BUCKETS = (0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,300)
+
+_lock = threading.Lock()
+_metrics = []
+_collectors = []
+_started = [False]
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(l,"")) for l in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key,0) + amount
+
+    def lines(self):
+        out = [f"# HELP {self.name} {self.help}",f"# TYPE {self.name} counter"]
+        for key,val in sorted(self.values.items()):
+            out.append(f"{self.name}{label_text(self.labels,key)} {val}")
+        return out
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}    # labels -> [bucket counts..., sum, count]
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(l,"")) for l in self.labels)
+        with _lock:
+            vals = self.values.setdefault(key,[0]*(len(self.buckets) + 2))
+            for i,b in enumerate(self.buckets):
+                if value <= b:
+                    vals[i] += 1
+            vals[-2] += value
+            vals[-1] += 1
+
+    def lines(self):
+        out = [f"# HELP {self.name} {self.help}",f"# TYPE {self.name} histogram"]
+        for key,vals in sorted(self.values.items()):
+            for b,n in zip(self.buckets,vals):
+                out.append(f"{self.name}_bucket{label_text(self.labels + ('le',),key + (str(b),))} {n}")
+            out.append(f"{self.name}_bucket{label_text(self.labels + ('le',),key + ('+Inf',))} {vals[-1]}")
+            out.append(f"{self.name}_sum{label_text(self.labels,key)} {round(vals[-2],6)}")
+            out.append(f"{self.name}_count{label_text(self.labels,key)} {vals[-1]}")
+        return out
+
+#--------------------------------------------------------------------
+def label_text(names, values):
+    if len(names) == 0:
+        return ""
+    pairs = []
+    for n,v in zip(names,values):
+        v = v.replace("\\","\\\\").replace('"','\\"').replace("\n","\\n")
+        pairs.append(f'{n}="{v}"')
+    return "{" + ",".join(pairs) + "}"
+#--------------------------------------------------------------------
+def gauge_lines(name, help, samples, kind="gauge"):
+    """Lines for values read at collection time, samples as [(labels dict, value)]."""
+    out = [f"# HELP {name} {help}",f"# TYPE {name} {kind}"]
+    for labels,val in samples:
+        if val is not None:
+            out.append(f"{name}{label_text(tuple(labels),tuple(str(v) for v in labels.values()))} {val}")
+    return out
+#--------------------------------------------------------------------
+def collector(fn):
+    """Registers fn, which returns metric lines, to be called on every collection."""
+    _collectors.append(fn)
+    return fn
+#--------------------------------------------------------------------
+def render():
+    with _lock:
+        lines = [line for m in _metrics for line in m.lines()]
+    for fn in _collectors:
+        try:
+            lines.extend(fn())
+        except RuntimeError as e:
+            # e.g. a dict another thread changed while it was read
+            print("Error collecting metrics", fn.__name__, str(e))
+    return "\n".join(lines) + "\n"
+#--------------------------------------------------------------------
+def geo_kind(geo):
+    # the label a geo's compute time is recorded under
+    if "|" in geo.split(":")[0] and "{" not in geo.split(":")[0]:
+        return geo.split("|")[0].lower()     # aggregates such as SUMDIS|
+    if "@i" in geo:
+        return "all_pairs"      # e.g. CA:{CA@i}
+    if re.search(r"@\d",geo):
+        return "nearest"        # e.g. N:{O@1}, the closest matches only
+    return {2:"distance",3:"angle",4:"dihedral"}.get(len(geo.split(":")),"other")
+#--------------------------------------------------------------------
+SPAN_SECONDS = Histogram("prometry_span_seconds","Duration of traced stages.",("span",))
+SPAN_ERRORS = Counter("prometry_span_errors_total","Traced stages that raised.",("span","error"))
+STRUCTURES = Counter("prometry_structures_total","Structure files needed, by whether they were fetched or already local.",("source",))
+FETCH_SECONDS = Histogram("prometry_fetch_seconds","Time to download a structure file.")
+PARSE_SECONDS = Histogram("prometry_parse_seconds","Time to parse a structure file.")
+GEOMETRY_SECONDS = Histogram("prometry_geometry_seconds","calculateGeometry time per structure and geo.",("kind",))
+GEOMETRY_ROWS = Counter("prometry_geometry_rows_total","Rows calculated by calculateGeometry.",("kind",))
+#--------------------------------------------------------------------
+def observe_span(row):
+    """Records a finished tracing span."""
+    name,seconds = row["span"],row["seconds"]
+    SPAN_SECONDS.observe(seconds,span=name)
+    if "error" in row:
+        SPAN_ERRORS.inc(span=name,error=row["error"])
+    if name == "download":
+        STRUCTURES.inc(source="local" if row.get("local") else "download")
+        if not row.get("local"):
+            FETCH_SECONDS.observe(seconds)
+    elif name in ["parse","load_pdb"]:
+        PARSE_SECONDS.observe(seconds)
+    elif name == "calculateGeometry" and "geo" in row:
+        kind = geo_kind(row["geo"])
+        GEOMETRY_SECONDS.observe(seconds,kind=kind)
+        GEOMETRY_ROWS.inc(row.get("rows",0),kind=kind)
+#--------------------------------------------------------------------
+@collector
+def cache_lines():
+    from shared import compute_cache as cc
+    stats = [cc.STRUCTURES.stats(),cc.RESULTS.stats()]
+    out = []
+    for key,kind,help in [("hits","counter","Requests served from memory."),
+                          ("disk_hits","counter","Requests served from the disk cache."),
+                          ("misses","counter","Requests that were computed."),
+                          ("evictions","counter","Entries evicted from memory."),
+                          ("entries","gauge","Entries in memory."),
+                          ("mb","gauge","Megabytes in memory.")]:
+        name = f"prometry_cache_{key}" + ("_total" if kind == "counter" else "")
+        out.extend(gauge_lines(name,help,[({"cache":s["cache"]},s[key]) for s in stats],kind))
+    return out
+#--------------------------------------------------------------------
+@collector
+def session_lines():
+    from shared import session_data as sd
+    managers = list(sd._MANAGERS.values())
+    in_memory = sum(dm.in_memory_bytes() for dm in managers)
+    total = sum(sum(dm.sizes.values()) for dm in managers)
+    out = gauge_lines("prometry_sessions","Live sessions.",[({},len(managers))])
+    out.extend(gauge_lines("prometry_session_bytes","Bytes of session dataframes, in memory or spilled to disk.",
+                           [({"where":"memory"},in_memory),({"where":"disk"},total - in_memory)]))
+    return out
+#--------------------------------------------------------------------
+@collector
+def job_lines():
+    from shared import jobs
+    return gauge_lines("prometry_jobs","Background jobs by status.",[({"status":k},v) for k,v in jobs.stats().items()])
+#--------------------------------------------------------------------
+def serve(port):
+    # http.server is only imported when the endpoint is configured
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ["/","/metrics"]:
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type","text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length",str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1",port),Handler)
+    threading.Thread(target=server.serve_forever,name="metrics",daemon=True).start()
+#--------------------------------------------------------------------
+def write_file(path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp,"w") as fw:
+        fw.write(render())
+    os.replace(tmp,path)
+#--------------------------------------------------------------------
+def write_loop(path, interval):
+    while True:
+        try:
+            write_file(path)
+        except OSError as e:
+            print("Error writing metrics", path, str(e))
+        time.sleep(interval)
+#--------------------------------------------------------------------
+def start():
+    """Starts the endpoint and the file writer as configured, once per process."""
+    with _lock:
+        if _started[0]:
+            return
+        _started[0] = True
+    if cfg.METRICS_PORT:
+        try:
+            serve(cfg.METRICS_PORT)
+        except OSError as e:
+            # e.g. another server process already has the port
+            print("Error starting metrics endpoint", cfg.METRICS_PORT, str(e))
+    if cfg.METRICS_FILE:
+        threading.Thread(target=write_loop,args=(cfg.METRICS_FILE,cfg.METRICS_INTERVAL),name="metrics-file",daemon=True).start()
@@ -0,0 +1,420 @@
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+from shared import atom_arrays as ar
+from shared import query_plan as qp
+from shared import geo_store as gs
+
+# Searches such as CA:{CA@i}[dis|0.5><10,rid|>1] or N:(O@1), calculated on arrays.
+# maptial's calculateGeometry answers {X@i} by measuring every candidate in the chain from every
+# start atom in python and then checking the criteria. Here the atoms of a loaded structure are
+# read once into AtomArrays, and a two-atom geo whose second atom is a search ({} or (), all or the
+# nth nearest) is calculated a chain at a time, with the criteria as maptial's
+# atom.matchesCriteria reads them; rows come out in calculateGeometry's order and column layout,
+# so the geo store and the plots cannot tell the difference.
+# The criteria are split before any pair is made: those about one atom (aa, ~aa, occ, and never
+# a disordered atom) shrink the start and candidate arrays, so waters excluded with ~aa|HOH are
+# never measured, and those about a pair (dis, rid and the & separation) first rule out whole
+# tiles from their bounding boxes and residue ranges, then filter the pairs of the rest.
+# Distances are measured in tiles of TILE start atoms by TILE candidates, in float32 relative to
+# the chain's centre, so memory stays within a few tiles however long the chain is, and a tile
+# keeps only its pairs that could pass the dis criteria; those are measured again in float64 and
+# checked exactly, so the values are maptial's to the last digit.
+# When both atoms are selected by the same names and atom criteria the search is symmetric: each
+# unordered pair is found once, from the atom earlier in the structure, which halves the work and
+# the rows of a contact map. mirror() adds the reversed rows for a consumer that needs both, such
+# as the full contact matrix. Results of symmetric geos are therefore not maptial's, and the geo
+# store keeps them under its own version.
+# COUNT| and RDF| are aggregates over the same search: instead of a row per pair they give a row
+# per start atom (the anchor), every anchor that passes its criteria even with no neighbour, with
+# the number of candidates passing the criteria, e.g. a coordination number
+# COUNT|FE:{(N),(O)@i}[dis|<2.8]. RDF| also counts them in shells of RDF_BIN angstroms out to its
+# dis limit, kept in the info column after the anchor, and rdf() turns those into a radial
+# distribution per class of anchor. The counts are added up tile by tile, so no pair is kept.
+
+ATOM_CRITERIA = ["aa","~aa","occ"]     # about one atom
+PAIR_CRITERIA = ["rid","dis"]          # about a pair
+COUNTS = ["count","rdf"]    # aggregates answered with a row per anchor
+RDF_BIN = 0.5       # angstroms per RDF| shell
+RDF_MAX = 12.0      # how far an RDF| counts when its dis criteria set no upper limit
+TILE = 256          # 256 x 256 float32 distances are 256 KB, comfortably in cache
+SLACK = 1e-3        # angstroms a float32 distance is allowed to be out by when tiles are filtered
+
+_lock = threading.Lock()
+_atoms = weakref.WeakKeyDictionary()    # loaded structure -> Atoms
+
+class Atoms(ar.AtomArrays):
+    """atom_arrays.AtomArrays of a loaded structure in float64, so values are maptial's, with the chain ranges,
+    upper case residue names and maptial's atom labels the searches use."""
+    def __init__(self, arrs):
+        super().__init__(arrs.pdb_code,arrs.resolution,arrs.chain,arrs.rid,arrs.ridx,arrs.aa,arrs.atom,arrs.element,
+                         arrs.bfactor,arrs.occupancy,arrs.disordered,arrs.coords,arrs.number)
+        firsts = np.flatnonzero(np.r_[True,arrs.chain[1:] != arrs.chain[:-1]]) if len(arrs) > 0 else np.zeros(0,dtype=np.int64)
+        ends = np.r_[firsts[1:],len(arrs)]
+        self.chains = [(arrs.chain[lo],lo,hi) for lo,hi in zip(firsts,ends)]    # (chain, first atom, end)
+        self.aa_upper = np.array([a.upper() for a in arrs.aa],dtype=object)
+        self.info = np.array([f"({c}|{a}|{r}|{n}|{no})" for c,a,r,n,no in zip(arrs.chain,arrs.aa,arrs.rid,arrs.atom,arrs.number)],dtype=object)
+
+#--------------------------------------------------------------------
+def atoms_of(pobj):
+    """Atoms of a loaded structure, read once and kept for as long as the structure is."""
+    with _lock:
+        atoms = _atoms.get(pobj)
+        if atoms is None:
+            atoms = _atoms[pobj] = Atoms(ar.from_pobj(pobj,dtype=np.float64))
+        return atoms
+#--------------------------------------------------------------------
+def supports(geo):
+    """Whether calculate answers the geo: start atoms and a search of the chain, e.g. CA:{CA@i}[dis|<8],
+    N:(O@1) or COUNT|FE:{(N),(O)@i}[dis|<2.8]."""
+    aggregate,terms = qp.parse_geo(geo)
+    if aggregate not in [None] + COUNTS or len(terms) != 2:
+        return False
+    start,search = terms
+    # maptial reads @ and & in the start atoms as part of the names
+    first = geo.split(":")[0]
+    plain = "@" not in first and "&" not in first
+    return plain and start.offset == 0 and search.search
+#--------------------------------------------------------------------
+def is_symmetric(start, search):
+    """Whether (a, b) passes exactly when (b, a) does, so each unordered pair need only be found once."""
+    def atom_criteria(term):
+        return sorted((k.lower(),v) for k,v in split_criteria(term.criteria)[0])
+    if search.nearest != "i" or start.element != search.element or sorted(start.names) != sorted(search.names) or search.offset != 0:
+        return False
+    return atom_criteria(start) == atom_criteria(search)
+#--------------------------------------------------------------------
+def split_criteria(criteria):
+    """The criteria about one atom (aa, ~aa, occ) and those about a pair (rid, dis); maptial ignores any others."""
+    atom = [(k,v) for k,v in criteria if k.lower() in ATOM_CRITERIA]
+    pair = [(k,v) for k,v in criteria if k.lower() in PAIR_CRITERIA]
+    return atom,pair
+#--------------------------------------------------------------------
+def selected(atoms, lo, hi, term):
+    """Atoms of the chain slice the term's names (or elements) select, in maptial's order: by name, then position."""
+    values = atoms.element[lo:hi] if term.element else atoms.atom[lo:hi]
+    return np.concatenate([lo + np.flatnonzero(values == n) for n in term.names] or [np.zeros(0,dtype=np.int64)])
+#--------------------------------------------------------------------
+def in_range(values, val, integer=False):
+    """values within a criterion value as matchesCriteria reads it: a><b between, a<>b at the extremes, <b, >a."""
+    def num(s):
+        return int(float(s)) if integer else float(s)
+    if "><" in val:
+        lo,hi = val.split("><")
+        return (values >= num(lo)) & (values <= num(hi))
+    if "<>" in val:
+        lo,hi = val.split("<>")
+        return (values <= num(lo)) | (values >= num(hi))
+    if val.startswith("<"):
+        return values <= num(val[1:])
+    if val.startswith(">"):
+        return values >= num(val[1:])
+    return np.ones(np.shape(values),dtype=bool)
+#--------------------------------------------------------------------
+def atom_passes(atoms, idx, criteria):
+    """Which of the atoms idx pass the aa, ~aa and occ criteria; disordered atoms never do."""
+    ok = ~atoms.disordered[idx]
+    for key,val in criteria:
+        key = key.lower()
+        if key == "aa":
+            aa = atoms.aa_upper[idx]
+            ok &= (aa == val.upper()) | (val.upper() == "20" and np.isin(aa,ar.AMINO_ACIDS))
+        elif key == "~aa":
+            ok &= atoms.aa_upper[idx] != val.upper()
+        elif key == "occ":
+            occ = atoms.occupancy[idx]
+            if val.startswith("="):
+                ok &= occ == float(val[1:])
+            elif val.startswith(("<",">")):
+                ok &= in_range(occ,val)
+    return ok
+#--------------------------------------------------------------------
+def pair_passes(separation, distance, criteria):
+    """Which pairs pass the rid (residue separation) and dis criteria."""
+    ok = np.ones(len(distance),dtype=bool)
+    for key,val in criteria:
+        if key.lower() == "rid":
+            ok &= in_range(separation,val,integer=True)
+        elif key.lower() == "dis":
+            ok &= in_range(distance,val)
+    return ok
+#--------------------------------------------------------------------
+def near_range(d, criteria, slack):
+    """Which distances could pass the dis criteria once measured exactly, each bound widened by slack."""
+    ok = np.ones(d.shape,dtype=bool)
+    for key,val in criteria:
+        if key.lower() != "dis":
+            continue
+        if "><" in val:
+            lo,hi = (float(v) for v in val.split("><"))
+            ok &= (d >= lo - slack) & (d <= hi + slack)
+        elif "<>" in val:
+            lo,hi = (float(v) for v in val.split("<>"))
+            ok &= (d <= lo + slack) | (d >= hi - slack)
+        elif val.startswith("<"):
+            ok &= d <= float(val[1:]) + slack
+        elif val.startswith(">"):
+            ok &= d >= float(val[1:]) - slack
+    return ok
+#--------------------------------------------------------------------
+def could_pass(lo, hi, val, integer=False, slack=0.0):
+    """Whether any value from lo to hi could pass a rid or dis criterion value."""
+    def num(s):
+        return int(float(s)) if integer else float(s)
+    if "><" in val:
+        a,b = val.split("><")
+        return lo <= num(b) + slack and hi >= num(a) - slack
+    if "<>" in val:
+        a,b = val.split("<>")
+        return lo <= num(a) + slack or hi >= num(b) - slack
+    if val.startswith("<"):
+        return lo <= num(val[1:]) + slack
+    if val.startswith(">"):
+        return hi >= num(val[1:]) - slack
+    return True
+#--------------------------------------------------------------------
+def box(x, r):
+    # the bounding box and residue number range of the atoms of a tile
+    return x.min(axis=0),x.max(axis=0),r.min(),r.max()
+#--------------------------------------------------------------------
+def tile_could_pass(bs, bc, search, pair):
+    """Whether any pair of a tile could pass the pair criteria, from the boxes and residue ranges of its two sides."""
+    smin,smax,rs_lo,rs_hi = bs
+    cmin,cmax,rc_lo,rc_hi = bc
+    near = np.linalg.norm(np.maximum(0,np.maximum(smin - cmax,cmin - smax)))
+    far = np.linalg.norm(np.maximum(np.abs(smax - cmin),np.abs(cmax - smin)))
+    sep_lo,sep_hi = max(0,rc_lo - rs_hi,rs_lo - rc_hi),max(rc_hi - rs_lo,rs_hi - rc_lo)
+    for key,val in pair:
+        if key.lower() == "dis" and not could_pass(near,far,val,slack=SLACK):
+            return False
+        if key.lower() == "rid" and not could_pass(sep_lo,sep_hi,val,integer=True):
+            return False
+    if search.farthest > 0:
+        # every candidate of the tile is closer than farthest residues to (start + offset)
+        lo,hi = rc_lo - rs_hi - search.offset,rc_hi - rs_lo - search.offset
+        if lo > -search.farthest and hi < search.farthest:
+            return False
+    return True
+#--------------------------------------------------------------------
+def block_pairs(atoms, s, c, search, pair, symmetric, check=None):
+    """For each block of TILE start atoms, (start, candidate rank) of the pairs that could pass the pair criteria.
+
+    Tiles whose bounds rule every pair out are skipped before a distance is measured.
+    """
+    centre = atoms.coords[np.concatenate([s,c])].mean(axis=0) if len(s) + len(c) > 0 else np.zeros(3)
+    xs = (atoms.coords[s] - centre).astype(np.float32)
+    xc = (atoms.coords[c] - centre).astype(np.float32)
+    rs,rc = atoms.rid[s],atoms.rid[c]
+    boxes = [box(xc[j:j + TILE],rc[j:j + TILE]) for j in range(0,len(c),TILE)]
+    for i in range(0,len(s),TILE):
+        if check is not None:
+            check()
+        si = s[i:i + TILE]
+        bs = box(xs[i:i + TILE],rs[i:i + TILE])
+        a_parts,r_parts = [],[]
+        for j in range(0,len(c),TILE):
+            cj = c[j:j + TILE]
+            if symmetric and cj.max() < si.min():
+                continue    # every pair of the tile is found from the other side
+            if not tile_could_pass(bs,boxes[j//TILE],search,pair):
+                continue
+            d2 = np.zeros((len(si),len(cj)),dtype=np.float32)
+            for k in range(3):
+                diff = xs[i:i + TILE,k,None] - xc[None,j:j + TILE,k]
+                d2 += diff * diff
+            ok = near_range(np.sqrt(d2),pair,SLACK)
+            sep = rc[None,j:j + TILE] - rs[i:i + TILE,None]
+            for key,val in pair:
+                if key.lower() == "rid":
+                    ok &= in_range(np.abs(sep),val,integer=True)
+            if search.farthest > 0:
+                ok &= np.abs(sep - search.offset) >= search.farthest
+            if symmetric:
+                ok &= si[:,None] <= cj[None,:]
+            a,r = np.nonzero(ok)
+            a_parts.append(si[a])
+            r_parts.append(j + r)
+        if len(a_parts) > 0:
+            yield np.concatenate(a_parts),np.concatenate(r_parts)
+#--------------------------------------------------------------------
+def nth_nearest(a, d, rank, n):
+    """Positions of each start atom's nth nearest candidate, ties going to the earlier candidate as in maptial."""
+    order = np.lexsort((rank,d,a))
+    first = np.r_[True,a[order][1:] != a[order][:-1]]
+    group = np.maximum.accumulate(np.where(first,np.arange(len(order)),0))
+    return order[np.arange(len(order)) - group == n]
+#--------------------------------------------------------------------
+def chain_atoms(atoms, lo, hi, start, search):
+    """The start atoms and candidates of one chain that pass their atom criteria, and the pair criteria."""
+    start_atom,_ = split_criteria(start.criteria)
+    atom,pair = split_criteria(search.criteria)
+    # criteria about one atom filter both sides before any pair is made, e.g. ~aa|HOH drops the waters here
+    s = selected(atoms,lo,hi,start)
+    s = s[atom_passes(atoms,s,start_atom)]
+    c = selected(atoms,lo,hi,search)
+    c = c[atom_passes(atoms,c,atom)]
+    return s,c,pair
+#--------------------------------------------------------------------
+def start_order(atoms, idx, start):
+    # residue of the start atom, its name in the start list and its place, as calculateGeometry goes
+    values = atoms.element[idx] if start.element else atoms.atom[idx]
+    name_pos = np.zeros(len(idx),dtype=np.int64)
+    for i,n in enumerate(start.names):
+        name_pos[values == n] = i
+    return name_pos,atoms.ridx[idx]
+#--------------------------------------------------------------------
+def chain_pairs(atoms, lo, hi, start, search, symmetric, check=None):
+    # the passing (start, candidate, distance) of one chain, in calculateGeometry's row order
+    s,c,pair = chain_atoms(atoms,lo,hi,start,search)
+    parts = []
+    for a,rank in block_pairs(atoms,s,c,search,pair,symmetric,check):
+        b = c[rank]
+        d = np.sqrt(((atoms.coords[a] - atoms.coords[b])**2).sum(axis=1))
+        ok = pair_passes(np.abs(atoms.rid[b] - atoms.rid[a]),d,pair)
+        a,b,d,rank = a[ok],b[ok],d[ok],rank[ok]
+        if search.nearest != "i":
+            keep = nth_nearest(a,d,rank,search.nearest)
+            a,b,d,rank = a[keep],b[keep],d[keep],rank[keep]
+        parts.append((a,b,d,rank))
+    if len(parts) == 0:
+        empty = np.zeros(0,dtype=np.int64)
+        return empty,empty,np.zeros(0)
+    a,b,d,rank = (np.concatenate(x) for x in zip(*parts))
+    # the start atoms in order, then nearest first
+    name_pos,residue = start_order(atoms,a,start)
+    order = np.lexsort((rank,d,a,name_pos,residue))
+    return a[order],b[order],d[order]
+#--------------------------------------------------------------------
+def rdf_limit(pair):
+    """The largest distance the dis criteria let through, or None."""
+    limits = []
+    for key,val in pair:
+        if key.lower() == "dis" and "<>" not in val:
+            if "><" in val:
+                limits.append(float(val.split("><")[1]))
+            elif val.startswith("<"):
+                limits.append(float(val[1:]))
+    return min(limits) if len(limits) > 0 else None
+#--------------------------------------------------------------------
+def chain_counts(atoms, lo, hi, start, search, shells, check=None):
+    """The anchors of one chain in calculateGeometry's order, and per anchor the passing candidates in each shell."""
+    s,c,pair = chain_atoms(atoms,lo,hi,start,search)
+    if shells > 1:
+        limit = rdf_limit(pair)
+        if limit is None:
+            pair = pair + [("dis",f"<{RDF_MAX}")]
+    position = np.zeros(hi - lo,dtype=np.int64)
+    position[s - lo] = np.arange(len(s))
+    counts = np.zeros(len(s) * shells,dtype=np.int64)
+    for a,rank in block_pairs(atoms,s,c,search,pair,False,check):
+        b = c[rank]
+        d = np.sqrt(((atoms.coords[a] - atoms.coords[b])**2).sum(axis=1))
+        ok = pair_passes(np.abs(atoms.rid[b] - atoms.rid[a]),d,pair)
+        shell = np.minimum((d[ok]/RDF_BIN).astype(np.int64),shells - 1)
+        counts += np.bincount(position[a[ok] - lo] * shells + shell,minlength=len(counts))
+    name_pos,residue = start_order(atoms,s,start)
+    order = np.lexsort((s,name_pos,residue))
+    return s[order],counts.reshape(len(s),shells)[order]
+#--------------------------------------------------------------------
+def frame(atoms, geo, a, b, d):
+    """A calculateGeometry dataframe of one geo from its pairs."""
+    df = pd.DataFrame({geo:d,"pdb_code":atoms.pdb_code,"resolution":atoms.resolution,
+                       "aa":atoms.aa[a],"chain":atoms.chain[a],"rid":atoms.rid[a]})
+    df[f"info_{geo}"] = atoms.info[a] + atoms.info[b]
+    df[f"motif_{geo}"] = atoms.aa[a] + "|" + atoms.aa[b]
+    df[f"occ_{geo}"] = (atoms.occupancy[a] + atoms.occupancy[b])/2
+    df[f"bf_{geo}"] = (atoms.bfactor[a] + atoms.bfactor[b])/2
+    df[f"rid2_{geo}"] = atoms.rid[b]
+    df[f"rid3_{geo}"] = 0
+    df[f"rid4_{geo}"] = 0
+    return df
+#--------------------------------------------------------------------
+def count_frame(atoms, geo, s, counts, aggregate):
+    """A calculateGeometry style dataframe of a COUNT| or RDF| geo, a row per anchor."""
+    df = pd.DataFrame({geo:counts.sum(axis=1),"pdb_code":atoms.pdb_code,"resolution":atoms.resolution,
+                       "aa":atoms.aa[s],"chain":atoms.chain[s],"rid":atoms.rid[s]})
+    info = atoms.info[s]
+    if aggregate == "rdf":
+        info = info + np.array(["[" + ",".join(str(n) for n in row) + "]" for row in counts],dtype=object)
+    df[f"info_{geo}"] = info
+    df[f"motif_{geo}"] = atoms.aa[s]
+    df[f"occ_{geo}"] = atoms.occupancy[s]
+    df[f"bf_{geo}"] = atoms.bfactor[s]
+    df[f"rid2_{geo}"] = 0
+    df[f"rid3_{geo}"] = 0
+    df[f"rid4_{geo}"] = 0
+    return df
+#--------------------------------------------------------------------
+def shells_of(aggregate, search):
+    # COUNT| keeps one shell, RDF| as many as reach its dis limit
+    if aggregate != "rdf":
+        return 1
+    limit = rdf_limit(split_criteria(search.criteria)[1])
+    return max(1,int(np.ceil((RDF_MAX if limit is None else limit)/RDF_BIN)))
+#--------------------------------------------------------------------
+def calculate(pobjs, geo, check=None):
+    """calculateGeometry([geo]) of a supported geo, with each pair of a symmetric search once, or
+    the rows per anchor of COUNT| and RDF|.
+
+    check() is called between rows of tiles and can raise to stop the calculation.
+    """
+    aggregate,(start,search) = qp.parse_geo(geo)
+    symmetric = aggregate is None and is_symmetric(start,search)
+    frames = []
+    for pobj in pobjs:
+        atoms = atoms_of(pobj)
+        if aggregate in COUNTS:
+            shells = shells_of(aggregate,search)
+            parts = [chain_counts(atoms,lo,hi,start,search,shells,check) for _,lo,hi in atoms.chains]
+            if len(parts) > 0:
+                frames.append(count_frame(atoms,geo,np.concatenate([p[0] for p in parts]),
+                                          np.concatenate([p[1] for p in parts]),aggregate))
+            continue
+        pairs = [chain_pairs(atoms,lo,hi,start,search,symmetric,check) for _,lo,hi in atoms.chains]
+        if len(pairs) == 0:
+            continue
+        a,b,d = (np.concatenate(x) for x in zip(*pairs))
+        frames.append(frame(atoms,geo,a,b,d))
+    if len(frames) == 0:
+        return gs.empty(geo)
+    return pd.concat(frames,ignore_index=True)
+#--------------------------------------------------------------------
+def mirror(df, geo):
+    """The hues and columns of geo with each pair of a symmetric search in both directions.
+
+    Pairs of an atom with itself are not repeated, and other geos' columns are left out as they belong to the first atom's residue.
+    """
+    cols = [geo] + gs.HUES + [f"{p}_{geo}" for p in gs.PREFIXES]
+    df = df[cols]
+    aggregate,terms = qp.parse_geo(geo)
+    if not supports(geo) or aggregate is not None or not is_symmetric(*terms) or len(df.index) == 0:
+        return df
+    info = df[f"info_{geo}"].str.extract(r"^(\(.*?\))(\(.*?\))$")
+    other = info[1].str.extract(r"^\(([^|]*)\|([^|]*)\|")
+    rev = df[info[0] != info[1]].copy()
+    rev["aa"] = other.loc[rev.index,1]
+    rev["chain"] = other.loc[rev.index,0]
+    rev["rid"],rev[f"rid2_{geo}"] = df.loc[rev.index,f"rid2_{geo}"],df.loc[rev.index,"rid"]
+    rev[f"info_{geo}"] = info.loc[rev.index,1] + info.loc[rev.index,0]
+    rev[f"motif_{geo}"] = rev[f"motif_{geo}"].str.split("|").str[::-1].str.join("|")
+    return pd.concat([df,rev],ignore_index=True)
+#--------------------------------------------------------------------
+def rdf(df, geo, by="aa"):
+    """Per class of anchor (a column such as aa) and RDF| shell: anchors, mean neighbours and their density.
+
+    The density is neighbours per cubic angstrom of the shell; divided by the density of the
+    candidates in bulk it is g(r).
+    """
+    shells = df[f"info_{geo}"].str.extract(r"\[([\d,]*)\]$")[0].dropna()
+    if len(shells.index) == 0:
+        return pd.DataFrame(columns=[by,"r","anchors","mean","density"])
+    counts = np.array([[int(n) for n in s.split(",")] for s in shells],dtype=np.float64)
+    edges = np.arange(counts.shape[1] + 1) * RDF_BIN
+    volume = 4/3 * np.pi * (edges[1:]**3 - edges[:-1]**3)
+    rows = []
+    for cls,idx in df.loc[shells.index].reset_index(drop=True).groupby(by,sort=True).indices.items():
+        mean = counts[idx].mean(axis=0)
+        for k in range(counts.shape[1]):
+            rows.append({by:cls,"r":edges[k] + RDF_BIN/2,"anchors":len(idx),"mean":mean[k],"density":mean[k]/volume[k]})
+    return pd.DataFrame(rows)
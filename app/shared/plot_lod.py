@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from shared import lazy
+px = lazy.load("plotly.express")
+go = lazy.load("plotly.graph_objs")
+
+# Level of detail for scatter plots.
+# Small results are drawn point for point. Above WEBGL_POINTS the traces are WebGL, above
+# MAX_POINTS only a stratified sample is shipped to the browser, and above RASTER_POINTS the
+# full view is a density raster binned here, with the sample drawn over it. Restricting the
+# axes to a zoom window brings back every point inside it once few enough remain.
+
+WEBGL_POINTS = 1000
+MAX_POINTS = 20000
+RASTER_POINTS = 200000
+RASTER_BINS = 200
+VOXEL_BINS = 40
+
+#--------------------------------------------------------------------
+def is_discrete(series):
+    return not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)
+#--------------------------------------------------------------------
+def window(df, x, y, x_range=None, y_range=None):
+    """The rows inside the x and y ranges (either may be None for the full axis)."""
+    mask = np.ones(len(df),dtype=bool)
+    if x_range is not None:
+        mask &= (df[x] >= x_range[0]).to_numpy() & (df[x] <= x_range[1]).to_numpy()
+    if y_range is not None:
+        mask &= (df[y] >= y_range[0]).to_numpy() & (df[y] <= y_range[1]).to_numpy()
+    if mask.all():
+        return df
+    return df[mask]
+#--------------------------------------------------------------------
+def stratified_sample(df, n, by=None, seed=0):
+    """At most about n rows, drawn in proportion from each group of by (at least one per group)."""
+    if len(df) <= n:
+        return df
+    rng = np.random.default_rng(seed)
+    shuffled = df.iloc[rng.permutation(len(df))]
+    if by is None or by not in df.columns or not is_discrete(df[by]):
+        return shuffled.iloc[:n].sort_index()
+    groups = shuffled.groupby(by,observed=True,sort=False,dropna=False)
+    quota = np.maximum(1,np.round(groups[by].transform("size").to_numpy() * n / len(df)))
+    keep = groups.cumcount().to_numpy() < quota
+    return shuffled[keep].sort_index()
+#--------------------------------------------------------------------
+def density_raster(df, x, y, bins=RASTER_BINS):
+    """A heatmap trace of log point counts on a bins x bins grid."""
+    xs = df[x].to_numpy(dtype=np.float64)
+    ys = df[y].to_numpy(dtype=np.float64)
+    ok = np.isfinite(xs) & np.isfinite(ys)
+    counts,xe,ye = np.histogram2d(xs[ok],ys[ok],bins=bins)
+    z = np.where(counts > 0,np.log10(counts + 1),np.nan)
+    return go.Heatmap(x=(xe[:-1] + xe[1:])/2,y=(ye[:-1] + ye[1:])/2,z=z.T,colorscale="Greys",
+                      showscale=False,hoverinfo="skip",name="density")
+#--------------------------------------------------------------------
+def describe(n_shown, n_total, by=None, raster=False):
+    if n_shown == n_total:
+        return ""
+    note = f"Showing {n_shown:,} of {n_total:,} points"
+    if by is not None:
+        note += f", sampled in proportion to {by}"
+    if raster:
+        note += ", over a density raster of all points"
+    return note + ". Narrow the axis ranges to see every point in a region."
+#--------------------------------------------------------------------
+def scatter(df, x, y, color=None, x_range=None, y_range=None, **kwargs):
+    """px.scatter with level of detail; returns the figure and a note of what was left out (or "")."""
+    df = window(df,x,y,x_range,y_range)
+    n_total = len(df)
+    by = color if color is not None and color in df.columns and is_discrete(df[color]) else None
+    raster = n_total > RASTER_POINTS
+    df_pts = stratified_sample(df,MAX_POINTS,by=by)
+    render_mode = "webgl" if len(df_pts) > WEBGL_POINTS else "svg"
+    fig = px.scatter(df_pts,x=x,y=y,color=color,render_mode=render_mode,**kwargs)
+    if raster:
+        fig.add_trace(density_raster(df,x,y))
+        fig.data = (fig.data[-1],) + fig.data[:-1]
+    return fig, describe(len(df_pts),n_total,by,raster)
+#--------------------------------------------------------------------
+def voxel_trace(df, x, y, z, bins=VOXEL_BINS):
+    """A 3d scatter trace of the occupied voxels of a bins^3 grid, coloured by log point count."""
+    pts = df[[x,y,z]].to_numpy(dtype=np.float64)
+    pts = pts[np.isfinite(pts).all(axis=1)]
+    counts,edges = np.histogramdd(pts,bins=bins)
+    idx = np.nonzero(counts)
+    centres = [(e[:-1] + e[1:])[i]/2 for e,i in zip(edges,idx)]
+    return go.Scatter3d(x=centres[0],y=centres[1],z=centres[2],mode="markers",name="density",
+                        marker=dict(size=3,color=np.log10(counts[idx] + 1),colorscale="Greys",opacity=0.3),
+                        hovertext=[f"{int(c)} points" for c in counts[idx]],hoverinfo="text")
+#--------------------------------------------------------------------
+def scatter_3d(df, x, y, z, color=None, **kwargs):
+    """px.scatter_3d (always WebGL) with the same sampling and a voxel density layer at high counts."""
+    n_total = len(df)
+    by = color if color is not None and color in df.columns and is_discrete(df[color]) else None
+    raster = n_total > RASTER_POINTS
+    df_pts = stratified_sample(df,MAX_POINTS,by=by)
+    fig = px.scatter_3d(df_pts,x=x,y=y,z=z,color=color,**kwargs)
+    if raster:
+        fig.add_trace(voxel_trace(df,x,y,z))
+    return fig, describe(len(df_pts),n_total,by,raster)
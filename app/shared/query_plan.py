@@ -0,0 +1,289 @@
+import math
+import os
+import re
+from collections import Counter
+import pandas as pd
+from shared import config as cfg
+from shared import atom_arrays as ar
+
+# Cost estimates (EXPLAIN) for geos before they are calculated.
+# Per-structure statistics are counted from the coordinate file without parsing it into a structure:
+# per chain, the residues and the atoms of each (residue name, atom name) that maptial would use
+# (first model, full occupancy). A geo is read as maptial reads it, and for each structure the
+# estimate follows how calculateGeometry works: for every start atom it scans the residues of the
+# chain, measures to every candidate of a {}/() search in the chain and keeps those passing the
+# criteria. Distance criteria are estimated from the density of a folded protein, so a contact
+# count is about right for a globular chain and high for an extended one. The per-evaluation and
+# per-row costs were measured on the pdb1t29 fixture and tiled copies of it up to 10k atoms, where
+# estimates were mostly within a factor of two. All-pairs searches calculated by pair_search are
+# costed per tiled pair and per row of its frame instead, with symmetric pairs counted once, and
+# COUNT| and RDF| have a row per start atom.
+# Before any of that, a structure's composition from the metadata index (counts of atom names and
+# residue types) can show that a geo has no rows there at all, e.g. SG:{SG&1} where there is no
+# SG; as the geos are joined per residue, the structure is then skipped without reading its
+# coordinates.
+
+ATOM_VOLUME = 18.0          # cubic angstroms per heavy atom in a folded protein
+SECONDS_PER_SCAN = 2.0e-7   # one residue visited looking for a match
+SECONDS_PER_PAIR = 4.0e-6   # one candidate measured and checked against the criteria
+SECONDS_PER_ROW = 2.0e-5    # one output row, including the dataframe
+BYTES_PER_ROW = 600        # peak, while calculateGeometry holds the rows as python lists
+ARRAY_SECONDS_PER_PAIR = 3.0e-8     # pair_search: one pair of a tile
+ARRAY_SECONDS_PER_ROW = 2.0e-6
+ARRAY_BYTES_PER_ROW = 250
+AGGREGATES = ["MAXDIS|","MINDIS|","SUMDIS|","COUNT|","RDF|"]
+
+_STATS = {}
+
+class Term:
+    def __init__(self, names, element, search, nearest, farthest, offset, criteria):
+        self.names = names          # atom names, or elements when element is true
+        self.element = element
+        self.search = search        # {} or (): candidates from the whole chain rather than one residue
+        self.nearest = nearest      # "i" for all, or the index of the nearest kept
+        self.farthest = farthest    # at least this many residues away
+        self.offset = offset
+        self.criteria = criteria    # [(key, value)]
+
+#--------------------------------------------------------------------
+def parse_geo(geo):
+    """The aggregate (or None) and the Terms of a geo, read as maptial's geoToAtoms reads it."""
+    aggregate = None
+    for agg in AGGREGATES:
+        if geo[:len(agg)].upper() == agg:
+            aggregate = agg[:-1].lower()
+            geo = geo[len(agg):]
+    terms = []
+    for g in geo.split(":"):
+        criteria = []
+        if "[" in g and "]" in g:
+            g,crit = g.split("[",1)
+            criteria = [tuple(c.split("|",1)) for c in crit[:-1].split(",") if "|" in c]
+        offset = 0
+        m = re.fullmatch(r"(.*?)([+-])(\d+)",g)
+        if m is not None and not g.endswith(("}",")")):
+            g,offset = m.group(1),int(m.group(3)) * (1 if m.group(2) == "+" else -1)
+        search = g[:1] in "{(" and g[-1:] in "})"
+        element = g[:1] == "("
+        body = g[1:-1] if search else g
+        nearest,farthest = None,0
+        if "@" in body:
+            body,n = body.split("@",1)
+            nearest = "i" if n == "i" else int(n)
+        if "&" in body:
+            body,n = body.split("&",1)
+            farthest = int(n)
+        if search and nearest is None:
+            nearest = 0
+        # only the outer brackets select elements: maptial reads N:{(O),(N)} as atoms named (O) and (N)
+        names = body.split(",")
+        terms.append(Term(names,element,search,nearest,farthest,offset,criteria))
+    return aggregate,terms
+#--------------------------------------------------------------------
+def read_stats(filepath):
+    """Per chain: residues, atoms, and atoms per (residue name, atom name), counted from a pdb or cif file."""
+    chains = {}
+    def add(chain, rid, resname, atom, altloc, occupancy):
+        ch = chains.setdefault(chain,{"residues":set(),"atoms":0,"counts":Counter()})
+        ch["residues"].add(rid)
+        if altloc in ("",".","?") and occupancy >= 1:
+            # partly occupied atoms never match maptial's criteria
+            ch["atoms"] += 1
+            ch["counts"][(resname,atom)] += 1
+    with open(filepath) as fr:
+        if filepath.endswith(".cif"):
+            cols = []
+            for line in fr:
+                if line.startswith("_atom_site."):
+                    cols.append(line.strip().split(".",1)[1])
+                elif len(cols) > 0 and line.startswith(("ATOM","HETATM")):
+                    vals = line.split()
+                    row = dict(zip(cols,vals))
+                    if row.get("pdbx_PDB_model_num","1") != "1":
+                        break
+                    add(row.get("auth_asym_id",""),row.get("auth_seq_id",""),row.get("auth_comp_id",""),
+                        row.get("auth_atom_id","").strip('"'),row.get("label_alt_id","."),float(row.get("occupancy",1)))
+                elif len(cols) > 0 and line.startswith("#"):
+                    break
+        else:
+            for line in fr:
+                if line.startswith("ENDMDL"):
+                    break
+                if line.startswith(("ATOM  ","HETATM")):
+                    try:
+                        occupancy = float(line[54:60])
+                    except ValueError:
+                        occupancy = 1.0
+                    add(line[21],line[22:27].strip(),line[17:20].strip(),line[12:16].strip(),line[16].strip(),occupancy)
+    for ch in chains.values():
+        ch["residues"] = len(ch["residues"])
+    return chains
+#--------------------------------------------------------------------
+def structure_stats(filepath):
+    """read_stats, kept per file until the file changes."""
+    key = (filepath,os.path.getmtime(filepath))
+    if key not in _STATS:
+        _STATS[key] = read_stats(filepath)
+    return _STATS[key]
+#--------------------------------------------------------------------
+def matching(counts, term, criteria=True):
+    # atoms in a chain a term can match, with its aa criteria if asked
+    n = 0
+    for (resname,atom),c in counts.items():
+        if term.element:
+            ok = atom[:1] in term.names
+        else:
+            ok = atom in term.names
+        if ok and criteria:
+            for key,val in term.criteria:
+                is_aa = resname.upper() == val.upper() or (key.lower() == "aa" and val == "20" and resname.upper() in ar.AMINO_ACIDS)
+                if (key.lower() == "aa" and not is_aa) or (key.lower() == "~aa" and is_aa):
+                    ok = False
+        if ok:
+            n += c
+    return n
+#--------------------------------------------------------------------
+def within(d, n_candidates, n_atoms):
+    # candidates expected within d of an atom of a folded chain of n_atoms
+    volume = max(n_atoms,1) * ATOM_VOLUME
+    return n_candidates * min(1.0,(4/3 * math.pi * d**3)/volume)
+#--------------------------------------------------------------------
+def bounds(val):
+    # a criterion value as (low, high, between): "a><b", "a<>b" (extremes), "<b" or ">a"
+    if "><" in val:
+        lo,hi = val.split("><")
+        return float(lo),float(hi),True
+    if "<>" in val:
+        lo,hi = val.split("<>")
+        return float(lo),float(hi),False
+    if val.startswith("<"):
+        return 0.0,float(val[1:]),True
+    if val.startswith(">"):
+        return float(val[1:]),math.inf,True
+    return None
+#--------------------------------------------------------------------
+def passing(term, n_candidates, n_atoms, n_residues):
+    """Candidates of a search term expected to pass its dis and rid criteria."""
+    kept = n_candidates
+    for key,val in term.criteria:
+        b = bounds(val) if key.lower() in ["dis","rid"] else None
+        if b is None:
+            continue
+        lo,hi,between = b
+        if key.lower() == "dis":
+            inside = within(hi,n_candidates,n_atoms) - within(lo,n_candidates,n_atoms)
+        else:
+            # residues whose separation is within [lo, hi]
+            inside = n_candidates * min(1.0,(2*(min(hi,n_residues) - lo) + (1 if lo == 0 else 2))/max(n_residues,1))
+        kept = kept * (inside/n_candidates if between else 1 - inside/n_candidates) if n_candidates > 0 else 0
+    return kept
+#--------------------------------------------------------------------
+def explain(stats, geo):
+    """Estimated starts, residue scans, pair evaluations, rows, megabytes and seconds of one geo on one structure."""
+    from shared import pair_search as ps     # which imports this module
+    aggregate,terms = parse_geo(geo)
+    arrays = ps.supports(geo)
+    per_anchor = aggregate in ps.COUNTS
+    share = 0.5 if arrays and not per_anchor and ps.is_symmetric(*terms) else 1.0
+    est = {"geo":geo,"starts":0,"scans":0.0,"pairs":0.0,"rows":0.0}
+    for ch in stats.values():
+        counts,n_atoms,n_res = ch["counts"],ch["atoms"],ch["residues"]
+        starts = matching(counts,terms[0])
+        per_start = 1.0
+        for term in terms[1:]:
+            est["scans"] += starts * n_res
+            if term.search:
+                cand = matching(counts,term,criteria=False)
+                if term.farthest > 0:
+                    cand = cand * max(0.0,1 - (2*term.farthest - 1)/max(n_res,1))
+                est["pairs"] += starts * cand
+                kept = passing(term,matching(counts,term) * (cand/max(matching(counts,term,criteria=False),1)),n_atoms,n_res)
+                per_start *= kept if term.nearest == "i" else min(1.0,max(kept - term.nearest,0))
+            else:
+                # the atom of that name in the start atom's (offset) residue, when there is one
+                per_start *= min(1.0,matching(counts,term)/max(starts,1))
+        est["starts"] += starts
+        # COUNT| and RDF| give a row per start atom however many pairs they count
+        est["rows"] += starts if per_anchor else starts * per_start
+    if arrays:
+        est["scans"],est["pairs"],est["rows"] = 0,est["pairs"] * share,est["rows"] * share
+        est["mb"] = round(est["rows"] * ARRAY_BYTES_PER_ROW/1e6,1)
+        est["seconds"] = round(est["pairs"] * ARRAY_SECONDS_PER_PAIR + est["rows"] * ARRAY_SECONDS_PER_ROW,2)
+    else:
+        est["mb"] = round(est["rows"] * BYTES_PER_ROW/1e6,1)
+        est["seconds"] = round(est["scans"] * SECONDS_PER_SCAN + est["pairs"] * SECONDS_PER_PAIR + est["rows"] * SECONDS_PER_ROW,2)
+    est["rows"] = round(est["rows"])
+    est["scans"],est["pairs"] = int(est["scans"]),int(est["pairs"])
+    return est
+#--------------------------------------------------------------------
+def can_match(composition, geo):
+    """False when a structure's composition (metadata_index.compositions) shows geo cannot have a row there.
+
+    Every atom of a geo has to be found for a row, except the search of an aggregate such as COUNT|,
+    which can come up empty. The check is by atom name (or first letter, which is the element
+    maptial gives an atom) and by the aa criteria, each on its own, so it only ever rules out.
+    """
+    if composition is None:
+        return True
+    aggregate,terms = parse_geo(geo)
+    atoms = [name for name,n in composition.get("atom",{}).items() if n > 0]
+    residues = [name.upper() for name,n in composition.get("residue",{}).items() if n > 0]
+    for term in terms[:1] if aggregate is not None else terms:
+        if term.element:
+            found = any(name[:1] in term.names for name in atoms)
+        else:
+            found = any(name in term.names for name in atoms)
+        for key,val in term.criteria:
+            if key.lower() == "aa" and val == "20":
+                found = found and any(r in ar.AMINO_ACIDS for r in residues)
+            elif key.lower() == "aa":
+                found = found and val.upper() in residues
+        if not found:
+            return False
+    return True
+#--------------------------------------------------------------------
+def skipped(geo):
+    # the estimate of a (structure, geo) the composition rules out
+    return {"geo":geo,"starts":0,"scans":0,"pairs":0,"rows":0,"mb":0.0,"seconds":0.0,"skip":True}
+#--------------------------------------------------------------------
+def plan(stats_by_code, geos, compositions=None):
+    """explain for every structure and geo, and the totals of the run as calculate_geos does it.
+
+    Each geo is calculated on its own, so the seconds add up and the peak memory is the largest; the
+    geos of a structure are then joined per residue, so their rows multiply. A structure whose
+    composition rules out any of the geos is skipped, and needs no stats.
+    """
+    compositions = compositions or {}
+    rows = []
+    totals = {"rows":0,"mb":0.0,"seconds":0.0}
+    for code in dict.fromkeys(list(stats_by_code) + list(compositions)):
+        comp,stats = compositions.get(code),stats_by_code.get(code)
+        if not all(can_match(comp,geo) for geo in geos):
+            # the geos are joined per residue, so one with no rows leaves the structure none
+            ests = [skipped(geo) for geo in geos]
+        elif stats is not None:
+            ests = [{**explain(stats,geo),"skip":False} for geo in geos]
+        else:
+            continue
+        for est in ests:
+            rows.append({"pdb_code":code,**est})
+            totals["seconds"] += est["seconds"]
+            totals["mb"] = max(totals["mb"],est["mb"])
+        counts = [max(est["rows"],0) for est in ests]
+        if len(counts) > 0:
+            base = max(min(counts),1)
+            joined = base
+            for c in counts:
+                joined *= c/base
+            totals["rows"] += int(joined)
+    totals["mb"] = round(max(totals["mb"],totals["rows"] * BYTES_PER_ROW/1e6),1)
+    totals["seconds"] = round(totals["seconds"],1)
+    return pd.DataFrame(rows),totals
+#--------------------------------------------------------------------
+def verdict(totals):
+    """ok, confirm or refuse for the totals of a plan, against the limits in config."""
+    if totals["seconds"] > cfg.PLAN_REFUSE_SECONDS or totals["mb"] > cfg.PLAN_REFUSE_MB:
+        return "refuse"
+    if totals["seconds"] > cfg.PLAN_CONFIRM_SECONDS or totals["mb"] > cfg.PLAN_CONFIRM_MB:
+        return "confirm"
+    return "ok"
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+
+# Approximate Ramachandran regions by table lookup.
+# Each residue class (general, PRO, GLY, pre-PRO) has a binned phi/psi probability grid
+# with the favoured/allowed density levels stored alongside it, so classifying a residue is
+# a periodic bilinear lookup into a small array rather than anything per-residue in python.
+#
+# The grids are NOT binned from a reference dataset: they are a hand-placed von Mises mixture
+# over the regions described by Lovell et al. (2003), i.e. the same regions drawn in the
+# rama_*.png overlays, saved to static/rama_grids.npz. The regions are only a rough guide, so
+# residues beyond the allowed level are called "unusual" rather than outliers; an npz with the
+# same layout binned from an empirical reference set can be dropped in its place.
+
+GRID_PATH = "app/static/rama_grids.npz"
+BIN_DEG = 2
+N_BINS = 360 // BIN_DEG
+RAMA_CLASSES = ["general","pro","gly","prepro"]
+FAVOURED_MASS = 0.98    # Lovell 2003: favoured regions hold 98% of the data
+ALLOWED_MASS = 0.9995   # and allowed regions 99.95%
+
+REGIONS = ["favoured","allowed","unusual"]
+
+PHI = "C-1:N:CA:C"
+PSI = "N:CA:C:N+1"
+
+# (phi, psi, sd_phi, sd_psi, weight) in degrees
+MIXTURES = {}
+MIXTURES["general"] = [
+    (-63,-42,10,10,0.38),   # right-handed alpha
+    (-90,-15,18,16,0.07),   # alpha/bridge
+    (-120,15,20,18,0.04),   # bridge
+    (-118,130,24,18,0.22),  # beta
+    (-67,142,11,14,0.13),   # polyproline II
+    (-135,80,16,16,0.03),   # zeta/gamma'
+    (-140,170,22,16,0.06),  # extended beta, wrapping psi=180
+    (-100,-175,20,12,0.015),
+    (60,40,10,12,0.04),     # left-handed alpha
+    (75,5,10,12,0.008),
+    (75,-170,12,14,0.004),  # epsilon'
+]
+MIXTURES["pro"] = [
+    (-65,142,9,14,0.50),    # polyproline II
+    (-62,-32,9,13,0.40),    # alpha
+    (-88,75,10,12,0.04),    # gamma'
+    (-70,-5,8,12,0.06),     # alpha/bridge
+]
+MIXTURES["gly"] = [
+    (-65,-40,12,12,0.16),   # right-handed alpha
+    (65,40,12,12,0.16),     # left-handed alpha
+    (-85,5,15,15,0.07),
+    (85,-5,15,15,0.07),
+    (-80,175,18,18,0.16),   # extended, both halves of the symmetric map
+    (80,-175,18,18,0.16),
+    (180,180,18,18,0.14),
+    (-120,160,20,20,0.04),
+    (120,-160,20,20,0.04),
+]
+MIXTURES["prepro"] = [
+    (-120,130,20,16,0.32),  # beta
+    (-65,140,12,14,0.28),   # polyproline II
+    (-140,75,14,14,0.10),   # zeta
+    (-63,-38,10,12,0.22),   # alpha
+    (-90,-10,15,15,0.05),
+    (57,45,10,12,0.03),     # left-handed alpha
+]
+
+#--------------------------------------------------------------------
+def bin_centres():
+    return -180 + BIN_DEG/2 + BIN_DEG*np.arange(N_BINS)
+#--------------------------------------------------------------------
+def mixture_grid(components):
+    """Probability per bin (sums to 1) of a von Mises mixture, rows phi and columns psi."""
+    rad = np.radians(bin_centres())
+    grid = np.zeros((N_BINS,N_BINS))
+    for phi,psi,sd_phi,sd_psi,weight in components:
+        k_phi = 1/np.radians(sd_phi)**2
+        k_psi = 1/np.radians(sd_psi)**2
+        p_phi = np.exp(k_phi*(np.cos(rad - np.radians(phi))-1))
+        p_psi = np.exp(k_psi*(np.cos(rad - np.radians(psi))-1))
+        comp = np.outer(p_phi,p_psi)
+        grid += weight * comp / comp.sum()
+    return grid / grid.sum()
+#--------------------------------------------------------------------
+def mass_level(grid, mass):
+    """The density at which the highest bins together contain the given probability mass."""
+    vals = np.sort(grid.ravel())[::-1]
+    cum = np.cumsum(vals)
+    return vals[min(np.searchsorted(cum,mass),len(vals)-1)]
+#--------------------------------------------------------------------
+def build_grids():
+    grids = {}
+    for rc in RAMA_CLASSES:
+        grid = mixture_grid(MIXTURES[rc])
+        levels = np.array([mass_level(grid,FAVOURED_MASS),mass_level(grid,ALLOWED_MASS)])
+        scale = grid.max()
+        grids[rc] = (grid/scale).astype(np.float16), (levels/scale).astype(np.float32)
+    return grids
+#--------------------------------------------------------------------
+def save_grids(path=GRID_PATH):
+    grids = build_grids()
+    arrs = {}
+    for rc,(grid,levels) in grids.items():
+        arrs[rc] = grid
+        arrs[f"{rc}_levels"] = levels
+    np.savez_compressed(path,bin_deg=np.array(BIN_DEG),**arrs)
+#--------------------------------------------------------------------
+_GRIDS = {}
+def load_grids(path=GRID_PATH):
+    if path not in _GRIDS:
+        try:
+            npz = np.load(path)
+            grids = {rc:(npz[rc],npz[f"{rc}_levels"]) for rc in RAMA_CLASSES}
+        except (OSError,KeyError):
+            grids = build_grids()
+        _GRIDS[path] = grids
+    return _GRIDS[path]
+#--------------------------------------------------------------------
+def lookup(grid, phi, psi):
+    """Periodic bilinear interpolation of a grid at arrays of phi/psi in degrees."""
+    n = grid.shape[0]
+    bin_deg = 360 / n
+    fx = (np.asarray(phi,dtype=np.float64) + 180 - bin_deg/2) / bin_deg
+    fy = (np.asarray(psi,dtype=np.float64) + 180 - bin_deg/2) / bin_deg
+    x0 = np.floor(fx)
+    y0 = np.floor(fy)
+    tx = fx - x0
+    ty = fy - y0
+    x0 = x0.astype(np.int64) % n
+    y0 = y0.astype(np.int64) % n
+    x1 = (x0 + 1) % n
+    y1 = (y0 + 1) % n
+    g = grid.astype(np.float32,copy=False)
+    return ((1-tx)*(1-ty)*g[x0,y0] + tx*(1-ty)*g[x1,y0]
+            + (1-tx)*ty*g[x0,y1] + tx*ty*g[x1,y1])
+#--------------------------------------------------------------------
+def residue_classes(df_geos):
+    """general/pro/gly/prepro per row, pre-PRO being any residue whose next residue is PRO."""
+    aa = df_geos["aa"].astype(str).str.upper()
+    keys = pd.MultiIndex.from_arrays([df_geos["pdb_code"],df_geos["chain"],df_geos["rid"]])
+    pro = df_geos[aa == "PRO"]
+    pro_keys = pd.MultiIndex.from_arrays([pro["pdb_code"],pro["chain"],pro["rid"]-1])
+    prepro = keys.isin(pro_keys)
+    classes = np.full(len(df_geos.index),"general",dtype=object)
+    classes[prepro] = "prepro"
+    classes[(aa == "GLY").to_numpy()] = "gly"
+    classes[(aa == "PRO").to_numpy()] = "pro"
+    return classes
+#--------------------------------------------------------------------
+def classify(df_geos, phi=PHI, psi=PSI, grids=None):
+    """Adds rama_class, rama_score and rama_region columns to a geo dataframe with phi and psi,
+    the region being one of REGIONS in the approximate model.
+
+    Residues without both angles, e.g. at the ends of a chain or either side of a gap, have no score or region.
+    """
+    if grids is None:
+        grids = load_grids()
+    df = df_geos.copy()
+    classes = residue_classes(df)
+    scores = np.full(len(df.index),np.nan,dtype=np.float32)
+    regions = np.full(len(df.index),"",dtype=object)
+    phis = pd.to_numeric(df[phi],errors="coerce").to_numpy(dtype=np.float64)
+    psis = pd.to_numeric(df[psi],errors="coerce").to_numpy(dtype=np.float64)
+    ok = np.isfinite(phis) & np.isfinite(psis)
+    for rc in RAMA_CLASSES:
+        mask = (classes == rc) & ok
+        if not mask.any():
+            continue
+        grid,levels = grids[rc]
+        sc = lookup(grid,phis[mask],psis[mask])
+        scores[mask] = sc
+        regions[mask] = np.where(sc >= levels[0],REGIONS[0],np.where(sc >= levels[1],REGIONS[1],REGIONS[2]))
+    df["rama_class"] = classes
+    df["rama_score"] = scores
+    df["rama_region"] = regions
+    return df
+#--------------------------------------------------------------------
+def summary(df_rama):
+    """Per-structure counts and percentages of residues in each approximate region."""
+    counts = df_rama.groupby(["pdb_code","rama_region"]).size().unstack(fill_value=0)
+    for region in REGIONS:
+        if region not in counts.columns:
+            counts[region] = 0
+    counts = counts[REGIONS]
+    total = counts.sum(axis=1)
+    df = counts.copy()
+    df["residues"] = total
+    for region in REGIONS:
+        df[f"%{region}"] = (100 * counts[region] / total).round(2)
+    return df.reset_index()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+from shared import compute_cache as cc
+
+# Distance profiles along the chain from chosen residues.
+# The CA atoms of each structure are pulled out of the atoms dataframe once into a block of
+# residue numbers and coordinates, and the distances from any number of reference residues to
+# every CA of the block are then a single broadcast, so only the cheap step reruns per slider move.
+# The blocks are cached in cc.RESULTS by the fingerprint of the atoms they are made from.
+
+#--------------------------------------------------------------------
+def chain_atoms(df_atoms, chain="A", atom="CA"):
+    """The pdb_code, rid and coordinates of the named atom in every residue of the chain."""
+    df = df_atoms[(df_atoms["atom"] == atom) & (df_atoms["chain"] == chain)]
+    return df.drop_duplicates(subset=["pdb_code","rid"])[["pdb_code","rid","x","y","z"]]
+#--------------------------------------------------------------------
+def cached_blocks(df_atoms, chain="A", atom="CA"):
+    """ca_blocks, computed once for the same atoms whichever frame or session they come from."""
+    df = chain_atoms(df_atoms,chain,atom)
+    return cc.RESULTS.get_or_compute(("ca_blocks",cc.fingerprint(df)),lambda: blocks_of(df))
+#--------------------------------------------------------------------
+def ca_blocks(df_atoms, chain="A", atom="CA"):
+    """{pdb_code: (rid, xyz)} for the atom of every residue of the chain, sorted by rid."""
+    return blocks_of(chain_atoms(df_atoms,chain,atom))
+#--------------------------------------------------------------------
+def blocks_of(df):
+    blocks = {}
+    for pdb_code,df_one in df.groupby("pdb_code",sort=False):
+        df_one = df_one.sort_values("rid")
+        blocks[pdb_code] = (df_one["rid"].to_numpy(dtype=np.int64),df_one[["x","y","z"]].to_numpy(dtype=np.float64))
+    return blocks
+#--------------------------------------------------------------------
+def profile(blocks, ref_rids, start_rid=None, end_rid=None):
+    """Distances from each reference residue to every residue in [start_rid, end_rid], per structure.
+
+    Structures without a reference residue are left out for that residue.
+    """
+    ref_rids = np.atleast_1d(np.asarray(ref_rids,dtype=np.int64))
+    codes,refs,rids,mags = [],[],[],[]
+    for pdb_code,(rid,xyz) in blocks.items():
+        if len(rid) == 0:
+            continue
+        pos = np.searchsorted(rid,ref_rids).clip(0,len(rid)-1)
+        found = rid[pos] == ref_rids
+        if not found.any():
+            continue
+        in_range = np.ones(len(rid),dtype=bool)
+        if start_rid is not None:
+            in_range &= rid >= start_rid
+        if end_rid is not None:
+            in_range &= rid <= end_rid
+        dis = np.linalg.norm(xyz[in_range][None,:,:] - xyz[pos[found]][:,None,:],axis=2)
+        codes.append(np.full(dis.size,pdb_code,dtype=object))
+        refs.append(np.repeat(ref_rids[found],dis.shape[1]))
+        rids.append(np.tile(rid[in_range],dis.shape[0]))
+        mags.append(dis.ravel())
+    if len(codes) == 0:
+        return pd.DataFrame(columns=["pdb_code","ref_rid","rid","magnitude"])
+    return pd.DataFrame({"pdb_code":np.concatenate(codes),"ref_rid":np.concatenate(refs),
+                         "rid":np.concatenate(rids),"magnitude":np.concatenate(mags)})
@@ -0,0 +1,140 @@
+import math
+import operator
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Paged display of result dataframes.
+# st.dataframe sends every row to the browser, and what is inside an expander is sent whether or
+# not it is opened, so a result is shown as its size, a per-column summary and one page of rows.
+# Filtering (a column, an operator from a fixed list and a value read as the column's type, never
+# evaluated as code), sorting and paging happen on the server: the row order of a filter and sort
+# is worked out once and kept, so turning a page only slices it. The summary and
+# the orders are kept against a weak reference to the dataframe and go when it does, e.g. when a
+# new result replaces it or the session frame is spilled to disk.
+
+PAGE_SIZES = [50,100,500,1000]
+MAX_ORDERS = 4      # filter and sort combinations kept per dataframe
+OPERATORS = {"==":operator.eq,"!=":operator.ne,"<":operator.lt,"<=":operator.le,">":operator.gt,">=":operator.ge,"contains":None}
+
+_lock = threading.Lock()
+_views = {}     # id(df) -> (weak reference, {"summary": df, "orders": {(filter, sort, descending): positions}})
+
+#--------------------------------------------------------------------
+def view_of(df):
+    # the cached summary and orders of df, dropped when df is garbage collected
+    key = id(df)
+    with _lock:
+        entry = _views.get(key)
+        if entry is None or entry[0]() is not df:
+            ref = weakref.ref(df,lambda r,key=key: _views.pop(key,None))
+            entry = _views[key] = (ref,{"summary":None,"orders":{}})
+        return entry[1]
+#--------------------------------------------------------------------
+def summarise(df):
+    """Per column: type, non-null count, and min, mean and max of numbers or the distinct count of anything else."""
+    rows = []
+    for col in df.columns:
+        s = df[col]
+        row = {"column":str(col),"type":str(s.dtype),"non_null":int(s.notna().sum())}
+        if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            row.update({"min":s.min(),"mean":s.mean(),"max":s.max()})
+        else:
+            try:
+                row["distinct"] = int(s.nunique())
+            except TypeError:
+                pass    # unhashable values
+        rows.append(row)
+    return pd.DataFrame(rows)
+#--------------------------------------------------------------------
+def parse_value(s, text):
+    """text as a value of the column s's type; ValueError if it is not one."""
+    text = text.strip()
+    if pd.api.types.is_bool_dtype(s):
+        if text.lower() not in ["true","false","1","0"]:
+            raise ValueError(f"{text} is not true or false")
+        return text.lower() in ["true","1"]
+    if pd.api.types.is_numeric_dtype(s):
+        try:
+            return int(text) if pd.api.types.is_integer_dtype(s) and text.lstrip("+-").isdigit() else float(text)
+        except ValueError:
+            raise ValueError(f"{text} is not a number") from None
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return pd.Timestamp(text)
+    return text
+#--------------------------------------------------------------------
+def filter_mask(df, column, op, text):
+    """The rows where column op value is true, with text read as the column's type."""
+    if column not in df.columns:
+        raise ValueError(f"There is no column {column}")
+    if op not in OPERATORS:
+        raise ValueError(f"{op} is not one of {', '.join(OPERATORS)}")
+    s = df[column]
+    if op == "contains":
+        if pd.api.types.is_numeric_dtype(s) or pd.api.types.is_datetime64_any_dtype(s):
+            raise ValueError("contains is for text columns")
+        mask = s.astype(str).str.contains(text.strip(),regex=False) & s.notna()
+    else:
+        value = parse_value(s,text)
+        try:
+            mask = OPERATORS[op](s,value)
+        except TypeError:
+            raise ValueError(f"{column} values cannot be compared with {op}") from None
+    return mask.to_numpy(dtype=bool,na_value=False)
+#--------------------------------------------------------------------
+def row_order(df, where=None, sort=None, descending=False):
+    """Positions of the rows passing the filter where, (column, operator, value text) or None, in sort order."""
+    positions = np.arange(len(df.index))
+    if where is not None:
+        positions = np.flatnonzero(filter_mask(df,*where))
+    if sort is not None:
+        values = df[sort].iloc[positions].reset_index(drop=True)
+        positions = positions[values.sort_values(ascending=not descending,kind="stable",na_position="last").index.to_numpy()]
+    return positions
+#--------------------------------------------------------------------
+def cached_order(df, where, sort, descending):
+    view = view_of(df)
+    key = (where,sort,descending)
+    if key not in view["orders"]:
+        if len(view["orders"]) >= MAX_ORDERS:
+            view["orders"].pop(next(iter(view["orders"])))
+        view["orders"][key] = row_order(df,where,sort,descending)
+    return view["orders"][key]
+#--------------------------------------------------------------------
+def show(df, name):
+    """The size, column summary and one page of df, with filter, sort and paging controls keyed by name."""
+    view = view_of(df)
+    if view["summary"] is None:
+        view["summary"] = summarise(df)
+    st.write(f"{len(df.index):,} rows, {len(df.columns)} columns")
+    if st.checkbox("Show column summary",key=f"{name}_summary"):
+        st.dataframe(view["summary"],hide_index=True)
+    columns = {str(c):c for c in df.columns}
+    cols = st.columns([2,1,2,2,1,1])
+    with cols[0]:
+        column = st.selectbox("Filter on",["(none)"] + list(columns),key=f"{name}_filter_column")
+    with cols[1]:
+        op = st.selectbox("Operator",list(OPERATORS),key=f"{name}_filter_op")
+    with cols[2]:
+        text = st.text_input("Value",key=f"{name}_filter_value",help="read as the column's type, e.g. 10 for rid or ALA for aa")
+    with cols[3]:
+        sort = st.selectbox("Sort by",["(none)"] + list(columns),key=f"{name}_sort")
+    with cols[4]:
+        descending = st.checkbox("Descending",key=f"{name}_desc")
+    with cols[5]:
+        size = st.selectbox("Rows per page",PAGE_SIZES,key=f"{name}_size")
+    where = (columns[column],op,text.strip()) if column in columns and text.strip() != "" else None
+    try:
+        order = cached_order(df,where,columns.get(sort),descending)
+    except ValueError as e:
+        st.error(f"Could not filter: {e}")
+        order = cached_order(df,None,columns.get(sort),descending)
+    pages = max(1,math.ceil(len(order)/size))
+    page_key = f"{name}_page"
+    if st.session_state.get(page_key,1) > pages:
+        st.session_state[page_key] = pages
+    page = st.number_input(f"Page (of {pages:,}, {len(order):,} rows)",min_value=1,max_value=pages,step=1,key=page_key)
+    start = (page - 1) * size
+    st.dataframe(df.iloc[order[start:start + size]])
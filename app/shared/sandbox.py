@@ -0,0 +1,99 @@
+import multiprocessing as mp
+import resource
+import sys
+import threading
+import types
+
+# Heavy geometry calculations in a child process.
+# calculateGeometry cannot be interrupted once it starts, so a (structure, geo) estimated to be
+# expensive is calculated in a spawned process instead: its data segment is capped with
+# RLIMIT_DATA so running out of memory ends the child and not the server, and the parent polls
+# the cancel/timeout check while it waits and kills the child when the check stops it.
+# A spawned child first runs the parent's __main__ file, which under streamlit is the page script,
+# so children are started while __main__ is a module without a file.
+
+POLL_SECONDS = 0.2
+_start_lock = threading.Lock()
+
+class Stopped(Exception):
+    """A calculation cancelled, timed out or over its memory cap, with whatever finished before it."""
+    def __init__(self, reason, partial=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial = partial
+
+#--------------------------------------------------------------------
+def data_bytes():
+    try:
+        with open("/proc/self/status") as fr:
+            for line in fr:
+                if line.startswith("VmData:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError,ValueError):
+        pass
+    return 0
+#--------------------------------------------------------------------
+def worker(conn, code, directory, cif, source, geo, max_bytes):
+    try:
+        from maptial.geo import pdbloader as pl
+        from maptial.geo import pdbgeometry as pg
+        if max_bytes:
+            # on top of what the interpreter and libraries already use
+            limit = data_bytes() + max_bytes
+            resource.setrlimit(resource.RLIMIT_DATA,(limit,limit))
+        pobj = pl.PdbLoader(code,directory,cif=cif,source=source).load_pdb()
+        df = pg.GeometryMaker([pobj]).calculateGeometry([geo])
+        conn.send(("ok",df))
+    except MemoryError:
+        conn.send(("memory",None))
+    except Exception as e:
+        # the parent gets the message, and the traceback goes to the child's stderr
+        conn.send(("error",str(e)))
+        raise
+    finally:
+        conn.close()
+#--------------------------------------------------------------------
+def start(proc):
+    with _start_lock:
+        main = sys.modules["__main__"]
+        bare = types.ModuleType("__main__")
+        sys.modules["__main__"] = bare
+        try:
+            proc.start()
+        finally:
+            # unless a script run has installed its own meanwhile
+            if sys.modules["__main__"] is bare:
+                sys.modules["__main__"] = main
+#--------------------------------------------------------------------
+def calculate(code, directory, cif, source, geo, check=None, max_mb=None):
+    """calculateGeometry([geo]) of one structure in a child process, calling check() while it runs.
+
+    check raises Stopped to end it; Stopped is also raised when the child goes over max_mb.
+    """
+    ctx = mp.get_context("spawn")
+    parent,child = ctx.Pipe(duplex=False)
+    max_bytes = int(max_mb*1e6) if max_mb else None
+    proc = ctx.Process(target=worker,args=(child,code,directory,cif,source,geo,max_bytes),daemon=True)
+    start(proc)
+    child.close()
+    try:
+        while not parent.poll(POLL_SECONDS):
+            if not proc.is_alive() and not parent.poll():
+                # ended without an answer, e.g. killed by the kernel for memory
+                raise Stopped(f"{geo} on {code} ended unexpectedly (exit code {proc.exitcode})")
+            if check is not None:
+                check()
+        try:
+            status,value = parent.recv()
+        except EOFError:
+            raise Stopped(f"{geo} on {code} ended unexpectedly (exit code {proc.exitcode})")
+    finally:
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        parent.close()
+    if status == "memory":
+        raise Stopped(f"{geo} on {code} needed more than {max_mb} MB")
+    if status == "error":
+        raise RuntimeError(value)
+    return value
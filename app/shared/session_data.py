@@ -0,0 +1,160 @@
+import os
+import shutil
+import threading
+import time
+import weakref
+import pandas as pd
+import streamlit as st
+from shared import config as cfg
+from shared import compute_cache as cc
+from shared import metrics as mt
+
+# Dataframes held by one session, within a memory budget.
+# Frames are put and got by name instead of directly in st.session_state. When a session's frames
+# go over its budget, or a frame has not been used for a while (checked across all sessions, so
+# tabs left open are included), the least recently used frames are written to compressed parquet
+# in the session's folder and dropped from memory, to be read back the next time they are got.
+# The folder goes when the session does.
+
+MIN_SPILL_BYTES = 1e6   # smaller frames stay in memory
+SWEEP_SECONDS = 60
+
+_MANAGERS = weakref.WeakValueDictionary()
+_LAST_SWEEP = [0.0]
+
+class Spilled:
+    def __init__(self, path, nbytes, kind):
+        self.path = path
+        self.nbytes = nbytes
+        self.kind = kind    # parquet or pickle
+
+class SessionData:
+    def __init__(self, session_id, budget_bytes, spill_dir, idle_seconds):
+        self.session_id = session_id
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self.frames = {}    # name -> value, or Spilled
+        self.sizes = {}
+        self.used = {}
+        self.lock = threading.RLock()
+        weakref.finalize(self,shutil.rmtree,spill_dir,True)
+
+    def put(self, name, value):
+        with self.lock:
+            if self.frames.get(name) is not value:
+                self.remove_file(name)
+                self.frames[name] = value
+                self.sizes[name] = cc.size_of(value) if isinstance(value,pd.DataFrame) else 0
+            self.used[name] = time.monotonic()
+            self.enforce(keep=name)
+
+    def get(self, name, default=None):
+        with self.lock:
+            if name not in self.frames:
+                return default
+            value = self.frames[name]
+            if isinstance(value,Spilled):
+                value = self.reload(name,value)
+            self.used[name] = time.monotonic()
+            self.enforce(keep=name)
+            return value
+
+    def has(self, name):
+        return name in self.frames
+
+    def in_memory_bytes(self):
+        return sum(self.sizes[n] for n,v in self.frames.items() if not isinstance(v,Spilled))
+
+    def enforce(self, keep=None):
+        """Spills least recently used frames (never keep) until the session is within budget."""
+        over = self.in_memory_bytes() - self.budget_bytes
+        if over <= 0:
+            return
+        for name in sorted(self.frames,key=lambda n: self.used.get(n,0)):
+            if over <= 0:
+                break
+            if name != keep and self.spill(name):
+                over -= self.sizes[name]
+
+    def spill_idle(self, now):
+        with self.lock:
+            for name in list(self.frames):
+                if now - self.used.get(name,now) > self.idle_seconds:
+                    self.spill(name)
+
+    def spill(self, name):
+        value = self.frames[name]
+        if isinstance(value,Spilled) or not isinstance(value,pd.DataFrame) or self.sizes[name] < MIN_SPILL_BYTES:
+            return False
+        os.makedirs(self.spill_dir,exist_ok=True)
+        path = os.path.join(self.spill_dir,name)
+        try:
+            value.to_parquet(f"{path}.parquet",compression="zstd")
+            self.frames[name] = Spilled(f"{path}.parquet",self.sizes[name],"parquet")
+        except (ImportError,ValueError,TypeError,NotImplementedError):
+            # no pyarrow, or e.g. object columns of mixed types that parquet cannot hold (the arrow errors subclass these)
+            if os.path.exists(f"{path}.parquet"):
+                os.remove(f"{path}.parquet")
+            value.to_pickle(f"{path}.pkl.gz",compression="gzip")
+            self.frames[name] = Spilled(f"{path}.pkl.gz",self.sizes[name],"pickle")
+        return True
+
+    def reload(self, name, spilled):
+        if spilled.kind == "parquet":
+            value = pd.read_parquet(spilled.path)
+        else:
+            value = pd.read_pickle(spilled.path,compression="gzip")
+        self.remove_file(name)
+        self.frames[name] = value
+        return value
+
+    def remove_file(self, name):
+        value = self.frames.get(name)
+        if isinstance(value,Spilled):
+            try:
+                os.remove(value.path)
+            except OSError:
+                pass
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            rows = [{"frame":n,"mb":round(self.sizes[n]/1e6,2),"on_disk":isinstance(v,Spilled),
+                     "idle_s":round(now - self.used.get(n,now))} for n,v in self.frames.items()]
+        return pd.DataFrame(rows,columns=["frame","mb","on_disk","idle_s"])
+
+#--------------------------------------------------------------------
+def session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+#--------------------------------------------------------------------
+def manager():
+    """This session's SessionData, created on first use."""
+    if "data_manager" not in st.session_state:
+        sid = session_id()
+        dm = SessionData(sid,cfg.SESSION_MB*1e6,os.path.join(cfg.SESSIONDIR,sid),cfg.SESSION_IDLE_SECONDS)
+        st.session_state["data_manager"] = dm
+        _MANAGERS[sid] = dm
+        mt.start()
+    return st.session_state["data_manager"]
+#--------------------------------------------------------------------
+def sweep():
+    # spills the idle frames of every live session, at most once a minute
+    now = time.monotonic()
+    if now - _LAST_SWEEP[0] < SWEEP_SECONDS:
+        return
+    _LAST_SWEEP[0] = now
+    for dm in list(_MANAGERS.values()):
+        dm.spill_idle(now)
+#--------------------------------------------------------------------
+def get(name, default=None):
+    return manager().get(name,default)
+#--------------------------------------------------------------------
+def put(name, value):
+    manager().put(name,value)
+    sweep()
+#--------------------------------------------------------------------
+def has(name):
+    return manager().has(name)
@@ -1,8 +1,11 @@
 import streamlit as st
-from maptial.geo import pdbloader as pl
-from maptial.geo import pdbgeometry as pg
 import pandas as pd
-import plotly.express as px
+from shared import session_data as sd
+from shared import tracing as tr
+from shared import lazy
+pl = lazy.load("maptial.geo.pdbloader")
+pg = lazy.load("maptial.geo.pdbgeometry")
+px = lazy.load("plotly.express")
 
 DATADIR = "app/data/"
 
@@ -47,18 +50,18 @@ def plot_sheet(structuresA,structuresB, geos, id1s,id2s):
 
         df_geos = pd.DataFrame({'A' : []})
         df_geosB = pd.DataFrame({'A' : []})
-        if 'dataB' not in st.session_state:
-            st.session_state['dataB'] = df_geosB
-            st.session_state['data'] = df_geos
+        if not sd.has('dataB'):
+            sd.put('dataB',df_geosB)
+            sd.put('data',df_geos)
         else:
             if st.session_state['pdbs'] != structuresA or st.session_state['geos'] != geos:
-                st.session_state['data'] = df_geos            
+                sd.put('data',df_geos)            
                 st.session_state['pdbs'] = structuresA
                 st.session_state['pdbsB'] = structuresB
                 st.session_state['geos'] = geos
             else:
-                df_geos = st.session_state['data']
-                df_geosB = st.session_state['dataB']
+                df_geos = sd.get('data')
+                df_geosB = sd.get('dataB')
                     
         st.write("---")        
         if st.button("Calculate dataframe"):
@@ -88,12 +91,15 @@ def plot_sheet(structuresA,structuresB, geos, id1s,id2s):
                         source = "ebi"
                         pdb = pdb.lower()
                     pla = pl.PdbLoader(pdb,DATADIR,cif=False,source=source)        
-                    po = pla.load_pdb()
+                    with tr.span("load_pdb",pdb=pdb):
+                        po = pla.load_pdb()
                     pobjs.append(po)
                 except Exception as e:
                     st.error(str(e))            
-            gm = pg.GeometryMaker(pobjs)
-            df_geos = gm.calculateGeometry(ls_geos)
+            with tr.span("GeometryMaker"):
+                gm = pg.GeometryMaker(pobjs)
+            with tr.span("calculateGeometry",geos=len(ls_geos)) as sp:
+                df_geos = sp.rows(gm.calculateGeometry(ls_geos))
 
             pobjsB = []
             for pdb in ls_structuresB:
@@ -104,18 +110,21 @@ def plot_sheet(structuresA,structuresB, geos, id1s,id2s):
                         source = "ebi"
                         pdb = pdb.lower()
                     pla = pl.PdbLoader(pdb,DATADIR,cif=False,source=source)        
-                    po = pla.load_pdb()
+                    with tr.span("load_pdb",pdb=pdb):
+                        po = pla.load_pdb()
                     pobjsB.append(po)
                 except Exception as e:
                     st.error(str(e))            
-            gm = pg.GeometryMaker(pobjsB)
-            df_geosB = gm.calculateGeometry(ls_geos)
+            with tr.span("GeometryMaker"):
+                gm = pg.GeometryMaker(pobjsB)
+            with tr.span("calculateGeometry",geos=len(ls_geos)) as sp:
+                df_geosB = sp.rows(gm.calculateGeometry(ls_geos))
             
             code_string += "\ngm = pg.GeometryMaker(pobjs)\n"
             code_string += "df_geos = gm.calculateGeometry(ls_geos)\n"
                         
-            st.session_state['data'] = df_geos        
-            st.session_state['dataB'] = df_geosB
+            sd.put('data',df_geos)        
+            sd.put('dataB',df_geosB)
             st.session_state['code_df'] = code_string
                     
         if len(df_geos.index) > 0:
@@ -156,14 +165,14 @@ def plot_sheet(structuresA,structuresB, geos, id1s,id2s):
                 cols = st.columns(2)
                 with cols[0]:
                     fig = px.scatter(df_geos, x=x_ax1, y=y_ax1, color=z_ax1,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
-                    st.plotly_chart(fig, use_container_width=False)
+                    tr.plotly_chart(fig, use_container_width=False)
                     figB = px.scatter(df_geosB, x=x_ax1, y=y_ax1, color=z_ax1,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
-                    st.plotly_chart(figB, use_container_width=False)
+                    tr.plotly_chart(figB, use_container_width=False)
                 with cols[1]:
                     fig = px.scatter(df_geos, x=x_ax2, y=y_ax2, color=z_ax2,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
-                    st.plotly_chart(fig, use_container_width=False)
+                    tr.plotly_chart(fig, use_container_width=False)
                     figB = px.scatter(df_geosB, x=x_ax2, y=y_ax2, color=z_ax2,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
-                    st.plotly_chart(figB, use_container_width=False)
+                    tr.plotly_chart(figB, use_container_width=False)
                 
                 code_string2 = "import plotly.express as px\n"
                 code_string2 += "# Choose the dataframe you want to look at, df_geos or df_geosB\n"
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from shared import atom_arrays as ar
+
+# Superposition of structures onto a reference model, e.g. the PDB entries of a protein onto
+# its AlphaFold model. Residues are matched by residue number or by sequence alignment, and
+# every (entry, chain) is superposed on matched CA atoms in one batched Kabsch calculation,
+# giving per-residue deviation next to the model's plDDT (its bfactor column).
+
+#--------------------------------------------------------------------
+def ca_table(arrs):
+    """One row per residue with a CA: chain, rid, aa, one letter code, bfactor and coordinates."""
+    from Bio.SeqUtils import seq1
+    mask = (arrs.atom == "CA") & arrs.is_standard()
+    df = pd.DataFrame({"chain":arrs.chain[mask],"rid":arrs.rid[mask],"aa":arrs.aa[mask],
+                       "bfactor":arrs.bfactor[mask]})
+    df["letter"] = [seq1(a) for a in df["aa"]]
+    df = df.reset_index(drop=True)
+    return df, arrs.coords[mask].astype(np.float64)
+#--------------------------------------------------------------------
+def map_by_rid(ref, mob):
+    """Index pairs of residues with the same residue number."""
+    merged = pd.DataFrame({"rid":ref["rid"],"i":np.arange(len(ref))}).merge(
+             pd.DataFrame({"rid":mob["rid"],"j":np.arange(len(mob))}),on="rid")
+    return merged["i"].to_numpy(), merged["j"].to_numpy()
+#--------------------------------------------------------------------
+def map_by_alignment(ref, mob):
+    """Index pairs of residues aligned (not gapped) in a global BLOSUM62 sequence alignment."""
+    from Bio import Align
+    from Bio.Align import substitution_matrices
+    aligner = Align.PairwiseAligner(mode="global",open_gap_score=-10,extend_gap_score=-0.5)
+    aligner.substitution_matrix = substitution_matrices.load("BLOSUM62")
+    seq_ref = "".join(ref["letter"]).replace("X","A")
+    seq_mob = "".join(mob["letter"]).replace("X","A")
+    if len(seq_ref) == 0 or len(seq_mob) == 0:
+        return np.array([],dtype=np.int64), np.array([],dtype=np.int64)
+    aln = aligner.align(seq_ref,seq_mob)[0]
+    ii,jj = [],[]
+    for (r0,r1),(m0,m1) in zip(*aln.aligned):
+        ii.append(np.arange(r0,r1))
+        jj.append(np.arange(m0,m1))
+    if len(ii) == 0:
+        return np.array([],dtype=np.int64), np.array([],dtype=np.int64)
+    return np.concatenate(ii), np.concatenate(jj)
+#--------------------------------------------------------------------
+def kabsch_batch(P, Q, W):
+    """Superposes each P[b] onto Q[b] using the points weighted by W[b] (0 for padding).
+
+    P, Q are (B, L, 3) and W is (B, L); returns the moved P and the per batch RMSD.
+    """
+    w = W[:,:,None]
+    n = np.maximum(W.sum(axis=1),1)[:,None]
+    cp = (P*w).sum(axis=1) / n
+    cq = (Q*w).sum(axis=1) / n
+    P0 = (P - cp[:,None,:]) * w
+    Q0 = (Q - cq[:,None,:]) * w
+    H = np.einsum("bli,blj->bij",P0,Q0)
+    U,_,Vt = np.linalg.svd(H)
+    d = np.sign(np.linalg.det(np.einsum("bji,bkj->bik",Vt,U)))
+    D = np.zeros((len(P),3,3))
+    D[:,0,0] = 1
+    D[:,1,1] = 1
+    D[:,2,2] = np.where(d == 0,1,d)
+    R = np.einsum("bji,bjk,blk->bil",Vt,D,U)
+    moved = np.einsum("bij,blj->bli",R,P - cp[:,None,:]) + cq[:,None,:]
+    sq = ((moved - Q)**2).sum(axis=2) * W
+    rmsd = np.sqrt(sq.sum(axis=1) / n[:,0])
+    return moved, rmsd
+#--------------------------------------------------------------------
+def compare(ref_arrs, mob_arrs_list, mapping="rid", min_matched=3):
+    """Superposes every chain of every mobile structure onto the reference in one batch.
+
+    Returns a per-residue dataframe (best chain per mobile structure) and a per-chain summary.
+    """
+    ref, ref_xyz = ca_table(ref_arrs)
+    jobs = []
+    for arrs in mob_arrs_list:
+        mob_all, mob_xyz_all = ca_table(arrs)
+        for chain in pd.unique(mob_all["chain"]):
+            sel = (mob_all["chain"] == chain).to_numpy()
+            mob = mob_all[sel].reset_index(drop=True)
+            if mapping == "align":
+                i,j = map_by_alignment(ref,mob)
+            else:
+                i,j = map_by_rid(ref,mob)
+            if len(i) >= min_matched:
+                jobs.append((arrs.pdb_code,chain,mob,mob_xyz_all[sel],i,j))
+    summary_cols = ["pdb_code","chain","matched","coverage","rmsd","best"]
+    if len(jobs) == 0:
+        return pd.DataFrame(), pd.DataFrame(columns=summary_cols)
+    L = max(len(job[4]) for job in jobs)
+    P = np.zeros((len(jobs),L,3))
+    Q = np.zeros((len(jobs),L,3))
+    W = np.zeros((len(jobs),L))
+    for b,(pdb_code,chain,mob,mob_xyz,i,j) in enumerate(jobs):
+        P[b,:len(j)] = mob_xyz[j]
+        Q[b,:len(i)] = ref_xyz[i]
+        W[b,:len(i)] = 1
+    moved, rmsd = kabsch_batch(P,Q,W)
+    dev = np.sqrt(((moved - Q)**2).sum(axis=2))
+    summary = pd.DataFrame({"pdb_code":[job[0] for job in jobs],"chain":[job[1] for job in jobs],
+                            "matched":[len(job[4]) for job in jobs],"rmsd":rmsd})
+    summary["coverage"] = (summary["matched"] / len(ref)).round(3)
+    # the chain that matches most of the reference, then by lowest rmsd, represents its structure
+    order = summary.sort_values(["pdb_code","matched","rmsd"],ascending=[True,False,True])
+    best = set(order.groupby("pdb_code").head(1).index)
+    summary["best"] = summary.index.isin(best)
+    frames = []
+    for b in sorted(best):
+        pdb_code,chain,mob,mob_xyz,i,j = jobs[b]
+        frames.append(pd.DataFrame({"pdb_code":pdb_code,"chain":chain,
+                                    "rid":ref["rid"].to_numpy()[i],"aa":ref["aa"].to_numpy()[i],
+                                    "rid_pdb":mob["rid"].to_numpy()[j],"aa_pdb":mob["aa"].to_numpy()[j],
+                                    "deviation":dev[b,:len(i)],"plddt":ref["bfactor"].to_numpy()[i],
+                                    "bf_pdb":mob["bfactor"].to_numpy()[j]}))
+    return pd.concat(frames,ignore_index=True), summary[summary_cols]
+#--------------------------------------------------------------------
+def compare_structures(ref_pobj, mob_pobjs, mapping="rid"):
+    return compare(ar.from_pobj(ref_pobj),[ar.from_pobj(po) for po in mob_pobjs],mapping=mapping)
@@ -0,0 +1,174 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import streamlit as st
+from shared import config as cfg
+from shared import metrics as mt
+
+# Timing spans around the stages of a calculation.
+# A span is a named block (download, parse, geometry, dataframe, plot, chart) that records its
+# duration, the change in the process's resident memory and, where given, a row count. Spans nest
+# per thread. Each finished span is written as one JSON line on the "prometry.trace" logger, to the
+# file cfg.TRACE_LOG when set, and kept in the session so the page can show them in a debug expander
+# (opened with ?debug=1 in the url), and fed to the process metrics. The memory delta is for the whole
+# process so other sessions add noise. Threads without a script run context, such as job workers, have
+# no session state: their spans are recorded against the session given to for_session and kept
+# here until that session's page takes them.
+
+LOGGER = logging.getLogger("prometry.trace")
+MAX_KEPT = 500
+_local = threading.local()
+_configured = [False]
+_pending = {}   # session id -> spans recorded for it on other threads
+_pending_lock = threading.Lock()
+
+class Span:
+    def __init__(self, name, attrs, parent, depth):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.depth = depth
+        self.start = time.time()
+        self.seconds = None
+        self.mem_mb = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def rows(self, value):
+        # the row count of a dataframe, or of a list of them
+        n = n_rows(value)
+        if n is not None:
+            self.attrs["rows"] = n
+        return value
+
+    def as_dict(self):
+        return {"span":self.name,"parent":self.parent,"depth":self.depth,
+                "start":round(self.start,3),"seconds":round(self.seconds,5),"mem_mb":self.mem_mb,**self.attrs}
+
+#--------------------------------------------------------------------
+def n_rows(value):
+    if hasattr(value,"index") and hasattr(value,"columns"):
+        return len(value.index)
+    if isinstance(value,(list,tuple)) and len(value) > 0 and all(hasattr(v,"index") for v in value):
+        return sum(len(v.index) for v in value)
+    return None
+#--------------------------------------------------------------------
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as fr:
+            return int(fr.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError,ValueError,IndexError):
+        return None
+#--------------------------------------------------------------------
+def configure():
+    # the json log file, once per process
+    if _configured[0]:
+        return
+    _configured[0] = True
+    mt.start()
+    if cfg.TRACE_LOG:
+        LOGGER.setLevel(logging.INFO)
+        handler = logging.FileHandler(cfg.TRACE_LOG)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        LOGGER.addHandler(handler)
+#--------------------------------------------------------------------
+def session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+#--------------------------------------------------------------------
+@contextmanager
+def for_session(sid):
+    """Records the spans of this thread, which has no script run context, against session sid."""
+    previous = getattr(_local,"session",None)
+    _local.session = sid
+    try:
+        yield
+    finally:
+        _local.session = previous
+#--------------------------------------------------------------------
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a span; the span is yielded so rows and other attributes can be set."""
+    configure()
+    stack = getattr(_local,"stack",None)
+    if stack is None:
+        stack = _local.stack = []
+    sp = Span(name,attrs,stack[-1].name if stack else None,len(stack))
+    stack.append(sp)
+    mem = rss_bytes()
+    t = time.perf_counter()
+    try:
+        yield sp
+    except Exception as e:
+        sp.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        sp.seconds = time.perf_counter() - t
+        after = rss_bytes()
+        if mem is not None and after is not None:
+            sp.mem_mb = round((after - mem)/1e6,2)
+        stack.pop()
+        record(sp)
+#--------------------------------------------------------------------
+def traced(name):
+    """Decorator that runs the function in a span, with the rows of a returned dataframe."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name) as sp:
+                return sp.rows(fn(*args,**kwargs))
+        return inner
+    return wrap
+#--------------------------------------------------------------------
+def record(sp):
+    row = sp.as_dict()
+    mt.observe_span(row)
+    sid = session_id()
+    if sid is not None:
+        row["session"] = sid
+        if "trace_spans" not in st.session_state:
+            st.session_state["trace_spans"] = deque(maxlen=MAX_KEPT)
+        st.session_state["trace_spans"].append(row)
+    elif getattr(_local,"session",None) is not None:
+        row["session"] = _local.session
+        with _pending_lock:
+            _pending.setdefault(_local.session,deque(maxlen=MAX_KEPT)).append(row)
+    if LOGGER.isEnabledFor(logging.INFO):
+        LOGGER.info(json.dumps(row,default=str))
+#--------------------------------------------------------------------
+def plotly_chart(fig, name="chart", **kwargs):
+    """st.plotly_chart in a span, which is where the figure is serialised for the browser."""
+    with span(name,points=sum(len(t.x) for t in fig.data if getattr(t,"x",None) is not None)):
+        st.plotly_chart(fig,**kwargs)
+#--------------------------------------------------------------------
+def take_spans():
+    """The spans recorded for this session since the last call, by its page runs and by the jobs it submitted."""
+    spans = st.session_state.get("trace_spans")
+    rows = []
+    if spans is not None:
+        rows = list(spans)
+        spans.clear()
+    with _pending_lock:
+        rows.extend(_pending.pop(session_id(),()))
+    return rows
+#--------------------------------------------------------------------
+def debug_expander():
+    """The spans recorded since the last call, shown when the url has ?debug=1 or cfg.TRACE_UI is set."""
+    rows = take_spans()
+    if len(rows) == 0:
+        return
+    if not (cfg.TRACE_UI or st.query_params.get("debug") == "1"):
+        return
+    import pandas as pd
+    with st.expander("Debug: stage timings"):
+        df = pd.DataFrame(rows).sort_values("start",kind="stable")
+        df["span"] = ["  "*d + s for d,s in zip(df["depth"],df["span"])]
+        df = df.drop(columns=[c for c in ["parent","depth","session"] if c in df.columns])
+        st.dataframe(df,hide_index=True)
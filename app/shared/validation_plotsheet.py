@@ -1,10 +1,14 @@
 import streamlit as st
 import maptial
-from maptial.geo import pdbloader as pl
-from maptial.geo import pdbgeometry as pg
 import pandas as pd
-import plotly.express as px
 from shared import config as cfg
+from shared import density as de
+from shared import session_data as sd
+from shared import tracing as tr
+from shared import lazy
+pl = lazy.load("maptial.geo.pdbloader")
+pg = lazy.load("maptial.geo.pdbgeometry")
+px = lazy.load("plotly.express")
 
 DATADIR = cfg.DATADIR
 
@@ -35,15 +39,15 @@ def plot_sheet(structures):
         ls_geos = geos.split(" ")
 
         df_geos = pd.DataFrame({'A' : []})    
-        if 'data' not in st.session_state:
-            st.session_state['data'] = df_geos        
+        if not sd.has('data'):
+            sd.put('data',df_geos)        
         else:
             if st.session_state['pdbs'] != structures or st.session_state['geos'] != geos:
-                st.session_state['data'] = df_geos            
+                sd.put('data',df_geos)            
                 st.session_state['pdbs'] = structures
                 st.session_state['geos'] = geos
             else:
-                df_geos = st.session_state['data']
+                df_geos = sd.get('data')
                     
         st.write("---")        
         if st.button("Calculate dataframe"):
@@ -72,18 +76,21 @@ def plot_sheet(structures):
                         source = "ebi"
                         pdb = pdb.lower()
                     pla = pl.PdbLoader(pdb,DATADIR,cif=False,source=source)        
-                    po = pla.load_pdb()
+                    with tr.span("load_pdb",pdb=pdb):
+                        po = pla.load_pdb()
                     pobjs.append(po)
                 except Exception as e:
                     st.error(str(e))
             
-            gm = pg.GeometryMaker(pobjs)
-            df_geos = gm.calculateGeometry(ls_geos)
+            with tr.span("GeometryMaker"):
+                gm = pg.GeometryMaker(pobjs)
+            with tr.span("calculateGeometry",geos=len(ls_geos)) as sp:
+                df_geos = sp.rows(gm.calculateGeometry(ls_geos))
             
             code_string += "\ngm = pg.GeometryMaker(pobjs)\n"
             code_string += "df_geos = gm.calculateGeometry(ls_geos)\n"
                         
-            st.session_state['data'] = df_geos        
+            sd.put('data',df_geos)        
             st.session_state['code_df'] = code_string
                     
         if len(df_geos.index) > 0:
@@ -128,18 +135,16 @@ def plot_sheet(structures):
                 cols = st.columns(2)
                 with cols[0]:
                     if z_ax1 == "Probability density plot":
-                        fig = px.density_contour(df_geos, x=x_ax1, y=y_ax1, title="",width=500, height=500)
-                        fig.update_traces(contours_coloring="fill", contours_showlabels = True)
+                        fig = de.density_contour(df_geos, x=x_ax1, y=y_ax1, title="",width=500, height=500)
                     else:
                         fig = px.scatter(df_geos, x=x_ax1, y=y_ax1, color=z_ax1,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)                        
-                    st.plotly_chart(fig, use_container_width=False)
+                    tr.plotly_chart(fig, use_container_width=False)
                 with cols[1]:
                     if z_ax2 == "Probability density plot":
-                        fig = px.density_contour(df_geos, x=x_ax2, y=y_ax2, title="",width=500, height=500)
-                        fig.update_traces(contours_coloring="fill", contours_showlabels = True)                        
+                        fig = de.density_contour(df_geos, x=x_ax2, y=y_ax2, title="",width=500, height=500)
                     else:
                         fig = px.scatter(df_geos, x=x_ax2, y=y_ax2, color=z_ax2,title="",width=500, height=500, opacity=0.7,color_continuous_scale=px.colors.sequential.Viridis)
-                    st.plotly_chart(fig, use_container_width=False)
+                    tr.plotly_chart(fig, use_container_width=False)
                 
                 code_string2 = "import plotly.express as px\n"
                 if z_ax1 == "Probability density plot":
@@ -0,0 +1,272 @@
+"""Benchmarks of the load, geometry, search and plotting paths on synthetic structures.
+
+Structures of about 1k, 10k and 100k atoms are built from the protein atoms of the app/data/pdb1t29.ent
+fixture (truncated, or tiled as translated copies in new chains). Each case is timed as the best of a few
+runs, and all results are written as JSON with the commit and library versions, so that a run can be
+compared with an earlier one.
+
+    python bench/bench_suite.py                              # all cases, all sizes
+    python bench/bench_suite.py --sizes 1000 10000 --only geo
+    python bench/bench_suite.py --compare bench/results/<earlier>.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from importlib.metadata import version, PackageNotFoundError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.join(ROOT,"app"))
+FIXTURE = os.path.join(ROOT,"app","data","pdb1t29.ent")
+RESULTS_DIR = os.path.join(ROOT,"bench","results")
+SIZES = [1000,10000,100000]
+REPEATS = 3
+SLOWER = 1.25   # a case is flagged when this much slower than the compared run
+CHAINS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+SPACING = 80.0  # angstroms between tiled copies, beyond any contact cutoff
+
+#--------------------------------------------------------------------
+def synthetic_pdb(n_atoms, directory):
+    """Writes a pdb file of about n_atoms protein atoms and returns its code."""
+    with open(FIXTURE) as fr:
+        atoms = [l for l in fr if l[:6] == "ATOM  "]
+    lines = []
+    copy = 0
+    while len(lines) < n_atoms:
+        if copy >= len(CHAINS):
+            raise ValueError(f"Too many atoms for {len(CHAINS)} chains: {n_atoms}")
+        dx,dy,dz = SPACING*(copy % 4),SPACING*((copy // 4) % 4),SPACING*(copy // 16)
+        chain = CHAINS[copy]
+        for l in atoms:
+            if len(lines) >= n_atoms and l[22:27] != lines[-1][22:27]:
+                break   # stop at a residue boundary
+            x,y,z = float(l[30:38]) + dx,float(l[38:46]) + dy,float(l[46:54]) + dz
+            serial = (len(lines) + 1) % 100000
+            lines.append(f"{l[:6]}{serial:5d}{l[11:21]}{chain}{l[22:30]}{x:8.3f}{y:8.3f}{z:8.3f}{l[54:]}")
+        copy += 1
+    code = f"syn{n_atoms}"
+    with open(os.path.join(directory,f"{code}.pdb"),"w") as fw:
+        fw.write("HEADER    SYNTHETIC BENCHMARK STRUCTURE\n")
+        fw.writelines(lines)
+        fw.write("END\n")
+    return code
+#--------------------------------------------------------------------
+def timed(fn, repeats):
+    best = None
+    out = None
+    for _ in range(repeats):
+        # maptial prints as it goes
+        with contextlib.redirect_stdout(io.StringIO()):
+            t = time.perf_counter()
+            out = fn()
+            dt = time.perf_counter() - t
+        best = dt if best is None else min(best,dt)
+    return best, out
+#--------------------------------------------------------------------
+def n_rows(out):
+    import pandas as pd
+    if isinstance(out,tuple):
+        out = out[0] if len(out) > 0 else None
+    if isinstance(out,pd.DataFrame):
+        return len(out.index)
+    if hasattr(out,"to_json"):
+        return len(out.to_json())   # bytes sent to the browser for a figure
+    return None
+#--------------------------------------------------------------------
+def cases():
+    """(name, category, max_atoms, make) where make(ctx) returns the function to time."""
+    from maptial.geo import pdbgeometry as pg
+
+    def geo(g):
+        return lambda ctx: (lambda: pg.GeometryMaker([ctx["pobj"]]).calculateGeometry([g]))
+
+    def pairs(g):
+        # the array search calculate_geometry uses for these geos in the app
+        def make(ctx):
+            from shared import pair_search as ps
+            return lambda: ps.calculate([ctx["pobj"]],g)
+        return make
+
+    def parse(ctx):
+        from maptial.geo import pdbloader as pl
+        return lambda: pl.PdbLoader(ctx["code"],ctx["dir"]).load_pdb()
+
+    def atoms(ctx):
+        return lambda: pg.GeometryMaker([ctx["pobj"]]).calculateData()
+
+    def atom_arrays(ctx):
+        from shared import atom_arrays as ar
+        return lambda: ar.from_pobj(ctx["pobj"])
+
+    def hbonds(ctx):
+        from shared import hbonds as hb
+        return lambda: hb.find_hbonds(ctx["arrs"])
+
+    def superpose(ctx):
+        from shared import superpose as sp
+        return lambda: sp.compare(ctx["arrs"],[ctx["arrs"]])
+
+    def profile(ctx):
+        from shared import residue_profile as rp
+        blocks = rp.ca_blocks(ctx["df_atoms"])
+        rid = next(iter(blocks.values()))[0][0]
+        return lambda: rp.profile(blocks,rid)
+
+    def contact_figure(ctx):
+        from shared import plot_lod as lod
+        df = ctx["df_contacts"]
+        return lambda: lod.scatter(df,x="rid",y="rid2_CA:{CA@i}[dis|0.5><6]",color="CA:{CA@i}[dis|0.5><6]")[0]
+
+    def scatter_figure(ctx):
+        from shared import plot_lod as lod
+        return lambda: lod.scatter(ctx["df_atoms"],x="x",y="y",color="bfactor")[0]
+
+    def space_figure(ctx):
+        from shared import plot_lod as lod
+        return lambda: lod.scatter_3d(ctx["df_atoms"],x="x",y="y",z="z",color="aa")[0]
+
+    def density_figure(ctx):
+        from shared import density as de
+        def run():
+            de._GRIDS.clear()
+            return de.density_contour(ctx["df_rama"],"C-1:N:CA:C","N:CA:C:N+1")
+        return run
+
+    def rama_classify(ctx):
+        from shared import ramachandran as rama
+        return lambda: rama.classify(ctx["df_rama"])
+
+    def validation_figure(ctx):
+        import plotly.express as px
+        df = ctx["df_rama"]
+        return lambda: px.histogram(df,x="N:CA:C",color="pdb_code",opacity=0.85)
+
+    return [
+        ("parse","load",None,parse),
+        ("atoms dataframe","load",None,atoms),
+        ("atom arrays","load",None,atom_arrays),
+        ("N:CA","geo distance",None,geo("N:CA")),
+        ("N:CA:C","geo angle",None,geo("N:CA:C")),
+        ("C-1:N:CA:C","geo dihedral -1",None,geo("C-1:N:CA:C")),
+        ("N:CA:C:N+1","geo dihedral +1",None,geo("N:CA:C:N+1")),
+        ("CA:{CA@i}[dis|0.5><6]","geo all-pairs @i",10000,geo("CA:{CA@i}[dis|0.5><6]")),
+        ("O:(N&1)","geo nearest &n",10000,geo("O:(N&1)")),
+        ("N:{N,O&1}","geo nearest &n",10000,geo("N:{N,O&1}")),
+        ("SUMDIS|CA-1:CA:CA+1","geo sumdis",None,geo("SUMDIS|CA-1:CA:CA+1")),
+        ("MAXDIS|CA-1:CA:CA+1","geo maxdis",None,geo("MAXDIS|CA-1:CA:CA+1")),
+        ("CA:{CA@i}[dis|0.5><8,rid|>1]","contact map",10000,geo("CA:{CA@i}[dis|0.5><8,rid|>1]")),
+        ("CA:{CA@i}[dis|0.5><6]","pairs @i",None,pairs("CA:{CA@i}[dis|0.5><6]")),
+        ("CA:{CA@i}[dis|0.5><8,rid|>1]","pairs contacts",None,pairs("CA:{CA@i}[dis|0.5><8,rid|>1]")),
+        ("N:(O@1)","pairs nearest",None,pairs("N:(O@1)")),
+        ("COUNT|CA:{CA@i}[dis|0.1><8]","pairs count",None,pairs("COUNT|CA:{CA@i}[dis|0.1><8]")),
+        ("hydrogen bonds","search",None,hbonds),
+        ("superpose onto itself","search",None,superpose),
+        ("residue distance profile","search",None,profile),
+        ("ramachandran classify","validation",None,rama_classify),
+        ("validation histogram","figure",None,validation_figure),
+        ("density contour","figure",None,density_figure),
+        ("contact scatter","figure",10000,contact_figure),
+        ("atoms scatter","figure",None,scatter_figure),
+        ("atoms scatter 3d","figure",None,space_figure),
+    ]
+#--------------------------------------------------------------------
+def context(n_atoms, directory):
+    """The structure of n_atoms and the frames the later cases start from (not timed)."""
+    from maptial.geo import pdbloader as pl
+    from maptial.geo import pdbgeometry as pg
+    from shared import atom_arrays as ar
+    code = synthetic_pdb(n_atoms,directory)
+    pobj = pl.PdbLoader(code,directory).load_pdb()
+    gm = pg.GeometryMaker([pobj])
+    ctx = {"code":code,"dir":directory,"pobj":pobj,"arrs":ar.from_pobj(pobj)}
+    ctx["df_atoms"] = gm.calculateData().rename(columns={"pdbCode":"pdb_code"})
+    ctx["df_rama"] = gm.calculateGeometry(["C-1:N:CA:C","N:CA:C:N+1","N:CA:C"])
+    if n_atoms <= 10000:
+        ctx["df_contacts"] = gm.calculateGeometry(["CA:{CA@i}[dis|0.5><6]"])
+    return ctx
+#--------------------------------------------------------------------
+def git_commit():
+    try:
+        return subprocess.run(["git","rev-parse","--short","HEAD"],cwd=ROOT,capture_output=True,text=True,check=False).stdout.strip()
+    except OSError:
+        return ""
+#--------------------------------------------------------------------
+def versions():
+    out = {"python":platform.python_version()}
+    for pkg in ["maptial","numpy","pandas","scipy","plotly","biopython"]:
+        try:
+            out[pkg] = version(pkg)
+        except PackageNotFoundError:
+            out[pkg] = None
+    return out
+#--------------------------------------------------------------------
+def compare(results, earlier_path):
+    with open(earlier_path) as fr:
+        earlier = json.load(fr)
+    before = {(r["case"],r["atoms"]):r["seconds"] for r in earlier["results"] if r["seconds"] is not None}
+    slower = 0
+    print(f"\nCompared with {earlier.get('commit','')} ({earlier_path})")
+    for r in results:
+        key = (r["case"],r["atoms"])
+        if key in before and r["seconds"] is not None and before[key] > 0:
+            ratio = r["seconds"]/before[key]
+            flag = "  SLOWER" if ratio > SLOWER else ""
+            slower += ratio > SLOWER
+            print(f"{r['case'][:40]:40s} {r['atoms']:>7d} {before[key]:9.4f}s -> {r['seconds']:9.4f}s  x{ratio:5.2f}{flag}")
+    return slower
+#--------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes",type=int,nargs="+",default=SIZES)
+    parser.add_argument("--only",default="",help="run only cases whose name or category contains this")
+    parser.add_argument("--repeats",type=int,default=REPEATS)
+    parser.add_argument("--out",default=None,help="results file, by default bench/results/<date>_<commit>.json")
+    parser.add_argument("--compare",default=None,help="an earlier results file")
+    args = parser.parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        directory = directory + os.sep
+        for n_atoms in args.sizes:
+            with contextlib.redirect_stdout(io.StringIO()):
+                ctx = context(n_atoms,directory)
+            for name,category,max_atoms,make in cases():
+                if args.only and args.only not in name and args.only not in category:
+                    continue
+                row = {"case":name,"category":category,"atoms":n_atoms,"seconds":None,"rows":None}
+                if max_atoms is not None and n_atoms > max_atoms:
+                    row["skipped"] = f"over {max_atoms} atoms"
+                else:
+                    try:
+                        fn = make(ctx)
+                        seconds,out = timed(fn,args.repeats)
+                        row["seconds"] = round(seconds,5)
+                        row["rows"] = n_rows(out)
+                    except (ArithmeticError,LookupError,MemoryError,OSError,RuntimeError,TypeError,ValueError) as e:
+                        # a failing case is recorded and the rest still run
+                        row["error"] = str(e)
+                results.append(row)
+                shown = f"{row['seconds']:.4f}s" if row["seconds"] is not None else row.get("skipped",row.get("error"))
+                print(f"{category:18s} {name[:40]:40s} {n_atoms:>7d}  {shown}",flush=True)
+    commit = git_commit()
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR,exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        out = os.path.join(RESULTS_DIR,f"{stamp}_{commit}.json")
+    with open(out,"w") as fw:
+        json.dump({"commit":commit,"date":datetime.datetime.now().isoformat(timespec="seconds"),
+                   "platform":platform.platform(),"versions":versions(),"repeats":args.repeats,
+                   "results":results},fw,indent=1)
+    print(f"Results written to {out}")
+    if args.compare and compare(results,args.compare) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Import time of the app's shared modules, as a regression check on page startup.
+
+Each module is imported in a fresh interpreter with ``-X importtime`` after streamlit (which every
+page pays for anyway), and the cumulative time of the module itself is reported with the slowest
+modules it pulled in.
+
+    python bench/import_time.py                 # report
+    python bench/import_time.py --check         # exit 1 if any module is over its budget
+    python bench/import_time.py --update        # write the current times as the budget
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(ROOT,"bench","import_budget.json")
+MODULES = ["shared.config","shared.structure_explorer","shared.dataframe_maker","shared.geo_plotter",
+           "shared.simple_plotsheet","shared.validation_plotsheet","shared.metadata_index"]
+REPEATS = 3
+TOLERANCE = 1.5     # a budget is exceeded at 50% over the stored time
+SLACK_MS = 20       # plus this, so that near-zero budgets do not fail on noise
+
+#--------------------------------------------------------------------
+def import_times(module):
+    """(cumulative ms of module, [(self ms, name)] of what it imported) from one fresh interpreter."""
+    env = dict(os.environ,PYTHONPATH=os.path.join(ROOT,"app"))
+    res = subprocess.run([sys.executable,"-X","importtime","-c",f"import streamlit; import {module}"],
+                         cwd=ROOT,env=env,capture_output=True,text=True,check=False)
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.strip().split("\n")[-1])
+    rows = []
+    seen_streamlit = False
+    for line in res.stderr.split("\n"):
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[0].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if not seen_streamlit:
+            seen_streamlit = name == "streamlit"
+            continue
+        rows.append((int(parts[0])/1000,int(parts[1])/1000,name))
+    total = next((cum for own,cum,name in rows if name == module),0.0)
+    return total, sorted(((own,name) for own,cum,name in rows),reverse=True)
+#--------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--check",action="store_true")
+    parser.add_argument("--update",action="store_true")
+    args = parser.parse_args()
+    budget = {}
+    if os.path.exists(BUDGET_PATH):
+        with open(BUDGET_PATH) as fr:
+            budget = json.load(fr)
+    results = {}
+    failed = []
+    for module in MODULES:
+        runs = [import_times(module) for _ in range(REPEATS)]
+        total = min(r[0] for r in runs)
+        results[module] = round(total,1)
+        slowest = ", ".join(f"{name} {own:.0f}ms" for own,name in runs[0][1][:3])
+        limit = budget.get(module)
+        flag = ""
+        if limit is not None and total > limit*TOLERANCE + SLACK_MS:
+            flag = f"  OVER BUDGET ({limit}ms)"
+            failed.append(module)
+        print(f"{module:32s} {total:8.1f}ms  [{slowest}]{flag}")
+    if args.update:
+        with open(BUDGET_PATH,"w") as fw:
+            json.dump(results,fw,indent=2)
+        print(f"Budget written to {BUDGET_PATH}")
+    if args.check and len(failed) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
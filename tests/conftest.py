@@ -0,0 +1,44 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import pytest
+
+# The app imports its modules as shared.*, from the app directory, and the fixture is the
+# pdb1t29 entry kept in app/data, loaded from a copy so nothing is downloaded or written there.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.join(ROOT,"app"))
+
+#--------------------------------------------------------------------
+def quietly(fn, *args, **kwargs):
+    # maptial prints as it goes
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args,**kwargs)
+#--------------------------------------------------------------------
+@pytest.fixture(scope="session",autouse=True)
+def data_dirs(tmp_path_factory):
+    """The database and the disk cache in a temporary folder rather than app/data."""
+    from shared import config as cfg
+    from shared import compute_cache as cc
+    folder = tmp_path_factory.mktemp("app_data")
+    cfg.DBPATH = str(folder / "prometry.db")
+    cfg.CACHEDIR = str(folder / "cache")
+    cc.RESULTS.disk_dir = cfg.CACHEDIR
+    return folder
+#--------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def pobj(tmp_path_factory):
+    from maptial.geo import pdbloader as pl
+    datadir = tmp_path_factory.mktemp("data")
+    shutil.copy(os.path.join(ROOT,"app","data","pdb1t29.ent"),datadir / "1t29.pdb")
+    return quietly(pl.PdbLoader("1t29",f"{datadir}/",cif=False,source="ebi").load_pdb)
+#--------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def geometry(pobj):
+    """calculateGeometry of 1t29, the dataframes that the app's own calculations are compared with."""
+    from maptial.geo import pdbgeometry as pg
+    def calc(geos):
+        return quietly(pg.GeometryMaker([pobj]).calculateGeometry,geos)
+    return calc
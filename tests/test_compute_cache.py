@@ -0,0 +1,146 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from shared import compute_cache as cc
+
+# The cache is shared by every session's threads, so it is exercised from several threads at once.
+
+#--------------------------------------------------------------------
+def frame(n=1000):
+    return pd.DataFrame({"a":np.arange(n,dtype=np.float64),"b":np.arange(n)*2})
+#--------------------------------------------------------------------
+def run_threads(n, target):
+    results = [None]*n
+    def run(i):
+        results[i] = target()
+    threads = [threading.Thread(target=run,args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+#--------------------------------------------------------------------
+def test_one_computation_for_concurrent_requests():
+    cache = cc.ComputeCache("test",1e8)
+    calls = []
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return frame()
+    results = run_threads(8,lambda: cache.get_or_compute("k",compute))
+    assert len(calls) == 1
+    assert all(r.equals(results[0]) for r in results)
+    assert cache.misses == 1 and cache.hits >= 7
+    assert cache.key_locks == {}
+#--------------------------------------------------------------------
+def test_different_keys_compute_in_parallel():
+    cache = cc.ComputeCache("test",1e8)
+    def compute():
+        time.sleep(0.3)
+        return frame()
+    counter = iter(range(100))
+    start = time.monotonic()
+    run_threads(4,lambda: cache.get_or_compute(next(counter),compute))
+    assert time.monotonic() - start < 0.9
+    assert len(cache.entries) == 4
+#--------------------------------------------------------------------
+def test_failed_computations_are_not_kept():
+    cache = cc.ComputeCache("test",1e8)
+    def fail():
+        raise ValueError("download failed")
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            cache.get_or_compute("k",fail)
+    assert cache.key_locks == {}
+    assert "k" not in cache.entries
+    assert cache.get_or_compute("k",frame)["a"].sum() == frame()["a"].sum()
+#--------------------------------------------------------------------
+def test_waiters_recompute_after_a_failure():
+    cache = cc.ComputeCache("test",1e8)
+    calls = []
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        if len(calls) == 1:
+            raise ValueError("first fails")
+        return frame()
+    def request():
+        try:
+            return cache.get_or_compute("k",compute)
+        except ValueError:
+            return None
+    results = run_threads(5,request)
+    assert sum(r is None for r in results) == 1
+    assert len(calls) == 2
+    assert cache.key_locks == {}
+#--------------------------------------------------------------------
+def test_keep_and_none():
+    cache = cc.ComputeCache("test",1e8)
+    assert cache.get_or_compute("none",lambda: None) is None
+    empty = cache.get_or_compute("empty",pd.DataFrame,keep=lambda df: len(df.index) > 0)
+    assert len(empty.index) == 0
+    assert cache.entries == {} and cache.key_locks == {}
+#--------------------------------------------------------------------
+def test_hits_share_the_data_but_cannot_change_it():
+    cache = cc.ComputeCache("test",1e8)
+    first = cache.get_or_compute("k",frame)
+    second = cache.get_or_compute("k",frame)
+    # no copy of the data per hit
+    assert np.shares_memory(first["a"].to_numpy(),second["a"].to_numpy())
+    first.loc[0,"a"] = -1.0
+    first["b"] += 1
+    first["c"] = 0
+    third = cache.get_or_compute("k",frame)
+    assert third.equals(frame())
+    assert second.equals(frame())
+    assert int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write")
+#--------------------------------------------------------------------
+def test_arrays_are_read_only():
+    cache = cc.ComputeCache("test",1e8)
+    arr = cache.get_or_compute("k",lambda: np.arange(10))
+    with pytest.raises(ValueError):
+        arr[0] = 5
+    blocks = cache.get_or_compute("d",lambda: {"a":(np.arange(3),np.zeros((3,3)))})
+    assert not blocks["a"][1].flags.writeable
+#--------------------------------------------------------------------
+def test_least_recently_used_are_evicted():
+    size = cc.size_of(frame())
+    cache = cc.ComputeCache("test",2.5*size)
+    for key in ["a","b"]:
+        cache.get_or_compute(key,frame)
+    cache.get_or_compute("a",frame)
+    cache.get_or_compute("c",frame)
+    assert list(cache.entries) == ["a","c"]
+    assert cache.evictions == 1
+    assert cache.n_bytes == 2*size
+    # a value larger than the whole cache is returned but not kept
+    big = cache.get_or_compute("big",lambda: frame(100000))
+    assert len(big.index) == 100000 and "big" not in cache.entries
+#--------------------------------------------------------------------
+def test_disk_is_shared(tmp_path):
+    first = cc.ComputeCache("test",1e8,disk_dir=str(tmp_path))
+    first.get_or_compute(("geos","1t29"),frame)
+    # another process, or this one after a restart
+    second = cc.ComputeCache("test",1e8,disk_dir=str(tmp_path))
+    def never():
+        raise AssertionError("computed again")
+    assert second.get_or_compute(("geos","1t29"),never).equals(frame())
+    assert second.disk_hits == 1
+#--------------------------------------------------------------------
+def test_disk_is_pruned(tmp_path):
+    cache = cc.ComputeCache("test",1e8,disk_dir=str(tmp_path),max_disk_bytes=1)
+    cache.get_or_compute("a",frame)
+    cache.get_or_compute("b",frame)
+    assert len(list((tmp_path / "test").glob("*.pkl"))) <= 1
+#--------------------------------------------------------------------
+def test_fingerprint():
+    df = frame()
+    assert cc.fingerprint(df) == cc.fingerprint(df.copy())
+    changed = df.copy()
+    changed.loc[5,"a"] = 0.5
+    assert cc.fingerprint(changed) != cc.fingerprint(df)
+    named = pd.DataFrame({"code":["a","b","a"]})
+    assert cc.fingerprint(named) != cc.fingerprint(pd.DataFrame({"code":["a","c","a"]}))
+    assert cc.fingerprint(df) != cc.fingerprint(df.rename(columns={"a":"x"}))
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from shared import density as de
+
+# The binned KDE is checked against scipy's exact KDE, and dihedral axes against their wrapping.
+
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("col,angular",[("C-1:N:CA:C",True),("N:CA:C:N+1",True),("N:CA:C",False),("N:CA",False),
+                                        ("bf_C-1:N:CA:C",False),("rid2_N:CA:C:N+1",False),("MINDIS|CA-1:CA:CA+1:CA+2",False),
+                                        ("MAXDIS|N:CA:C:O",False),("SUMDIS|N:CA:C:O",False),("aa",False),(0,False)])
+def test_is_angular(col, angular):
+    assert de.is_angular(col) == angular
+#--------------------------------------------------------------------
+def test_binned_kde_is_the_kde():
+    rng = np.random.default_rng(0)
+    xs = rng.normal(1.5,0.1,size=4000)
+    ys = rng.normal(110,5,size=4000)
+    grid,xc,yc = de.binned_kde(xs,ys)
+    dx,dy = xc[1] - xc[0],yc[1] - yc[0]
+    assert grid.shape == (de.BINS,de.BINS)
+    assert grid.sum()*dx*dy == pytest.approx(1)
+    kde = stats.gaussian_kde(np.vstack([xs,ys]))
+    gx,gy = np.meshgrid(xc,yc)
+    exact = kde(np.vstack([gx.ravel(),gy.ravel()])).reshape(grid.shape)
+    assert np.abs(grid - exact).max() < 0.05*exact.max()
+#--------------------------------------------------------------------
+def test_dihedrals_wrap():
+    rng = np.random.default_rng(1)
+    xs = np.concatenate([rng.normal(178,3,size=1000),rng.normal(-178,3,size=1000)])
+    xs = (xs + 180) % 360 - 180
+    ys = rng.normal(0,20,size=2000)
+    grid,xc,_ = de.binned_kde(xs,ys,periodic=(True,False))
+    assert xc[0] > -180 and xc[-1] < 180
+    profile = grid.sum(axis=0)
+    # the density either side of +/-180 is the same, and nothing is in the middle
+    assert profile[0] == pytest.approx(profile[-1],rel=0.2)
+    assert profile[len(profile)//2] < 1e-6*profile.max()
+    flat,_,_ = de.binned_kde(xs,ys)
+    assert flat.shape == grid.shape
+#--------------------------------------------------------------------
+def test_missing_values_are_left_out():
+    xs = np.array([1.0,2.0,np.nan,3.0])
+    ys = np.array([1.0,np.inf,2.0,3.0])
+    grid,xc,yc = de.binned_kde(xs,ys)
+    assert np.isfinite(grid).all()
+    assert grid.sum()*(xc[1] - xc[0])*(yc[1] - yc[0]) == pytest.approx(1)
+#--------------------------------------------------------------------
+def test_grids_are_cached_by_content():
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({"N:CA":rng.normal(1.46,0.02,size=500),"C-1:N:CA:C":rng.uniform(-180,180,size=500)})
+    first = de.density_grid(df,"N:CA","C-1:N:CA:C")
+    # the same points in another order are the same density
+    assert de.density_grid(df.sample(frac=1,random_state=3),"N:CA","C-1:N:CA:C") is first
+    assert de.density_grid(df,"N:CA","C-1:N:CA:C",bw_scale=2.0) is not first
+    moved = df.copy()
+    moved["N:CA"] += 0.01
+    assert de.density_grid(moved,"N:CA","C-1:N:CA:C") is not first
+#--------------------------------------------------------------------
+def test_density_contour():
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({"C-1:N:CA:C":rng.uniform(-180,180,size=300),"N:CA:C:N+1":rng.uniform(-180,180,size=300),
+                       "aa":rng.choice(["ALA","GLY"],size=300)})
+    fig = de.density_contour(df,"C-1:N:CA:C","N:CA:C:N+1")
+    assert fig.data[0].type == "contour"
+    assert tuple(fig.layout.xaxis.range) == (-180,180) and tuple(fig.layout.yaxis.range) == (-180,180)
+    fig = de.density_contour(df,"aa","N:CA:C:N+1")
+    assert fig.data[0].type == "histogram2dcontour"
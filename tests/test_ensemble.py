@@ -0,0 +1,110 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from shared import ensemble as en
+
+# Ensembles are built from the fixture's atoms as models moved by a translation, so every model
+# has the geometry of 1t29 itself, which maptial gives.
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"app","data","pdb1t29.ent")
+
+#--------------------------------------------------------------------
+def atom_lines():
+    with open(FIXTURE) as fr:
+        return [line for line in fr if line[:6] in ("ATOM  ","HETATM") and line[17:20] != "HOH"
+                and line[16] == " " and float(line[54:60]) == 1.0]
+#--------------------------------------------------------------------
+def moved(line, shift):
+    xyz = [float(line[30:38]) + shift,float(line[38:46]) - shift,float(line[46:54]) + 2*shift]
+    return line[:30] + "".join(f"{v:8.3f}" for v in xyz) + line[54:]
+#--------------------------------------------------------------------
+def write_models(path, models):
+    with open(path,"w") as fw:
+        for m,lines in enumerate(models):
+            fw.write(f"MODEL     {m+1:4d}\n")
+            fw.writelines(lines)
+            fw.write("ENDMDL\n")
+        fw.write("END\n")
+    return str(path)
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def lines():
+    return atom_lines()
+#--------------------------------------------------------------------
+@pytest.fixture
+def ensemble_path(tmp_path, lines):
+    return write_models(tmp_path / "0ens.pdb",[lines,[moved(l,5.0) for l in lines],[moved(l,-3.0) for l in lines]])
+#--------------------------------------------------------------------
+def test_load(ensemble_path, lines):
+    ens = en.load_ensemble(ensemble_path)
+    assert ens.pdb_code == "0ens"
+    assert len(ens) == 3 and ens.frames.shape == (3,len(lines),3)
+    np.testing.assert_allclose(ens.frames[1] - ens.frames[0],np.broadcast_to([5,-5,10],ens.frames[0].shape),atol=2e-3)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",["N:CA","N:CA:C","C-1:N:CA:C","N:CA:C:N+1","CA:CA+1"])
+def test_calculate_matches_maptial(ensemble_path, geometry, geo):
+    df = en.calculate(en.load_ensemble(ensemble_path),[geo]).dropna(subset=[geo])
+    expected = geometry([geo])
+    expected = dict(zip(zip(expected["chain"],expected["rid"]),expected[geo].astype(float)))
+    for model in [1,2,3]:
+        got = df[df["model"] == model]
+        got = dict(zip(zip(got["chain"],got["rid"]),got[geo]))
+        assert got.keys() == expected.keys()
+        np.testing.assert_allclose([got[k] for k in expected],list(expected.values()),atol=0.01)
+#--------------------------------------------------------------------
+def test_models_matched_by_atom(tmp_path, lines):
+    # a second model in another order and without the first residue's CA
+    second = [moved(l,1.0) for l in lines[::-1] if not (l[12:16] == " CA " and l[22:26] == lines[0][22:26])]
+    ens = en.load_ensemble(write_models(tmp_path / "0ord.pdb",[lines,second]))
+    ca = np.nonzero(ens.topology.atom == "CA")[0]
+    assert np.isnan(ens.frames[1,ca[0]]).all()
+    np.testing.assert_allclose(ens.frames[1,ca[1:]] - ens.frames[0,ca[1:]],np.broadcast_to([1,-1,2],(len(ca) - 1,3)),atol=2e-3)
+    df = en.calculate(ens,["N:CA"])
+    first = df[(df["rid"] == ens.topology.rid[ca[0]]) & (df["chain"] == ens.topology.chain[ca[0]])]
+    assert list(first["model"]) == [1]
+#--------------------------------------------------------------------
+def test_cache_is_reused_until_the_source_changes(tmp_path, ensemble_path):
+    cache_dir = str(tmp_path / "frames")
+    ens = en.load_ensemble(ensemble_path,cache_dir=cache_dir)
+    npy_path = os.path.join(cache_dir,"0ens_frames.npy")
+    assert isinstance(ens.frames,np.memmap)
+    inode = os.stat(npy_path).st_ino
+    again = en.load_ensemble(ensemble_path,cache_dir=cache_dir)
+    assert os.stat(npy_path).st_ino == inode
+    np.testing.assert_array_equal(again.frames,ens.frames)
+    before = np.array(ens.frames)
+    stat = os.stat(ensemble_path)
+    os.utime(ensemble_path,ns=(stat.st_atime_ns,stat.st_mtime_ns + 10**9))
+    en.load_ensemble(ensemble_path,cache_dir=cache_dir)
+    # written anew and moved into place, so the old mapping still reads the old frames
+    assert os.stat(npy_path).st_ino != inode
+    np.testing.assert_array_equal(ens.frames,before)
+    assert sorted(os.listdir(cache_dir)) == ["0ens_frames.npy","0ens_frames.npy.json"]
+#--------------------------------------------------------------------
+def test_trajectory(tmp_path, ensemble_path, lines):
+    coords_path = str(tmp_path / "traj.npy")
+    np.save(coords_path,np.zeros((4,len(lines),3),dtype=np.float32))
+    assert len(en.load_ensemble(ensemble_path,coords_path=coords_path)) == 4
+    np.save(coords_path,np.zeros((4,len(lines) - 1,3),dtype=np.float32))
+    with pytest.raises(ValueError):
+        en.load_ensemble(ensemble_path,coords_path=coords_path)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",["N","N:CA:C:O:CB","N:{O@i}","N:(O)","N[aa|GLY]:CA"])
+def test_only_simple_geos(geo):
+    with pytest.raises(ValueError):
+        en.parse_simple_geo(geo)
+#--------------------------------------------------------------------
+def test_parse_simple_geo():
+    assert en.parse_simple_geo("C-1:N:CA:C") == [("C",-1),("N",0),("CA",0),("C",0)]
+    assert en.parse_simple_geo("CA:CA+2") == [("CA",0),("CA",2)]
+#--------------------------------------------------------------------
+def test_aggregate_is_circular_for_dihedrals():
+    df = pd.DataFrame({"pdb_code":"x","chain":"A","rid":[1,1,1,2],"aa":"ALA","model":[1,2,3,1],
+                       "N:CA":[1.4,1.5,1.6,1.45],"C-1:N:CA:C":[179.0,-179.0,180.0,-60.0]})
+    out = en.aggregate(df,["N:CA","C-1:N:CA:C"])
+    assert list(out["models"]) == [3,1]
+    assert out["mean_N:CA"].iloc[0] == pytest.approx(1.5)
+    assert abs(out["mean_C-1:N:CA:C"].iloc[0]) == pytest.approx(180,abs=0.01)
+    assert out["sd_C-1:N:CA:C"].iloc[0] < 2
+    assert np.isnan(out["sd_C-1:N:CA:C"].iloc[1])
@@ -0,0 +1,99 @@
+import os
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+from shared import config as cfg
+from shared import export as ex
+
+# Exports read back as the dataframe they were written from, in batches, partitioned and empty, with no file left open.
+
+#--------------------------------------------------------------------
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cfg,"EXPORT_DIR",str(tmp_path / "exports"))
+    monkeypatch.setattr(cfg,"EXPORT_BATCH_ROWS",7)
+    return tmp_path / "exports"
+#--------------------------------------------------------------------
+@pytest.fixture
+def df():
+    n = 30
+    return pd.DataFrame({"pdb_code":["1t29","4rek","1ejg"]*10,
+                         "rid":np.arange(n),
+                         "aa":["ALA","GLY","SER","CYS","HIS","LYS"]*5,
+                         "N:CA":np.linspace(1.4,1.5,n)})
+#--------------------------------------------------------------------
+def read(path, fmt):
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    if fmt == "arrow":
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    return pd.read_csv(path)
+#--------------------------------------------------------------------
+def open_files():
+    return len(os.listdir("/proc/self/fd"))
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("fmt",list(ex.FORMATS))
+def test_round_trip_in_batches(export_dir, df, fmt):
+    before = open_files()
+    path = ex.export(df,"geos",fmt)
+    assert path.endswith(ex.FORMATS[fmt]) and path.startswith(str(export_dir))
+    back = read(path,fmt)
+    pd.testing.assert_frame_equal(back,df,check_dtype=False)
+    assert open_files() == before
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("fmt",list(ex.FORMATS))
+def test_empty_result_is_a_valid_file(export_dir, df, fmt):
+    path = ex.export(df.iloc[:0],"geos",fmt)
+    back = read(path,fmt)
+    assert len(back.index) == 0 and list(back.columns) == list(df.columns)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("fmt",["parquet","arrow"])
+def test_partitioned_zip_is_a_hive_dataset(export_dir, df, fmt, tmp_path):
+    path = ex.export(df,"geos",fmt,partition="pdb_code")
+    assert path.endswith(".zip")
+    with zipfile.ZipFile(path) as zf:
+        names = zf.namelist()
+        assert all(i.compress_type == zipfile.ZIP_STORED for i in zf.infolist())
+        zf.extractall(tmp_path / "unzipped")
+    assert len(names) == 3 and all("/pdb_code=" in n for n in names)
+    folder = tmp_path / "unzipped" / os.path.basename(path)[:-len(".zip")]
+    table = ds.dataset(str(folder),format="parquet" if fmt == "parquet" else "ipc",partitioning="hive").to_table()
+    back = table.to_pandas().sort_values("rid").reset_index(drop=True)
+    assert len(back.index) == len(df.index)
+    assert list(back["pdb_code"].astype(str)) == list(df["pdb_code"])
+    np.testing.assert_allclose(back["N:CA"],df["N:CA"])
+#--------------------------------------------------------------------
+def test_partition_names_are_safe(export_dir, df):
+    df = df.assign(chain=["A/..","B C"]*15)
+    path = ex.export(df,"geos","csv.gz",partition="chain")
+    with zipfile.ZipFile(path) as zf:
+        dirs = {n.split("/")[1] for n in zf.namelist()}
+    assert dirs == {"chain=A_..","chain=B_C"}
+#--------------------------------------------------------------------
+def test_old_exports_are_pruned(export_dir, df):
+    old = ex.export(df,"old","csv.gz")
+    partitioned = ex.export(df,"old","csv.gz",partition="aa")
+    past = time.time() - cfg.EXPORT_KEEP_SECONDS - 10
+    for p in [old,partitioned,partitioned[:-len(".zip")]]:
+        os.utime(p,(past,past))
+    new = ex.export(df,"new","csv.gz")
+    assert sorted(os.listdir(export_dir)) == [os.path.basename(new)]
+#--------------------------------------------------------------------
+def test_download_reads_and_closes(export_dir, df):
+    path = ex.export(df,"geos","parquet")
+    before = open_files()
+    data = ex.read_file(path)
+    assert data[:4] == b"PAR1" and len(data) == os.path.getsize(path)
+    assert open_files() == before
+#--------------------------------------------------------------------
+def test_failed_conversion_closes_the_file(export_dir):
+    df = pd.DataFrame({"mixed":[1,"a",2.5]})
+    before = open_files()
+    with pytest.raises((pa.ArrowException,TypeError,ValueError)):
+        ex.export(df,"geos","parquet")
+    assert open_files() == before
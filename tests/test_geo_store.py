@@ -0,0 +1,104 @@
+import sqlite3
+from contextlib import closing
+import pandas as pd
+import pytest
+from shared import config as cfg
+from shared import geo_store as gs
+
+# Each geo of a structure is calculated and stored on its own, and widen joins them back into
+# what calculateGeometry gives for the whole list, which is what the app shows.
+
+#--------------------------------------------------------------------
+def as_text(df):
+    return df.astype(str).reset_index(drop=True)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geos",[["N:CA","CA:C"],
+                                 ["C-1:N:CA:C","N:CA:C:N+1"],
+                                 ["N:CA","SG:{SG&1}"],
+                                 ["N:(O@1)","CA:C","N:CA"],
+                                 ["CA:{CA@i}[dis|<6]","N:CA"],
+                                 ["N:CA","N:CA","CA:C"]])
+def test_widen_is_calculate_geometry(geometry, geos):
+    per_geo = {geo:geometry([geo]) for geo in geos}
+    expected = geometry(list(dict.fromkeys(geos)))
+    widened = gs.widen(per_geo,geos)
+    assert list(widened.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(as_text(widened),as_text(expected))
+#--------------------------------------------------------------------
+def test_widen_drops_residues_missing_a_geo(geometry):
+    widened = gs.widen({"N:CA":geometry(["N:CA"]),"SG:CB":gs.empty("SG:CB")},["N:CA","SG:CB"])
+    assert len(widened.index) == 0
+    assert list(widened.columns[:2]) == ["N:CA","SG:CB"]
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",["N:CA:C","SG:{SG&1}","N:(O@1)"])
+def test_save_and_load(tmp_path, geometry, geo):
+    dbpath = str(tmp_path / "geo.db")
+    df = geometry([geo])
+    gs.save("1t29",geo,df,resolution=2.3,dbpath=dbpath)
+    assert gs.stored_geos("1t29",[geo,"N:CA"],dbpath=dbpath) == {geo}
+    loaded = gs.load("1t29",geo,dbpath=dbpath)
+    assert list(loaded.columns) == list(df.columns)
+    assert len(loaded.index) == len(df.index)
+    pd.testing.assert_series_equal(loaded[geo].astype(float),df[geo].astype(float),check_names=False)
+    for col in ["aa","chain",f"info_{geo}",f"motif_{geo}"]:
+        assert (loaded[col].astype(str).values == df[col].astype(str).values).all(),col
+    # saving again replaces the run rather than adding to it
+    gs.save("1t29",geo,df,resolution=2.3,dbpath=dbpath)
+    assert len(gs.load("1t29",geo,dbpath=dbpath).index) == len(df.index)
+#--------------------------------------------------------------------
+def test_uploads_are_not_stored():
+    assert gs.is_storable("1t29")
+    assert not gs.is_storable("user_1t29")
+#--------------------------------------------------------------------
+def runs(dbpath):
+    with closing(gs.connect(dbpath)) as con:
+        return con.execute("SELECT pdb_code,geo,n_rows FROM geo_runs ORDER BY pdb_code,geo").fetchall()
+#--------------------------------------------------------------------
+def values(dbpath):
+    with closing(gs.connect(dbpath)) as con:
+        return con.execute("SELECT pdb_code,geo,count(*) FROM geo_values GROUP BY pdb_code,geo ORDER BY pdb_code,geo").fetchall()
+#--------------------------------------------------------------------
+def test_large_runs_are_not_stored(tmp_path, geometry, monkeypatch):
+    dbpath = str(tmp_path / "geo.db")
+    df = geometry(["N:CA"])
+    monkeypatch.setattr(cfg,"GEO_STORE_RUN_ROWS",len(df.index) - 1)
+    assert not gs.save("1t29","N:CA",df,dbpath=dbpath)
+    assert gs.stored_geos("1t29",["N:CA"],dbpath=dbpath) == set()
+    monkeypatch.setattr(cfg,"GEO_STORE_RUN_ROWS",len(df.index))
+    assert gs.save("1t29","N:CA",df,dbpath=dbpath)
+#--------------------------------------------------------------------
+def test_least_recently_used_runs_are_evicted(tmp_path, geometry, monkeypatch):
+    dbpath = str(tmp_path / "geo.db")
+    df = geometry(["N:CA"])
+    n = len(df.index)
+    monkeypatch.setattr(cfg,"GEO_STORE_MAX_ROWS",3*n)
+    for code,stamp in [("a","2020-01-01"),("b","2020-01-02"),("c","2020-01-03")]:
+        gs.save(code,"N:CA",df,dbpath=dbpath)
+        with closing(gs.connect(dbpath)) as con, con:
+            con.execute("UPDATE geo_runs SET used_at = ? WHERE pdb_code = ?",(stamp,code))
+    # reading a makes b the least recently used
+    gs.load("a","N:CA",dbpath=dbpath)
+    gs.save("d","N:CA",df,dbpath=dbpath)
+    assert [r[0] for r in runs(dbpath)] == ["a","c","d"]
+    assert values(dbpath) == [("a","N:CA",n),("c","N:CA",n),("d","N:CA",n)]
+#--------------------------------------------------------------------
+def test_other_versions_are_deleted_when_opened(tmp_path, geometry, monkeypatch):
+    dbpath = str(tmp_path / "geo.db")
+    df = geometry(["N:CA"])
+    monkeypatch.setattr(gs,"LIB_VERSION","0.1+pairs0")
+    gs.save("1t29","N:CA",df,dbpath=dbpath)
+    monkeypatch.undo()
+    gs._opened.discard(dbpath)
+    assert runs(dbpath) == []
+    assert values(dbpath) == []
+#--------------------------------------------------------------------
+def test_stores_without_use_times_are_upgraded(tmp_path, geometry):
+    dbpath = str(tmp_path / "geo.db")
+    with closing(sqlite3.connect(dbpath)) as con, con:
+        con.execute("""CREATE TABLE geo_runs (pdb_code TEXT, geo TEXT, version TEXT, resolution REAL,
+                       n_rows INTEGER, computed_at TEXT, PRIMARY KEY (pdb_code, geo, version))""")
+        con.execute("INSERT INTO geo_runs VALUES ('x','N:CA',?,NULL,0,'2020-01-01')",(gs.LIB_VERSION,))
+    gs.save("1t29","N:CA",geometry(["N:CA"]),dbpath=dbpath)
+    with closing(gs.connect(dbpath)) as con:
+        assert con.execute("SELECT used_at FROM geo_runs WHERE pdb_code = 'x'").fetchone() == ("2020-01-01",)
+    assert gs.stored_geos("1t29",["N:CA"],dbpath=dbpath) == {"N:CA"}
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from shared import atom_arrays as ar
+from shared import hbonds as hb
+
+# Hydrogen bonds are donor/acceptor pairs of heavy atoms within the distance range whose angles at
+# the antecedent atoms, standing in for the hydrogens, are wide enough.
+
+#--------------------------------------------------------------------
+def arrays(atoms):
+    """AtomArrays of (chain, rid, aa, atom, x, y, z) rows, optionally with a disordered flag."""
+    n = len(atoms)
+    def col(i, dtype=object):
+        return np.array([a[i] for a in atoms],dtype=dtype)
+    disordered = np.array([a[7] if len(a) > 7 else False for a in atoms],dtype=bool)
+    return ar.AtomArrays("test",1.0,col(0),col(1,np.int64),col(1,np.int64),col(2),col(3),
+                         np.array([a[3][0] for a in atoms],dtype=object),np.zeros(n,dtype=np.float32),
+                         np.ones(n,dtype=np.float32),disordered,
+                         np.array([a[4:7] for a in atoms],dtype=np.float32))
+#--------------------------------------------------------------------
+def backbone_pair(distance=2.9, d_angle=160, a_angle=150, donor_aa="ALA", d_rid=1, a_rid=5, disordered=False):
+    # CA-N...O=C with the N...O along x, and CA and C 1.5 from N and O at the given angles
+    def antecedent(origin, towards, angle):
+        rad = np.radians(angle)
+        return origin + 1.5*np.array([towards*np.cos(rad),np.sin(rad),0])
+    n = np.array([0.0,0,0])
+    o = np.array([distance,0,0])
+    ca = antecedent(n,1,d_angle)
+    c = antecedent(o,-1,a_angle)
+    return arrays([("A",d_rid,donor_aa,"N",*n,disordered),("A",d_rid,donor_aa,"CA",*ca),
+                   ("A",a_rid,"ALA","O",*o),("A",a_rid,"ALA","C",*c)])
+#--------------------------------------------------------------------
+def test_backbone_bond():
+    df = hb.find_hbonds(backbone_pair())
+    assert len(df.index) == 1
+    row = df.iloc[0]
+    assert (row["d_atom"],row["a_atom"],row["kind"]) == ("N","O","bb-bb")
+    assert row["distance"] == pytest.approx(2.9,abs=1e-5)
+    assert row["d_angle"] == pytest.approx(160,abs=1e-3)
+    assert row["a_angle"] == pytest.approx(150,abs=1e-3)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("kwargs",[{"distance":2.4},{"distance":3.6},{"d_angle":80},{"a_angle":80},
+                                   {"donor_aa":"PRO"},{"a_rid":1},{"disordered":True}])
+def test_rejected(kwargs):
+    assert len(hb.find_hbonds(backbone_pair(**kwargs)).index) == 0
+#--------------------------------------------------------------------
+def test_criteria_can_be_changed():
+    arrs = backbone_pair(distance=3.8,d_angle=80)
+    assert len(hb.find_hbonds(arrs,max_dis=4.0,min_angle=70).index) == 1
+    assert len(hb.find_hbonds(backbone_pair(disordered=True),exc_disordered=False).index) == 1
+    assert len(hb.find_hbonds(backbone_pair(a_rid=2),min_rid_sep=2).index) == 0
+#--------------------------------------------------------------------
+def test_waters_pair_once():
+    arrs = arrays([("W",1,"HOH","O",0,0,0),("W",2,"HOH","O",2.8,0,0)])
+    df = hb.find_hbonds(arrs)
+    assert len(df.index) == 1
+    assert df.iloc[0]["kind"] == "water"
+    assert np.isnan(df.iloc[0]["d_angle"]) and np.isnan(df.iloc[0]["a_angle"])
+#--------------------------------------------------------------------
+def test_no_donors():
+    df = hb.find_hbonds(arrays([("A",1,"ALA","CB",0,0,0),("A",2,"ALA","CB",2.8,0,0)]))
+    assert len(df.index) == 0
+    assert list(df.columns) == list(hb.empty_frame().columns)
+#--------------------------------------------------------------------
+def test_typing():
+    role,ante,backbone = hb.type_atoms(arrays([("A",1,"SER","N",0,0,0),("A",1,"SER","CA",1,0,0),("A",1,"SER","OG",2,0,0),
+                                               ("A",1,"SER","CB",3,0,0),("A",1,"SER","CG",4,0,0),("A",2,"PRO","N",5,0,0)]))
+    assert list(role) == ["D","","DA","","",""]
+    assert list(ante[[0,2]]) == [1,3]
+    assert list(backbone) == [True,False,False,False,False,False]
+#--------------------------------------------------------------------
+def test_backbone_bonds_are_maptial_pairs(pobj, geometry):
+    # N...O backbone bonds in a chain are a subset of maptial's pairs in the same distance range
+    df = hb.hbonds_structures([pobj])
+    bb = df[(df["kind"] == "bb-bb") & (df["d_atom"] == "N") & (df["a_atom"] == "O") & (df["d_chain"] == df["a_chain"])]
+    geo = "N:{O@i}[dis|2.5><3.5,rid|>1]"
+    pairs = geometry([geo])
+    expected = dict(zip(zip(pairs["chain"],pairs["rid"],pairs[f"rid2_{geo}"]),pairs[geo].astype(float)))
+    assert len(bb.index) > 100
+    for chain,d_rid,a_rid,dis in zip(bb["d_chain"],bb["d_rid"],bb["a_rid"],bb["distance"]):
+        assert expected[(chain,d_rid,a_rid)] == pytest.approx(dis,abs=1e-3)
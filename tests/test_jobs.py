@@ -0,0 +1,117 @@
+import threading
+import time
+import uuid
+import pytest
+from shared import jobs
+from shared import sandbox as sb
+
+# Jobs shared by key, stopped per waiting session, and their spans shown to the session that submitted them.
+
+#--------------------------------------------------------------------
+def wait(job_id, seconds=10):
+    job = jobs.get(job_id)
+    end = time.time() + seconds
+    while not job.is_finished():
+        assert time.time() < end, f"job {job.status} after {seconds} s"
+        time.sleep(0.01)
+    return job
+#--------------------------------------------------------------------
+def steps(job):
+    # runs until stopped, with the steps it got through
+    done = 0
+    try:
+        while True:
+            job.check()
+            done += 1
+            job.advance(f"step {done}")
+            time.sleep(0.01)
+    except sb.Stopped as e:
+        raise sb.Stopped(e.reason,partial=done)
+#--------------------------------------------------------------------
+@pytest.fixture
+def key():
+    return ("test",uuid.uuid4().hex)
+#--------------------------------------------------------------------
+def test_same_key_shares_a_job(key):
+    calls = []
+    gate = threading.Event()
+
+    def fn(job):
+        calls.append(1)
+        gate.wait(5)
+        return 42
+
+    first = jobs.submit(key,fn,waiter="a")
+    second = jobs.submit(key,fn,waiter="b")
+    assert first == second
+    assert jobs.get(first).is_waiting("a") and jobs.get(first).is_waiting("b")
+    gate.set()
+    assert wait(first).result == 42
+    assert jobs.submit(key,fn,waiter="c") == first
+    assert len(calls) == 1
+#--------------------------------------------------------------------
+def test_failed_job_is_logged_and_run_again(key, caplog):
+    def fn(job):
+        raise ValueError("no atoms")
+
+    with caplog.at_level("ERROR",logger="prometry.jobs"):
+        first = jobs.submit(key,fn)
+        job = wait(first)
+    assert job.status == jobs.FAILED and job.error == "no atoms"
+    assert any(r.exc_info is not None and r.exc_info[0] is ValueError for r in caplog.records)
+    second = jobs.submit(key,lambda job: "ok")
+    assert second != first and wait(second).result == "ok"
+#--------------------------------------------------------------------
+def test_cancel_stops_only_the_last_waiter(key):
+    job_id = jobs.submit(key,steps,waiter="a")
+    assert jobs.submit(key,steps,waiter="b") == job_id
+    jobs.cancel(job_id,"a")
+    time.sleep(0.1)
+    job = jobs.get(job_id)
+    assert job.status == jobs.RUNNING and not job.is_waiting("a")
+    jobs.cancel(job_id,"b")
+    job = wait(job_id)
+    assert job.status == jobs.STOPPED and job.error == "Cancelled"
+    assert job.result == job.done > 0
+    # a cancelled job is not handed out again
+    assert jobs.submit(key,lambda job: "again") != job_id
+#--------------------------------------------------------------------
+def test_timeout_stops_when_every_waiter_is_out_of_time(key):
+    job_id = jobs.submit(key,steps,timeout=0.2,waiter="a")
+    job = wait(job_id)
+    assert job.status == jobs.STOPPED and "time limit" in job.error
+    assert job.finished - job.submitted < 5
+#--------------------------------------------------------------------
+def test_waiter_without_timeout_keeps_the_job_going(key):
+    job_id = jobs.submit(key,steps,timeout=0.1,waiter="a")
+    jobs.submit(key,steps,waiter="b")
+    time.sleep(0.3)
+    assert jobs.get(job_id).status == jobs.RUNNING
+    jobs.cancel(job_id,"b")
+    assert wait(job_id).status == jobs.STOPPED
+#--------------------------------------------------------------------
+def test_job_spans_reach_the_submitting_session():
+    from streamlit.testing.v1 import AppTest
+
+    def page():
+        import time
+        import uuid
+        import streamlit as st
+        from shared import jobs
+        from shared import tracing as tr
+
+        def fn(job):
+            with tr.span("job_step",rows=3):
+                return 1
+
+        job_id = jobs.submit(("test",uuid.uuid4().hex),fn)
+        while not jobs.get(job_id).is_finished():
+            time.sleep(0.01)
+        st.session_state["session"] = tr.session_id()
+        st.session_state["spans"] = tr.take_spans()
+
+    at = AppTest.from_function(page).run(timeout=30)
+    assert not at.exception
+    spans = [s for s in at.session_state["spans"] if s["span"] == "job_step"]
+    assert len(spans) == 1
+    assert spans[0]["session"] == at.session_state["session"]
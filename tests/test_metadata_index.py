@@ -0,0 +1,125 @@
+import os
+import pytest
+from shared import metadata_index as mi
+
+# The catalogue is read from file headers in one text pass, and its composition counts only the
+# first model, as maptial does.
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"app","data","pdb1t29.ent")
+
+ENSEMBLE = """HEADER    TEST                                    01-JAN-20   0XXX
+MODEL        1
+ATOM      1  N   GLY A   1       0.000   0.000   0.000  1.00  0.00           N
+ATOM      2  CA  GLY A   1       1.000   0.000   0.000  1.00  0.00           C
+HETATM    3 ZN    ZN A 101       5.000   0.000   0.000  1.00  0.00          ZN
+HETATM    4  O   HOH A 201       6.000   0.000   0.000  1.00  0.00           O
+ENDMDL
+MODEL        2
+ATOM      1  N   GLY A   1       0.100   0.000   0.000  1.00  0.00           N
+ATOM      2  CA  GLY A   1       1.100   0.000   0.000  1.00  0.00           C
+HETATM    3 ZN    ZN A 101       5.100   0.000   0.000  1.00  0.00          ZN
+HETATM    4  O   HOH A 201       6.100   0.000   0.000  1.00  0.00           O
+ENDMDL
+END
+"""
+
+CIF = """data_0XXX
+_exptl.method 'SOLUTION NMR'
+_pdbx_database_status.recvd_initial_deposition_date 2020-01-01
+loop_
+_atom_site.group_PDB
+_atom_site.type_symbol
+_atom_site.label_atom_id
+_atom_site.label_comp_id
+_atom_site.auth_asym_id
+_atom_site.auth_seq_id
+_atom_site.pdbx_PDB_model_num
+ATOM N N GLY A 1 1
+ATOM C CA GLY A 1 1
+HETATM ZN ZN ZN A 101 1
+ATOM N N GLY A 1 2
+ATOM C CA GLY A 1 2
+HETATM ZN ZN ZN A 101 2
+"""
+
+#--------------------------------------------------------------------
+@pytest.fixture
+def dbpath(tmp_path):
+    return str(tmp_path / "index.db")
+#--------------------------------------------------------------------
+def test_read_pdb_header():
+    row = mi.read_header(FIXTURE)
+    assert row["method"] == "x-ray diffraction"
+    assert row["resolution"] == 2.3 and row["r_free"] == 0.266
+    assert row["deposition_date"] == "2004-04-20"
+    assert (row["n_models"],row["n_chains"],row["n_residues"]) == (1,2,458)
+    assert (row["n_atoms"],row["n_hetatms"]) == (1764,245)
+    comp = row["composition"]
+    assert sum(comp["atom"].values()) == 1764 + 245
+    assert comp["atom"]["SG"] == 6
+    assert dict(comp["ligand"]) == {"SEP":1}
+#--------------------------------------------------------------------
+def test_read_pdb_header_counts_the_first_model(tmp_path):
+    filepath = str(tmp_path / "0xxx.pdb")
+    with open(filepath,"w") as fw:
+        fw.write(ENSEMBLE)
+    row = mi.read_header(filepath)
+    assert row["n_models"] == 2
+    assert (row["n_atoms"],row["n_hetatms"],row["n_residues"]) == (2,2,3)
+    assert dict(row["composition"]["ligand"]) == {"ZN":1}
+    assert dict(row["composition"]["element"]) == {"N":1,"C":1,"ZN":1,"O":1}
+#--------------------------------------------------------------------
+def test_read_cif_header(tmp_path):
+    filepath = str(tmp_path / "0xxx.cif")
+    with open(filepath,"w") as fw:
+        fw.write(CIF)
+    row = mi.read_header(filepath)
+    assert row["method"] == "solution nmr"
+    assert row["resolution"] is None
+    assert row["deposition_date"] == "2020-01-01"
+    assert (row["n_models"],row["n_chains"],row["n_residues"],row["n_atoms"],row["n_hetatms"]) == (2,1,2,2,1)
+    assert dict(row["composition"]["atom"]) == {"N":1,"CA":1,"ZN":1}
+    assert dict(row["composition"]["residue"]) == {"GLY":1,"ZN":1}
+#--------------------------------------------------------------------
+def test_index_file_once(dbpath):
+    assert mi.index_file("1t29",FIXTURE,dbpath=dbpath)
+    assert mi.is_indexed("1t29",dbpath)
+    assert not mi.index_file("1t29",FIXTURE,dbpath=dbpath)
+    assert mi.index_file("1t29",FIXTURE,dbpath=dbpath,force=True)
+    df = mi.query(dbpath=dbpath)
+    assert list(df["pdb_code"]) == ["1t29"]
+    assert df.iloc[0]["filepath"] == FIXTURE
+    # reindexing replaces the composition rather than adding to it
+    assert mi.compositions(["1t29"],dbpath=dbpath)["1t29"]["atom"]["SG"] == 6
+#--------------------------------------------------------------------
+def test_summary_never_overwrites_the_header(dbpath):
+    mi.record_summary("9abc",method="X-ray diffraction",resolution="1.5 A",n_chains=3,dbpath=dbpath)
+    assert not mi.is_indexed("9abc",dbpath)
+    row = mi.query(pdb_codes=["9abc"],dbpath=dbpath).iloc[0]
+    assert (row["method"],row["resolution"],row["n_chains"],row["from_header"]) == ("x-ray diffraction",1.5,3,0)
+    mi.index_file("1t29",FIXTURE,dbpath=dbpath)
+    mi.record_summary("1t29",method="electron microscopy",resolution="9.0",dbpath=dbpath)
+    assert mi.query(pdb_codes=["1t29"],dbpath=dbpath).iloc[0]["resolution"] == 2.3
+#--------------------------------------------------------------------
+def test_query(dbpath):
+    mi.index_file("1t29",FIXTURE,dbpath=dbpath)
+    mi.record_summary("9abc",method="electron microscopy",resolution="3.5",n_chains=4,dbpath=dbpath)
+    mi.record_summary("9abd",method="x-ray diffraction",resolution=None,dbpath=dbpath)
+    assert list(mi.query(max_resolution=3,dbpath=dbpath)["pdb_code"]) == ["1t29"]
+    assert list(mi.query(method="X-RAY",dbpath=dbpath)["pdb_code"]) == ["1t29","9abd"]
+    assert list(mi.query(min_chains=3,dbpath=dbpath)["pdb_code"]) == ["9abc"]
+    assert list(mi.query(deposited_after="2004-01-01",deposited_before="2004-12-31",dbpath=dbpath)["pdb_code"]) == ["1t29"]
+    assert len(mi.query(pdb_codes=["9abc","none"],dbpath=dbpath).index) == 1
+#--------------------------------------------------------------------
+def test_compositions(dbpath):
+    mi.index_file("1t29",FIXTURE,dbpath=dbpath)
+    mi.record_summary("9abc",dbpath=dbpath)
+    comps = mi.compositions(["1t29","9abc","none"],dbpath=dbpath)
+    # only structures read from their header have one
+    assert list(comps) == ["1t29"]
+    assert sorted(comps["1t29"]) == sorted(mi.COMPOSITION_KINDS)
+    assert comps["1t29"]["residue"]["GLY"] == 14
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("val,expected",[("2.3",2.3),(1.5,1.5),("0",None),("-1",None),("",None),(None,None),("NOT",None)])
+def test_to_float(val, expected):
+    assert mi.to_float(val) == expected
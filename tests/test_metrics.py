@@ -0,0 +1,55 @@
+import pytest
+from shared import metrics as mt
+
+# Geo kinds, the Prometheus text of counters and histograms, and collection with a failing collector.
+
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo,kind",[("N:CA","distance"),("N:CA:C","angle"),("C-1:N:CA:C","dihedral"),("N:CA:C:O:N+1","other"),
+                                     ("CA:{CA@i}","all_pairs"),("CA:{CA@i}[dis|<8]","all_pairs"),("CA:{CA&3@i}[dis|<10]","all_pairs"),
+                                     ("N:{O@1}","nearest"),("N:{O@2}[dis|<3.5]","nearest"),("SG:{SG&1}","distance"),
+                                     ("COUNT|CA:{CA@i}[dis|<8]","count"),("SUMDIS|N:CA:C:O","sumdis"),("MINDIS|CA-1:CA:CA+1:CA+2","mindis")])
+def test_geo_kind(geo, kind):
+    assert mt.geo_kind(geo) == kind
+#--------------------------------------------------------------------
+def test_observe_span_records_geometry_by_kind():
+    before = dict(mt.GEOMETRY_ROWS.values)
+    mt.observe_span({"span":"calculateGeometry","seconds":0.2,"geo":"CA:{CA@i}[dis|<8]","rows":40})
+    mt.observe_span({"span":"calculateGeometry","seconds":0.1,"geo":"N:{O@1}","rows":7})
+    assert mt.GEOMETRY_ROWS.values[("all_pairs",)] - before.get(("all_pairs",),0) == 40
+    assert mt.GEOMETRY_ROWS.values[("nearest",)] - before.get(("nearest",),0) == 7
+    assert ("&",) not in mt.GEOMETRY_ROWS.values
+#--------------------------------------------------------------------
+def test_histogram_lines():
+    hist = mt.Histogram("test_seconds","A test histogram.",("stage",),buckets=(0.1,1))
+    hist.observe(0.05,stage="a")
+    hist.observe(0.5,stage="a")
+    hist.observe(5,stage="a")
+    lines = hist.lines()
+    assert lines[:2] == ["# HELP test_seconds A test histogram.","# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="a"} 5.55' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+#--------------------------------------------------------------------
+def test_labels_are_escaped():
+    counter = mt.Counter("test_errors_total","A test counter.",("error",))
+    counter.inc(error='bad "geo"\\n')
+    assert counter.lines()[-1] == 'test_errors_total{error="bad \\"geo\\"\\\\n"} 1'
+#--------------------------------------------------------------------
+def test_render_carries_on_past_a_failing_collector():
+    def changing():
+        raise RuntimeError("dictionary changed size during iteration")
+
+    def steady():
+        return ["test_steady 1"]
+
+    mt.collector(changing)
+    mt.collector(steady)
+    try:
+        text = mt.render()
+    finally:
+        mt._collectors.remove(changing)
+        mt._collectors.remove(steady)
+    assert "test_steady 1\n" in text
+    assert text.endswith("\n")
@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from shared import pair_search as ps
+from shared import query_plan as qp
+
+# pair_search answers these geos in place of calculateGeometry, so on the fixture it has to give
+# the same rows: in the same order for a search, and for a symmetric search each unordered pair
+# once (the first atom numbered no higher than the second), which mirror puts back in both directions.
+
+SYMMETRIC = ["CA:{CA@i}[dis|<8]","SG:{SG@i}","CA:{CA@i}[dis|0.5><6,rid|>1]","CA:{CA@i}[dis|0.5<>6]","CA:{CA&3@i}[dis|<10]"]
+SEARCHES = ["N:(O@1)","N:(O,N@i)[dis|2.5><3.2,rid|>0]","N:{O&3@i}[dis|<10]","N:{(O)@i}","O:(N&1)","SG:{SG&1}"]
+
+#--------------------------------------------------------------------
+def atom_numbers(df, geo):
+    info = df[f"info_{geo}"].str.extract(r"^\(.*?\|.*?\|.*?\|.*?\|(\d+)\)\(.*?\|.*?\|.*?\|.*?\|(\d+)\)$")
+    return info[0].astype(int),info[1].astype(int)
+#--------------------------------------------------------------------
+def assert_same(expected, actual, geo):
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual.index) == len(expected.index)
+    for col in expected.columns:
+        if col in (geo,f"occ_{geo}",f"bf_{geo}"):
+            np.testing.assert_allclose(actual[col].astype(float),expected[col].astype(float),rtol=1e-6,atol=1e-6)
+        else:
+            assert (actual[col].astype(str).values == expected[col].astype(str).values).all(),col
+#--------------------------------------------------------------------
+def pairs(df, geo):
+    return sorted(zip(df["rid"],df[f"rid2_{geo}"],df[f"info_{geo}"],np.round(df[geo].astype(float),4)))
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",SEARCHES)
+def test_search_matches_maptial(pobj, geometry, geo):
+    assert ps.supports(geo)
+    assert_same(geometry([geo]),ps.calculate([pobj],geo),geo)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",SYMMETRIC)
+def test_symmetric_search_matches_maptial_once(pobj, geometry, geo):
+    assert ps.is_symmetric(*qp.parse_geo(geo)[1])
+    expected = geometry([geo])
+    first,second = atom_numbers(expected,geo)
+    assert_same(expected[first <= second].reset_index(drop=True),ps.calculate([pobj],geo),geo)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",SYMMETRIC)
+def test_mirror_gives_both_directions(pobj, geometry, geo):
+    expected = geometry([geo])
+    mirrored = ps.mirror(ps.calculate([pobj],geo),geo)
+    assert pairs(mirrored,geo) == pairs(expected,geo)
+    assert sorted(mirrored["aa"]) == sorted(expected["aa"])
+    assert sorted(mirrored[f"motif_{geo}"]) == sorted(expected[f"motif_{geo}"])
+#--------------------------------------------------------------------
+def test_mirror_leaves_searches_alone(pobj):
+    geo = "N:(O@1)"
+    df = ps.calculate([pobj],geo)
+    assert len(ps.mirror(df,geo).index) == len(df.index)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("search",["CA:{CA@i}[dis|0.1><8]","N:(N,O@i)[dis|<3.2]"])
+def test_count_is_pairs_per_anchor(pobj, geometry, search):
+    geo = "COUNT|" + search
+    counted = ps.calculate([pobj],geo)
+    expected = geometry([search])
+    anchors = expected[f"info_{search}"].str.extract(r"^(\(.*?\))")[0].value_counts()
+    # a row per start atom, including those with nothing in range, as a start atom paired with itself has
+    start = search.split(":")[0]
+    starts = geometry([f"{start}:{start}"])
+    assert len(counted.index) == len(starts.index)
+    got = counted.set_index(f"info_{geo}")[geo]
+    assert got.sum() == len(expected.index)
+    assert (got[anchors.index] == anchors).all()
+#--------------------------------------------------------------------
+def test_rdf_shells_add_up_to_the_count(pobj):
+    count = ps.calculate([pobj],"COUNT|CA:{CA@i}[dis|0.1><6]")
+    geo = "RDF|CA:{CA@i}[dis|0.1><6]"
+    rdf = ps.calculate([pobj],geo)
+    shells = rdf[f"info_{geo}"].str.extract(r"\[([\d,]*)\]$")[0]
+    assert (shells.str.split(",").str.len() == 12).all()
+    totals = shells.apply(lambda s: sum(int(n) for n in s.split(",")))
+    assert (totals.values == rdf[geo].values).all()
+    assert (rdf[geo].values == count["COUNT|CA:{CA@i}[dis|0.1><6]"].values).all()
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",["N:CA","N:CA:C","CA-1:CA","CA:{CA@i}:C","MINDIS|CA-1:CA:CA+1","CA@1:{CA@i}"])
+def test_unsupported_geos(geo):
+    assert not ps.supports(geo)
+#--------------------------------------------------------------------
+def test_atoms_are_the_atom_arrays_in_float64(pobj):
+    from shared import atom_arrays as ar
+    atoms = ps.atoms_of(pobj)
+    arrs = ar.from_pobj(pobj)
+    assert ps.atoms_of(pobj) is atoms
+    assert atoms.coords.dtype == np.float64 and (atoms.atom == arrs.atom).all()
+    np.testing.assert_allclose(atoms.coords,arrs.coords,atol=1e-3)
+    res = next(iter(next(iter(pobj.chains.values())).values()))
+    first = next(iter(res.atoms.values()))
+    assert tuple(atoms.coords[0]) == (first.x,first.y,first.z)
+    assert [c for c,_,_ in atoms.chains] == [c for c in pobj.chains if len(pobj.chains[c]) > 0]
+    assert sum(hi - lo for _,lo,hi in atoms.chains) == len(atoms)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from shared import plot_lod as lod
+
+# What reaches the browser is bounded whatever the size of the frame, and nothing is dropped
+# without a note saying so.
+
+#--------------------------------------------------------------------
+def points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    aa = np.where(rng.random(n) < 0.02,"GLY","ALA")
+    return pd.DataFrame({"x":rng.normal(size=n),"y":rng.normal(size=n),"z":rng.normal(size=n),
+                         "aa":aa,"bf":rng.random(n)})
+#--------------------------------------------------------------------
+def n_points(fig):
+    return sum(len(t.x) for t in fig.data if t.name != "density")
+#--------------------------------------------------------------------
+def test_small_plots_are_complete():
+    fig,note = lod.scatter(points(500),"x","y",color="aa")
+    assert note == ""
+    assert n_points(fig) == 500
+    assert all(t.type == "scatter" for t in fig.data)
+#--------------------------------------------------------------------
+def test_webgl_above_the_threshold():
+    fig,note = lod.scatter(points(lod.WEBGL_POINTS + 1),"x","y")
+    assert note == ""
+    assert {t.type for t in fig.data} == {"scattergl"}
+#--------------------------------------------------------------------
+def test_large_plots_are_sampled(monkeypatch):
+    monkeypatch.setattr(lod,"MAX_POINTS",2000)
+    fig,note = lod.scatter(points(10000),"x","y",color="bf")
+    assert n_points(fig) == 2000
+    assert note.startswith("Showing 2,000 of 10,000 points.")
+#--------------------------------------------------------------------
+def test_sample_keeps_every_group():
+    df = points(10000)
+    sample = lod.stratified_sample(df,1000,by="aa")
+    assert set(sample["aa"]) == {"ALA","GLY"}
+    share = (sample["aa"] == "GLY").mean()
+    assert share == pytest.approx((df["aa"] == "GLY").mean(),abs=0.01)
+    # rows keep their order, and the sample is the same each time
+    assert sample.index.is_monotonic_increasing
+    assert sample.index.equals(lod.stratified_sample(df,1000,by="aa").index)
+    rare = df.copy()
+    rare.loc[rare.index[:1],"aa"] = "PRO"
+    assert "PRO" in set(lod.stratified_sample(rare,100,by="aa")["aa"])
+#--------------------------------------------------------------------
+def test_raster_under_the_sample(monkeypatch):
+    monkeypatch.setattr(lod,"MAX_POINTS",500)
+    monkeypatch.setattr(lod,"RASTER_POINTS",5000)
+    df = points(6000)
+    fig,note = lod.scatter(df,"x","y",color="aa")
+    assert fig.data[0].type == "heatmap" and fig.data[0].name == "density"
+    assert np.nansum(10**np.array(fig.data[0].z,dtype=float) - 1) == pytest.approx(6000)
+    assert "sampled in proportion to aa" in note and "density raster" in note
+#--------------------------------------------------------------------
+def test_zoom_window_brings_back_every_point(monkeypatch):
+    monkeypatch.setattr(lod,"MAX_POINTS",2000)
+    df = points(20000)
+    inside = lod.window(df,"x","y",(0,0.1),(0,0.1))
+    assert 0 < len(inside.index) < 2000
+    assert ((inside["x"] >= 0) & (inside["x"] <= 0.1) & (inside["y"] >= 0) & (inside["y"] <= 0.1)).all()
+    fig,note = lod.scatter(df,"x","y",x_range=(0,0.1),y_range=(0,0.1))
+    assert note == ""
+    assert n_points(fig) == len(inside.index)
+    assert lod.window(df,"x","y") is df
+#--------------------------------------------------------------------
+def test_scatter_3d(monkeypatch):
+    monkeypatch.setattr(lod,"MAX_POINTS",500)
+    monkeypatch.setattr(lod,"RASTER_POINTS",5000)
+    fig,note = lod.scatter_3d(points(6000),"x","y","z",color="bf")
+    voxels = [t for t in fig.data if t.name == "density"]
+    assert len(voxels) == 1
+    assert sum(int(h.split()[0]) for h in voxels[0].hovertext) == 6000
+    assert n_points(fig) == 500
+    assert note.startswith("Showing 500 of 6,000 points")
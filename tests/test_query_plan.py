@@ -0,0 +1,93 @@
+import os
+import pytest
+from shared import config as cfg
+from shared import metadata_index as mi
+from shared import pair_search as ps
+from shared import query_plan as qp
+
+# The planner reads geos as maptial does and estimates them from counts in the coordinate file;
+# on the fixture the estimates are checked against the rows actually calculated.
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"app","data","pdb1t29.ent")
+
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def stats():
+    return qp.structure_stats(FIXTURE)
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def composition(tmp_path_factory):
+    dbpath = str(tmp_path_factory.mktemp("index") / "index.db")
+    mi.index_file("1t29",FIXTURE,dbpath=dbpath)
+    return mi.compositions(["1t29"],dbpath=dbpath)["1t29"]
+#--------------------------------------------------------------------
+def test_parse_geo():
+    aggregate,terms = qp.parse_geo("C-1:N:CA:C")
+    assert aggregate is None
+    assert [t.names for t in terms] == [["C"],["N"],["CA"],["C"]]
+    assert [t.offset for t in terms] == [-1,0,0,0]
+    assert not any(t.search for t in terms)
+#--------------------------------------------------------------------
+def test_parse_geo_searches():
+    aggregate,(start,search) = qp.parse_geo("N:(O,N@i)[dis|2.5><3.2,rid|>0]")
+    assert aggregate is None
+    assert start.names == ["N"] and not start.search
+    assert search.names == ["O","N"] and search.element and search.search
+    assert search.nearest == "i" and search.farthest == 0
+    assert search.criteria == [("dis","2.5><3.2"),("rid",">0")]
+    _,(_,search) = qp.parse_geo("SG:{SG&1}")
+    assert not search.element and search.nearest == 0 and search.farthest == 1
+    # only the outer brackets select elements
+    _,(_,search) = qp.parse_geo("N:{(O),(N)@1}")
+    assert search.names == ["(O)","(N)"] and not search.element and search.nearest == 1
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo,aggregate",[("MINDIS|CA-1:CA:CA+1","mindis"),("maxdis|CA:{CA@i}","maxdis"),
+                                          ("COUNT|FE:(N,O@i)[dis|<2.8]","count"),("RDF|CA:{CA@i}","rdf")])
+def test_parse_geo_aggregates(geo, aggregate):
+    assert qp.parse_geo(geo)[0] == aggregate
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",["N:CA","N:CA:C","N[aa|GLY]:CA","SG:{SG&1}","N:(O@1)","COUNT|CA:{CA@i}[dis|<8]"])
+def test_explain_counts_rows(stats, geometry, pobj, geo):
+    expected = len((ps.calculate([pobj],geo) if ps.supports(geo) else geometry([geo])).index)
+    assert qp.explain(stats,geo)["rows"] == expected
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo",["CA:{CA@i}[dis|<8]","N:(O,N@i)[dis|2.5><3.2,rid|>0]","CA:{CA&3@i}[dis|<10]"])
+def test_explain_estimates_contacts(stats, pobj, geo):
+    # distance criteria are estimated from the density of a folded chain, to within a factor of two
+    rows = len(ps.calculate([pobj],geo).index)
+    est = qp.explain(stats,geo)["rows"]
+    assert rows/2 <= est <= rows*2
+#--------------------------------------------------------------------
+def test_explain_costs_symmetric_pairs_once(stats):
+    assert qp.explain(stats,"CA:{CA@i}[dis|<8]")["pairs"] * 2 == pytest.approx(qp.explain(stats,"COUNT|CA:{CA@i}[dis|<8]")["pairs"],abs=1)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("geo,found",[("N:CA",True),("SG:{SG&1}",True),("N[aa|GLY]:CA",True),("N[aa|20]:CA",True),
+                                      ("FE:{(N),(O)@i}[dis|<2.8]",False),("N:{ZN@i}",False),("N[aa|HEM]:CA",False),
+                                      ("COUNT|N:{ZN@i}",True),("N:(S)",True),("N:(Z)",False)])
+def test_can_match(composition, geo, found):
+    assert qp.can_match(composition,geo) == found
+#--------------------------------------------------------------------
+def test_can_match_without_composition():
+    assert qp.can_match(None,"FE:{(N),(O)@i}")
+#--------------------------------------------------------------------
+def test_plan_skips_what_cannot_match(stats, composition):
+    df,totals = qp.plan({"1t29":stats},["N:CA","FE:{(N),(O)@i}[dis|<2.8]"],{"1t29":composition})
+    assert df["skip"].all()
+    assert totals["rows"] == 0
+    df,totals = qp.plan({"1t29":stats},["N:CA","N:CA:C"],{"1t29":composition})
+    assert not df["skip"].any()
+    assert totals["rows"] == 223
+    assert list(df["geo"]) == ["N:CA","N:CA:C"]
+#--------------------------------------------------------------------
+def test_plan_needs_no_stats_to_skip(composition):
+    df,_ = qp.plan({},["FE:CA"],{"1t29":composition})
+    assert list(df["pdb_code"]) == ["1t29"] and df["skip"].all()
+    df,_ = qp.plan({},["N:CA"],{"1t29":composition})
+    assert len(df.index) == 0
+#--------------------------------------------------------------------
+def test_verdict():
+    assert qp.verdict({"seconds":1,"mb":1}) == "ok"
+    assert qp.verdict({"seconds":cfg.PLAN_CONFIRM_SECONDS + 1,"mb":1}) == "confirm"
+    assert qp.verdict({"seconds":1,"mb":cfg.PLAN_CONFIRM_MB + 1}) == "confirm"
+    assert qp.verdict({"seconds":cfg.PLAN_REFUSE_SECONDS + 1,"mb":1}) == "refuse"
+    assert qp.verdict({"seconds":1,"mb":cfg.PLAN_REFUSE_MB + 1}) == "refuse"
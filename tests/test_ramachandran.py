@@ -0,0 +1,96 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from shared import ramachandran as ra
+
+# Classification is a lookup into the approximate grids in static/rama_grids.npz, built from the
+# mixtures in the module; the 1t29 fixture is a well refined structure so almost all of it is favoured.
+
+GRID_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"app","static","rama_grids.npz")
+
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def grids():
+    return ra.load_grids(GRID_PATH)
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def rama(geometry):
+    return ra.classify(geometry([ra.PHI,ra.PSI]),grids=ra.load_grids(GRID_PATH))
+#--------------------------------------------------------------------
+def test_stored_grids_are_the_mixtures(grids):
+    built = ra.build_grids()
+    for rc in ra.RAMA_CLASSES:
+        np.testing.assert_allclose(grids[rc][0].astype(np.float32),built[rc][0].astype(np.float32),atol=1e-3)
+        np.testing.assert_allclose(grids[rc][1],built[rc][1],rtol=1e-3)
+#--------------------------------------------------------------------
+def test_missing_grids_are_built(tmp_path):
+    grids = ra.load_grids(str(tmp_path / "missing.npz"))
+    assert sorted(grids) == sorted(ra.RAMA_CLASSES)
+    assert grids["general"][0].shape == (ra.N_BINS,ra.N_BINS)
+#--------------------------------------------------------------------
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "grids.npz")
+    ra.save_grids(path)
+    grids = ra.load_grids(path)
+    built = ra.build_grids()
+    for rc in ra.RAMA_CLASSES:
+        assert (grids[rc][0] == built[rc][0]).all()
+#--------------------------------------------------------------------
+def test_lookup_is_periodic(grids):
+    grid = grids["general"][0]
+    phi = np.array([-179.5,-63.0,0.0,120.3,179.9])
+    psi = np.array([179.9,-42.0,-90.0,10.0,-179.5])
+    np.testing.assert_allclose(ra.lookup(grid,phi + 360,psi - 360),ra.lookup(grid,phi,psi),atol=1e-6)
+#--------------------------------------------------------------------
+def test_lookup_at_bin_centres(grids):
+    grid = grids["gly"][0]
+    centres = ra.bin_centres()
+    np.testing.assert_allclose(ra.lookup(grid,centres[[0,45,90]],centres[[10,100,179]]),
+                               grid[[0,45,90],[10,100,179]].astype(np.float32),atol=1e-6)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("rc,phi,psi,favoured",[("general",-63,-42,True),("general",-120,130,True),("general",60,-120,False),
+                                                ("pro",-63,-42,True),("pro",60,40,False),("gly",60,40,True)])
+def test_regions(grids, rc, phi, psi, favoured):
+    grid,levels = grids[rc]
+    assert (ra.lookup(grid,[phi],[psi])[0] >= levels[0]) == favoured
+#--------------------------------------------------------------------
+def test_residue_classes():
+    df = pd.DataFrame({"pdb_code":["a"]*5 + ["b"],"chain":["A"]*4 + ["B","A"],
+                       "rid":[1,2,3,4,5,3],"aa":["ALA","GLY","THR","PRO","ALA","ALA"]})
+    # before PRO is pre-PRO, but only in the same structure and chain
+    assert list(ra.residue_classes(df)) == ["general","gly","prepro","pro","general","general"]
+#--------------------------------------------------------------------
+def test_classify(rama):
+    assert set(rama["rama_region"]) <= set(ra.REGIONS)
+    assert (rama.loc[rama["aa"] == "GLY","rama_class"] == "gly").all()
+    assert (rama.loc[rama["aa"] == "PRO","rama_class"] == "pro").all()
+    pro = rama[rama["aa"] == "PRO"]
+    assert set(zip(pro["chain"],pro["rid"] - 1)) >= set(zip(*[rama.loc[rama["rama_class"] == "prepro",c] for c in ["chain","rid"]]))
+    assert rama["rama_score"].notna().all()
+#--------------------------------------------------------------------
+def test_summary(rama):
+    df = ra.summary(rama)
+    row = df.iloc[0]
+    assert row["pdb_code"] == "1t29"
+    assert row["residues"] == len(rama.index)
+    assert row["favoured"] + row["allowed"] + row["unusual"] == row["residues"]
+    assert row["%favoured"] + row["%allowed"] + row["%unusual"] == pytest.approx(100,abs=0.05)
+    assert row["%favoured"] > 90
+#--------------------------------------------------------------------
+def test_chain_termini_are_not_classified(geometry, grids):
+    df = geometry([ra.PHI,ra.PSI])
+    first,last = df.iloc[[0]].copy(),df.iloc[[-1]].copy()
+    # the first residue of a chain has no phi and the last no psi
+    first["rid"] -= 1
+    first[ra.PHI] = np.nan
+    last["rid"] += 1
+    last[ra.PSI] = None
+    rama = ra.classify(pd.concat([first,df,last],ignore_index=True),grids=grids)
+    ends = rama.iloc[[0,-1]]
+    assert (ends["rama_region"] == "").all()
+    assert ends["rama_score"].isna().all()
+    assert rama["rama_score"].iloc[1:-1].notna().all()
+    row = ra.summary(rama).iloc[0]
+    assert row["residues"] == len(df.index)
+    assert row["unusual"] == ra.summary(ra.classify(df,grids=grids)).iloc[0]["unusual"]
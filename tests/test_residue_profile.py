@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from shared import compute_cache as cc
+from shared import residue_profile as rp
+
+# The profiles replace a loop over every atom pair of the atoms frame, so they are compared with
+# the distances measured directly.
+
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def df_atoms():
+    rng = np.random.default_rng(0)
+    frames = []
+    for code,rids in [("a",range(1,41)),("b",range(5,31))]:
+        for chain in ["A","B"]:
+            for atom in ["N","CA","C"]:
+                frames.append(pd.DataFrame({"pdb_code":code,"chain":chain,"rid":list(rids),"atom":atom,
+                                            "x":rng.normal(size=len(rids))*10,"y":rng.normal(size=len(rids))*10,
+                                            "z":rng.normal(size=len(rids))*10}))
+    # shuffled, as the blocks are sorted by rid
+    return pd.concat(frames,ignore_index=True).sample(frac=1,random_state=1).reset_index(drop=True)
+#--------------------------------------------------------------------
+def brute_force(df_atoms, ref_rid, start_rid, end_rid):
+    rows = []
+    ca = df_atoms[(df_atoms["atom"] == "CA") & (df_atoms["chain"] == "A")]
+    for code,df in ca.groupby("pdb_code"):
+        ref = df[df["rid"] == ref_rid]
+        if len(ref.index) == 0:
+            continue
+        for _,row in df.sort_values("rid").iterrows():
+            if start_rid <= row["rid"] <= end_rid:
+                dis = np.sqrt(sum((row[c] - ref.iloc[0][c])**2 for c in "xyz"))
+                rows.append((code,row["rid"],dis))
+    return rows
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("ref_rid,start_rid,end_rid",[(10,1,40),(3,1,20),(25,20,30),(50,1,40)])
+def test_profile(df_atoms, ref_rid, start_rid, end_rid):
+    df = rp.profile(rp.ca_blocks(df_atoms),ref_rid,start_rid,end_rid)
+    expected = brute_force(df_atoms,ref_rid,start_rid,end_rid)
+    got = sorted(zip(df["pdb_code"],df["rid"],df["magnitude"]))
+    assert [g[:2] for g in got] == [e[:2] for e in sorted(expected)]
+    np.testing.assert_allclose([g[2] for g in got],[e[2] for e in sorted(expected)])
+    assert list(df.columns) == ["pdb_code","ref_rid","rid","magnitude"]
+#--------------------------------------------------------------------
+def test_several_references(df_atoms):
+    blocks = rp.ca_blocks(df_atoms)
+    df = rp.profile(blocks,[10,20])
+    for ref in [10,20]:
+        one = rp.profile(blocks,ref)
+        np.testing.assert_allclose(df[df["ref_rid"] == ref]["magnitude"].to_numpy(),one["magnitude"].to_numpy())
+#--------------------------------------------------------------------
+def test_blocks_are_cached_by_content(df_atoms):
+    blocks = rp.cached_blocks(df_atoms)
+    hits = cc.RESULTS.hits
+    # the same atoms in another frame, as on a rerun or in another session, are the same blocks
+    again = rp.cached_blocks(df_atoms.copy())
+    assert cc.RESULTS.hits == hits + 1
+    assert again.keys() == blocks.keys()
+    moved = df_atoms.copy()
+    moved["x"] += 1.0
+    other = rp.cached_blocks(moved)
+    assert cc.RESULTS.hits == hits + 1
+    np.testing.assert_allclose(other["a"][1][:,0],blocks["a"][1][:,0] + 1)
+    # shared between sessions, so not writeable
+    assert not blocks["a"][1].flags.writeable
@@ -0,0 +1,91 @@
+import gc
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from shared import result_view as rv
+
+# Filters built from a column, an operator and a value read as the column's type, sorting, and the cached orders.
+
+INJECTIONS = ["__import__('os').system('touch pwned')",
+              "@pd.io.common.os.system('touch pwned')",
+              "rid > 0 or __import__('os').remove('x')",
+              "1; import os",
+              "`rid`.__class__.__mro__"]
+
+#--------------------------------------------------------------------
+@pytest.fixture
+def df():
+    return pd.DataFrame({"pdb_code":["1t29"]*6,
+                         "rid":[5,3,8,1,9,2],
+                         "aa":["ALA","GLY","ALA","SER",None,"ALA"],
+                         "N:CA":[1.46,1.45,np.nan,1.47,1.44,1.46],
+                         "disordered":[False,True,False,False,True,False]})
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("where,rids",[(("rid",">","4"),[5,8,9]),(("rid","==","3"),[3]),(("rid","<=","2.5"),[1,2]),
+                                       (("aa","==","ALA"),[5,8,2]),(("aa","!=","ALA"),[3,1,9]),(("aa","contains","L"),[5,3,8,2]),
+                                       (("N:CA",">=","1.46"),[5,1,2]),(("disordered","==","true"),[3,9]),(("disordered","==","0"),[5,8,1,2])])
+def test_filter(df, where, rids):
+    assert list(df["rid"].iloc[rv.row_order(df,where)]) == rids
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("where",[("rid",">","ten"),("N:CA","<","1.4a"),("disordered","==","maybe"),("rid","contains","1"),
+                                  ("rid","=>","4"),("rid","in","[1,2]"),("missing","==","1"),("rid","==","")])
+def test_bad_filters_are_value_errors(df, where):
+    with pytest.raises(ValueError):
+        rv.row_order(df,where)
+#--------------------------------------------------------------------
+@pytest.mark.parametrize("text",INJECTIONS)
+def test_injections_are_not_evaluated(df, text, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for column in ["rid","N:CA","disordered"]:
+        with pytest.raises(ValueError):
+            rv.row_order(df,(column,"==",text))
+    # a text column compares the string itself
+    assert len(rv.row_order(df,("aa","==",text))) == 0
+    assert len(rv.row_order(df,("aa","contains",text))) == 0
+    with pytest.raises(ValueError):
+        rv.row_order(df,("aa",text,"ALA"))
+    with pytest.raises(ValueError):
+        rv.row_order(df,(text,"==","ALA"))
+    assert not os.path.exists(tmp_path / "pwned")
+#--------------------------------------------------------------------
+def test_sort_keeps_filter_and_puts_missing_last(df):
+    assert list(df["rid"].iloc[rv.row_order(df,None,"N:CA")]) == [9,3,5,2,1,8]
+    assert list(df["rid"].iloc[rv.row_order(df,("aa","==","ALA"),"rid",descending=True)]) == [8,5,2]
+#--------------------------------------------------------------------
+def test_summary(df):
+    summary = rv.summarise(df).set_index("column")
+    assert summary.loc["rid","min"] == 1 and summary.loc["rid","max"] == 9
+    assert summary.loc["N:CA","non_null"] == 5
+    assert summary.loc["aa","distinct"] == 3
+#--------------------------------------------------------------------
+def test_orders_are_kept_and_go_with_the_dataframe():
+    df = pd.DataFrame({"rid":[5,3,8,1,9,2]})
+    first = rv.cached_order(df,("rid",">","4"),None,False)
+    assert rv.cached_order(df,("rid",">","4"),None,False) is first
+    for n in range(rv.MAX_ORDERS + 2):
+        rv.cached_order(df,("rid",">",str(n)),None,False)
+    assert len(rv.view_of(df)["orders"]) == rv.MAX_ORDERS
+    key = id(df)
+    del df
+    gc.collect()
+    assert key not in rv._views
+#--------------------------------------------------------------------
+def test_show_filters_from_the_widgets():
+    from streamlit.testing.v1 import AppTest
+
+    def page():
+        import pandas as pd
+        from shared import result_view as rv
+        rv.show(pd.DataFrame({"rid":range(1,201),"aa":["ALA","GLY"]*100}),"test")
+
+    at = AppTest.from_function(page).run(timeout=30)
+    assert len(at.dataframe[0].value.index) == 50
+    at.selectbox(key="test_filter_column").set_value("rid")
+    at.selectbox(key="test_filter_op").set_value(">")
+    at.text_input(key="test_filter_value").set_value("190").run(timeout=30)
+    assert list(at.dataframe[0].value["rid"]) == list(range(191,201))
+    at.text_input(key="test_filter_value").set_value("__import__('os').getcwd()").run(timeout=30)
+    assert not at.exception
+    assert "is not a number" in at.error[0].value
+    assert len(at.dataframe[0].value.index) == 50
@@ -0,0 +1,59 @@
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import time
+import types
+import pytest
+from shared import sandbox as sb
+
+# Geometry in a child process: the same rows as in-process, and stopped by the check, the memory cap or an error.
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"app","data","pdb1t29.ent")
+
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def datadir(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("sandbox")
+    shutil.copy(FIXTURE,folder / "1t29.pdb")
+    return f"{folder}/"
+#--------------------------------------------------------------------
+def calculate(datadir, geo, **kwargs):
+    return sb.calculate("1t29",datadir,False,"ebi",geo,**kwargs)
+#--------------------------------------------------------------------
+def test_same_rows_as_in_process(datadir, geometry):
+    df = calculate(datadir,"N:CA",max_mb=2000)
+    expected = geometry(["N:CA"])
+    assert len(df.index) == len(expected.index) > 0
+    assert list(df["N:CA"].round(4)) == list(expected["N:CA"].round(4))
+#--------------------------------------------------------------------
+def test_check_stops_and_kills_the_child(datadir):
+    end = time.time() + 0.3
+
+    def check():
+        if time.time() > end:
+            raise sb.Stopped("Cancelled")
+
+    with pytest.raises(sb.Stopped,match="Cancelled"):
+        calculate(datadir,"CA:{CA@i}",check=check)
+    assert len(mp.active_children()) == 0
+#--------------------------------------------------------------------
+def test_memory_cap_stops_the_child(datadir):
+    with pytest.raises(sb.Stopped) as info:
+        calculate(datadir,"CA:{CA@i}",max_mb=1)
+    assert "needed more than 1 MB" in info.value.reason or "ended unexpectedly" in info.value.reason
+    assert len(mp.active_children()) == 0
+#--------------------------------------------------------------------
+def test_page_script_is_not_run_in_the_child(datadir, tmp_path, monkeypatch):
+    # under streamlit __main__ is the page, which the child must not run
+    page = tmp_path / "page.py"
+    page.write_text("raise SystemExit('the page ran in the child')\n")
+    main = types.ModuleType("__main__")
+    main.__file__ = str(page)
+    monkeypatch.setitem(sys.modules,"__main__",main)
+    assert len(calculate(datadir,"N:CA").index) > 0
+    assert sys.modules["__main__"] is main
+#--------------------------------------------------------------------
+def test_errors_reach_the_parent(datadir):
+    with pytest.raises(RuntimeError,match="could not convert string to float"):
+        calculate(datadir,"N:CA[dis|<x]")
@@ -0,0 +1,89 @@
+import gc
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from shared import session_data as sd
+
+# A session's frames are spilled to disk beyond its budget or when idle, and come back unchanged.
+
+MB = 1e6
+
+#--------------------------------------------------------------------
+def frame(mb, seed=0):
+    n = int(mb*MB/16)
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"value":rng.random(n),"rid":np.arange(n)})
+#--------------------------------------------------------------------
+@pytest.fixture
+def data(tmp_path):
+    return sd.SessionData("s1",5*MB,str(tmp_path / "s1"),idle_seconds=60)
+#--------------------------------------------------------------------
+def on_disk(data):
+    stats = data.stats()
+    return sorted(stats.loc[stats["on_disk"],"frame"])
+#--------------------------------------------------------------------
+def test_put_and_get(data):
+    df = frame(1)
+    data.put("df_geos",df)
+    assert data.has("df_geos")
+    assert data.get("df_geos") is df
+    assert data.get("missing","default") == "default"
+#--------------------------------------------------------------------
+def test_least_recently_used_spill_over_budget(data):
+    data.put("a",frame(2,1))
+    data.put("b",frame(2,2))
+    data.get("a")
+    data.put("c",frame(2,3))
+    # b was used least recently
+    assert on_disk(data) == ["b"]
+    assert data.in_memory_bytes() <= data.budget_bytes
+    assert os.path.exists(os.path.join(data.spill_dir,"b.parquet"))
+    pd.testing.assert_frame_equal(data.get("b"),frame(2,2))
+    assert "b" not in on_disk(data)
+    assert not os.path.exists(os.path.join(data.spill_dir,"b.parquet"))
+#--------------------------------------------------------------------
+def test_the_frame_in_use_stays(data):
+    data.put("big",frame(8))
+    assert on_disk(data) == []
+    data.put("small",frame(0.5))
+    assert on_disk(data) == ["big"]
+#--------------------------------------------------------------------
+def test_small_and_other_values_stay_in_memory(data):
+    data.put("small",frame(0.1))
+    data.put("ls",["1t29"])
+    assert not data.spill("small") and not data.spill("ls")
+#--------------------------------------------------------------------
+def test_frames_parquet_cannot_hold_are_pickled(data):
+    df = frame(2)
+    df["mixed"] = [1 if i % 2 else "a" for i in range(len(df.index))]
+    data.put("mixed",df)
+    assert data.spill("mixed")
+    assert data.frames["mixed"].kind == "pickle"
+    assert not os.path.exists(os.path.join(data.spill_dir,"mixed.parquet"))
+    pd.testing.assert_frame_equal(data.get("mixed"),df)
+#--------------------------------------------------------------------
+def test_idle_frames_spill(data):
+    data.put("a",frame(2))
+    data.put("b",frame(2,1))
+    data.used["a"] = time.monotonic() - 120
+    data.spill_idle(time.monotonic())
+    assert on_disk(data) == ["a"]
+#--------------------------------------------------------------------
+def test_replacing_a_spilled_frame_removes_its_file(data):
+    data.put("a",frame(2))
+    data.spill("a")
+    path = data.frames["a"].path
+    data.put("a",frame(1,5))
+    assert not os.path.exists(path)
+    pd.testing.assert_frame_equal(data.get("a"),frame(1,5))
+#--------------------------------------------------------------------
+def test_folder_goes_with_the_session(tmp_path):
+    data = sd.SessionData("s2",1*MB,str(tmp_path / "s2"),idle_seconds=60)
+    data.put("a",frame(2))
+    data.put("b",frame(2,1))
+    assert os.path.isdir(tmp_path / "s2")
+    del data
+    gc.collect()
+    assert not os.path.exists(tmp_path / "s2")
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from shared import atom_arrays as ar
+from shared import superpose as sp
+
+# Superposition is checked on copies of the fixture moved rigidly, which have to come back onto it
+# exactly, and on random point sets with a known rotation.
+
+#--------------------------------------------------------------------
+def rotation(seed):
+    q,r = np.linalg.qr(np.random.default_rng(seed).normal(size=(3,3)))
+    q = q * np.sign(np.diag(r))
+    if np.linalg.det(q) < 0:
+        q[:,0] = -q[:,0]
+    return q
+#--------------------------------------------------------------------
+def moved_copy(arrs, seed, rid_offset=0, pdb_code="copy"):
+    copy = arrs.select(np.arange(len(arrs)))
+    copy.pdb_code = pdb_code
+    copy.coords = (arrs.coords.astype(np.float64) @ rotation(seed).T + [10.0,-5.0,3.0]).astype(np.float32)
+    copy.rid = arrs.rid + rid_offset
+    return copy
+#--------------------------------------------------------------------
+@pytest.fixture(scope="module")
+def arrs(pobj):
+    return ar.from_pobj(pobj)
+#--------------------------------------------------------------------
+def test_kabsch_recovers_a_rotation():
+    rng = np.random.default_rng(1)
+    Q = rng.normal(size=(2,20,3)) * 10
+    P = np.stack([Q[0] @ rotation(2).T + [1,2,3],Q[1] @ rotation(3).T - [4,0,1]])
+    W = np.ones((2,20))
+    moved,rmsd = sp.kabsch_batch(P,Q,W)
+    np.testing.assert_allclose(moved,Q,atol=1e-8)
+    np.testing.assert_allclose(rmsd,0,atol=1e-8)
+#--------------------------------------------------------------------
+def test_kabsch_does_not_reflect():
+    rng = np.random.default_rng(4)
+    Q = rng.normal(size=(1,20,3)) * 10
+    P = Q * [-1,1,1]
+    _,rmsd = sp.kabsch_batch(P,Q,np.ones((1,20)))
+    assert rmsd[0] > 1
+#--------------------------------------------------------------------
+def test_kabsch_ignores_padding():
+    rng = np.random.default_rng(5)
+    Q = rng.normal(size=(1,12,3)) * 10
+    P = Q @ rotation(6).T
+    P[0,8:] = rng.normal(size=(4,3)) * 100
+    W = np.zeros((1,12))
+    W[0,:8] = 1
+    moved,rmsd = sp.kabsch_batch(P,Q,W)
+    np.testing.assert_allclose(rmsd,0,atol=1e-8)
+    np.testing.assert_allclose(moved[0,:8],Q[0,:8],atol=1e-8)
+#--------------------------------------------------------------------
+def test_compare_moved_copy(arrs):
+    df,summary = sp.compare(arrs,[moved_copy(arrs,7)])
+    n_ca = ((arrs.atom == "CA") & arrs.is_standard()).sum()
+    assert summary["matched"].sum() == n_ca
+    assert (summary["rmsd"] < 1e-3).all()
+    # chains are superposed one at a time, and the one matching most of the reference is kept
+    assert summary["best"].sum() == 1
+    best = summary[summary["best"]].iloc[0]
+    assert best["matched"] == summary["matched"].max()
+    assert len(df.index) == best["matched"]
+    assert (df["deviation"] < 1e-3).all()
+    assert (df["rid"] == df["rid_pdb"]).all() and (df["aa"] == df["aa_pdb"]).all()
+#--------------------------------------------------------------------
+def test_compare_by_alignment(arrs):
+    renumbered = moved_copy(arrs,8,rid_offset=1000)
+    df,summary = sp.compare(arrs,[renumbered])
+    assert len(df.index) == 0 and len(summary.index) == 0
+    df,summary = sp.compare(arrs,[renumbered],mapping="align")
+    assert (summary["rmsd"] < 1e-3).all()
+    assert (df["rid_pdb"] == df["rid"] + 1000).all()
+#--------------------------------------------------------------------
+def test_compare_several(arrs):
+    part = moved_copy(arrs,9,pdb_code="part").select(np.arange(len(arrs)) < len(arrs)//2)
+    df,summary = sp.compare(arrs,[moved_copy(arrs,10),part])
+    assert sorted(summary.loc[summary["best"],"pdb_code"]) == ["copy","part"]
+    assert (summary["rmsd"] < 1e-3).all()
+    assert set(df["pdb_code"]) == {"copy","part"}